@@ -0,0 +1,221 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2013, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+# * Neither the name of Willow Garage, Inc. nor the names of its
+# contributors may be used to endorse or promote products derived
+# from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+
+'''
+The ChangeFeed class listens for the notifications sent by the World Model database triggers on 
+each change to the world object instances, world object descriptions, and descriptors tables. The
+changes are handed to listeners in a background thread so clients do not need to poll the tables.
+
+@author:  Russell Toris
+@version: May 1, 2013
+'''
+
+import psycopg2
+import psycopg2.extensions
+import json
+import select
+import threading
+import thread
+import time
+import traceback
+
+# the channel the database triggers notify on
+CHANNEL = 'world_model_changes'
+
+class ChangeFeed(object):
+    '''
+    The main ChangeFeed object which listens for changes to the World Model database. Each change
+    is a dictionary with the table, operation (insert, update, expire, or delete), id, and tags of 
+    the changed entity.
+    '''
+
+    def __init__(self, user, pwd, host='localhost', database='world_model', channel=CHANNEL,
+                 poll_interval=1.0, retry_interval=5.0):
+        '''
+        Creates the ChangeFeed object. The feed will not listen until it is started.
+        
+        @param user: the database username
+        @type  user: string
+        @param pwd: the database password
+        @type  pwd: string
+        @param host: the database hostname
+        @type  host: string
+        @param database: the name of the database
+        @type  database: string
+        @param channel: the channel to listen on
+        @type  channel: string
+        @param poll_interval: the maximum time in seconds to wait for a notification at once
+        @type  poll_interval: float
+        @param retry_interval: the time in seconds to wait before reconnecting after an error
+        @type  retry_interval: float
+        '''
+        self._user = user
+        self._pwd = pwd
+        self._host = host
+        self._db = database
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        # functions to call with each list of changes
+        self._listeners = []
+        self._thread = None
+        self._running = False
+        # create a lock for the listeners
+        self.lock = thread.allocate_lock()
+
+    def add_listener(self, callback):
+        '''
+        Add a function to call with each list of changes. Changes received together (e.g., from a
+        single transaction) are passed in one list, in the order they were made.
+        
+        @param callback: the function to call with the list of change dictionaries
+        @type  callback: function
+        '''
+        with self.lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        '''
+        Remove a function previously given to add_listener.
+        
+        @param callback: the function to remove
+        @type  callback: function
+        '''
+        with self.lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def start(self):
+        '''
+        Start listening for changes in a background thread.
+        '''
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        '''
+        Stop listening for changes. This will block until the background thread has finished.
+        '''
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        '''
+        The main loop of the background thread. The connection is re-opened after any error. 
+        Changes made while the connection is down are not delivered.
+        '''
+        conn = None
+        while self._running:
+            try:
+                if conn is None:
+                    conn = self._listen()
+                # wait for the connection to become readable
+                if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                    continue
+                conn.poll()
+                changes = []
+                while conn.notifies:
+                    change = self._parse(conn.notifies.pop(0).payload)
+                    if change is not None:
+                        changes.append(change)
+                if len(changes) > 0:
+                    self._notify(changes)
+            except (psycopg2.Error, select.error):
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except psycopg2.Error:
+                        pass
+                    conn = None
+                time.sleep(self.retry_interval)
+        if conn is not None:
+            conn.close()
+
+    def _listen(self):
+        '''
+        Open a new connection and listen on the channel.
+        
+        @return: the listening connection
+        @rtype:  connection
+        '''
+        conn = psycopg2.connect(database=self._db, user=self._user, password=self._pwd,
+                                host=self._host)
+        # notifications are only received outside of transactions
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        cur = conn.cursor()
+        cur.execute("""LISTEN """ + self.channel)
+        cur.close()
+        return conn
+
+    def _parse(self, payload):
+        '''
+        Parse the given notification payload into a change dictionary.
+        
+        @param payload: the JSON payload of the notification
+        @type  payload: string
+        @return: the change dictionary, or None if the payload is not valid
+        @rtype:  dict
+        '''
+        try:
+            change = json.loads(payload)
+        except ValueError:
+            return None
+        if not isinstance(change, dict) or 'table' not in change or 'id' not in change:
+            return None
+        # tags are left out of very large notifications
+        if change.get('tags') is None:
+            change['tags'] = []
+        return change
+
+    def _notify(self, changes):
+        '''
+        Call each listener with the given list of changes. Errors in the listeners are printed and
+        do not stop the feed.
+        
+        @param changes: the list of change dictionaries
+        @type  changes: list
+        '''
+        with self.lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(changes)
+            except Exception:
+                traceback.print_exc()
@@ -0,0 +1,386 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2013, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+# * Neither the name of Willow Garage, Inc. nor the names of its
+# contributors may be used to endorse or promote products derived
+# from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+'''
+The ConnectionPool class provides a shared, bounded pool of connections to a PostgreSQL World Model
+database. Connections are checked out for the duration of a single call, so multiple threads (e.g.,
+action server callbacks) can run queries concurrently. Read-only queries can be routed to streaming
+replicas of the database. Each client reads its own writes: its reads only go to replicas which 
+have replayed the WAL up to its last write. The last writes are only known to the pool (and so the 
+process) the client wrote through, so clients of several processes must keep their reads with the
+process they wrote through (as the world_model_dispatcher does for a while after each write).
+
+@author:  Russell Toris
+@version: April 15, 2013
+'''
+
+import psycopg2
+import psycopg2.extensions
+from worldlib.statements import StatementConnection
+from worldlib.stats import Stats
+import threading
+import thread
+import time
+from contextlib import contextmanager
+
+class ConnectionPool(object):
+    '''
+    The main ConnectionPool object which hands out connections to the PostgreSQL World Model
+    database.
+    '''
+
+    def __init__(self, user, pwd, host='localhost', size=4, database='world_model',
+                 ping_interval=30.0, connection_factory=StatementConnection, stats=None, 
+                 replicas=[], max_replica_lag=1.0):
+        '''
+        Creates the ConnectionPool object. Connections are opened lazily as they are needed.
+        
+        @param user: the database username
+        @type  user: string
+        @param pwd: the database password
+        @type  pwd: string
+        @param host: the database hostname
+        @type  host: string
+        @param size: the maximum number of connections that can be checked out at once
+        @type  size: int
+        @param database: the name of the database
+        @type  database: string
+        @param ping_interval: idle time in seconds after which a connection is checked before use
+        @type  ping_interval: float
+        @param connection_factory: the class of the connections to open
+        @type  connection_factory: class
+        @param stats: the instrumentation shared by the connections, or None to create one
+        @type  stats: Stats
+        @param replicas: the hostnames of the streaming replicas to send read-only queries to
+        @type  replicas: list
+        @param max_replica_lag: the maximum time in seconds a replica can be behind and still be 
+                                read from
+        @type  max_replica_lag: float
+        '''
+        self._user = user
+        self._pwd = pwd
+        self._host = host
+        self._db = database
+        self.size = size
+        self.ping_interval = ping_interval
+        self._factory = connection_factory
+        # timings of the connections (e.g., waiting for a connection or running SQL)
+        self.stats = stats if stats is not None else Stats()
+        # idle connections as (connection, last used) tuples
+        self._idle = []
+        # bounds the number of connections in use at once
+        self._available = threading.BoundedSemaphore(size)
+        # create a lock for the idle list
+        self.lock = thread.allocate_lock()
+        # each replica has its own pool (of the same size)
+        self.replicas = [ConnectionPool(user, pwd, h, size, database, ping_interval, 
+                                        connection_factory, self.stats) for h in replicas]
+        self.max_replica_lag = max_replica_lag
+        # the time in seconds the replayed position of a replica is known for
+        self.replica_check_interval = 0.5
+        # the state of each replica as [replayed LSN, usable, time checked]
+        self._replica_state = [[0, False, 0.0] for h in replicas]
+        self._next_replica = 0
+        # the LSN of the last write of each client as client : (LSN, time)
+        self._client_lsns = {}
+        self._client_lsns_pruned = time.time()
+        # the client (and if it must use the primary) of the queries of each thread
+        self._session = threading.local()
+
+    @contextmanager
+    def session(self, client=None, primary=False):
+        '''
+        Run the queries of a with block (in this thread) for the given client. The read-only 
+        queries of the client are only sent to replicas which have replayed its writes.
+        
+        @param client: the name of the client (e.g., the node which sent a goal), or None
+        @type  client: string
+        @param primary: if all of the queries should be sent to the primary
+        @type  primary: bool
+        '''
+        previous = (getattr(self._session, 'client', None), 
+                    getattr(self._session, 'primary', False))
+        self._session.client = client
+        self._session.primary = primary
+        try:
+            yield
+        finally:
+            self._session.client, self._session.primary = previous
+
+    @contextmanager
+    def connection(self, read_only=False):
+        '''
+        Check out a connection for the duration of a with block. Any open transaction is rolled back
+        when the connection is returned, so callers must commit their own changes. If the 
+        connection breaks during use (e.g., the database restarted), it is discarded along with all
+        idle connections and the error is re-raised. Read-only connections are to a replica when
+        one is usable. The position of writes made in a session is recorded once they are done.
+        
+        @param read_only: if the connection is only used to read
+        @type  read_only: bool
+        @return: the connection to use
+        @rtype:  connection
+        '''
+        client = getattr(self._session, 'client', None)
+        record = len(self.replicas) > 0 and not read_only and client is not None
+        if len(self.replicas) > 0 and read_only and not getattr(self._session, 'primary', False):
+            replica = self._choose_replica(client)
+            if replica is not None:
+                self.stats.count('pool.replica_reads')
+                with replica.connection() as conn:
+                    yield conn
+                return
+        start = time.time()
+        self._available.acquire()
+        self.stats.observe('pool.wait', time.time() - start)
+        try:
+            conn = self._checkout()
+            commits = getattr(conn, 'commits', None)
+            try:
+                yield conn
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                # the connection (and most likely the rest of the pool) is no longer valid
+                self._discard(conn)
+                self.reset()
+                raise
+            except:
+                self._release(conn)
+                raise
+            else:
+                # only committed writes can be replayed (without a count, assume a commit)
+                if record and (commits is None or conn.commits > commits):
+                    self._record_write(conn, client)
+                self._release(conn)
+        finally:
+            self._available.release()
+
+    def reset(self):
+        '''
+        Close all idle connections. New connections will be opened as they are needed.
+        '''
+        with self.lock:
+            idle = self._idle
+            self._idle = []
+        for conn, last in idle:
+            self._discard(conn)
+
+    def _choose_replica(self, client):
+        '''
+        Choose the replica to read from for the given client. Replicas are used in turn, skipping
+        those which are too far behind or have not replayed the last write of the client.
+        
+        @param client: the name of the client, or None
+        @type  client: string
+        @return: the pool of the replica to use, or None to use the primary
+        @rtype:  ConnectionPool
+        '''
+        with self.lock:
+            required = self._client_lsns.get(client, (0, 0.0))[0]
+            first = self._next_replica
+            self._next_replica = (first + 1) % len(self.replicas)
+        for i in range(len(self.replicas)):
+            index = (first + i) % len(self.replicas)
+            state = self._replica_state[index]
+            age = time.time() - state[2]
+            # a replica behind the client may have caught up since it was checked
+            if (age > self.replica_check_interval or 
+                (state[1] and state[0] < required and age > 0.01)):
+                self._check_replica(index)
+            if state[1] and state[0] >= required:
+                return self.replicas[index]
+        self.stats.count('pool.replica_misses')
+        return None
+
+    def _check_replica(self, index):
+        '''
+        Check how far the given replica has replayed the WAL and if it is close enough to the 
+        primary to be read from. A replica which has replayed the WAL up to the current position of
+        the primary is never considered behind, even if nothing was written to the primary for a 
+        while. Otherwise, it is behind by the time since it replayed its last transaction (so a 
+        replica which lost its connection to the primary falls further behind).
+        
+        @param index: the index of the replica
+        @type  index: int
+        '''
+        state = self._replica_state[index]
+        try:
+            with self.replicas[index].connection() as conn:
+                cur = conn.cursor()
+                cur.execute("""SELECT pg_last_wal_replay_lsn()::text, 
+                            extract(epoch FROM now() - pg_last_xact_replay_timestamp())""")
+                lsn, lag = cur.fetchone()
+                cur.close()
+            # the primary is read after the replica, so it can only be further ahead
+            primary = self._primary_lsn() if lsn is not None else None
+        except psycopg2.Error:
+            lsn, lag, primary = (None, None, None)
+        # servers which are not replicas have not replayed anything
+        state[0] = _lsn_to_int(lsn) if lsn is not None else 0
+        if primary is not None and state[0] >= primary:
+            lag = 0
+        state[1] = (lsn is not None and primary is not None and lag is not None and 
+                    lag <= self.max_replica_lag)
+        state[2] = time.time()
+
+    def _primary_lsn(self):
+        '''
+        Get the current WAL position of the primary.
+        
+        @return: the LSN, or None if the primary could not be reached
+        @rtype:  int
+        '''
+        try:
+            with self.connection() as conn:
+                cur = conn.cursor()
+                cur.execute("""SELECT pg_current_wal_lsn()::text""")
+                lsn = _lsn_to_int(cur.fetchone()[0])
+                cur.close()
+        except psycopg2.Error:
+            return None
+        return lsn
+
+    def _record_write(self, conn, client):
+        '''
+        Record the current WAL position of the primary as the last write of the given client, once
+        the write was committed. Clients which have not written for a while are forgotten. The
+        positions are only known to this pool (see the module documentation).
+        
+        @param conn: the connection to the primary the client wrote with
+        @type  conn: connection
+        @param client: the name of the client
+        @type  client: string
+        '''
+        try:
+            cur = conn.cursor()
+            cur.execute("""SELECT pg_current_wal_lsn()::text""")
+            lsn = _lsn_to_int(cur.fetchone()[0])
+            cur.close()
+        except psycopg2.Error:
+            return
+        now = time.time()
+        with self.lock:
+            # a later write of the same client may have been recorded first
+            if lsn > self._client_lsns.get(client, (0, 0.0))[0]:
+                self._client_lsns[client] = (lsn, now)
+            if now - self._client_lsns_pruned > 60.0:
+                self._client_lsns_pruned = now
+                for c, (l, last) in self._client_lsns.items():
+                    if now - last > 60.0:
+                        del self._client_lsns[c]
+
+    def _checkout(self):
+        '''
+        Get a healthy idle connection or open a new one. Connections that have been idle longer
+        than the ping interval are checked with a trivial query first.
+        
+        @return: the connection to use
+        @rtype:  connection
+        '''
+        while True:
+            with self.lock:
+                if len(self._idle) is 0:
+                    break
+                conn, last = self._idle.pop()
+            if conn.closed:
+                continue
+            if time.time() - last < self.ping_interval or self._ping(conn):
+                return conn
+            self._discard(conn)
+        # nothing was available, open a new connection
+        self.stats.count('pool.connects')
+        conn = psycopg2.connect(database=self._db, user=self._user, password=self._pwd,
+                                host=self._host, connection_factory=self._factory)
+        if isinstance(conn, StatementConnection):
+            conn.stats = self.stats
+        return conn
+
+    def _release(self, conn):
+        '''
+        Return the given connection to the idle list, rolling back any open transaction.
+        
+        @param conn: the connection to return
+        @type  conn: connection
+        '''
+        if conn.closed:
+            return
+        try:
+            status = conn.get_transaction_status()
+            if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            self._discard(conn)
+            return
+        with self.lock:
+            self._idle.append((conn, time.time()))
+
+    def _ping(self, conn):
+        '''
+        Check if the given connection is still usable.
+        
+        @param conn: the connection to check
+        @type  conn: connection
+        @return: if the connection is usable
+        @rtype:  bool
+        '''
+        try:
+            cur = conn.cursor()
+            cur.execute("""SELECT 1""")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        '''
+        Close the given connection, ignoring any errors.
+        
+        @param conn: the connection to close
+        @type  conn: connection
+        '''
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+def _lsn_to_int(lsn):
+    '''
+    Convert a WAL position (e.g., '16/B374D848') into an int which can be compared.
+    
+    @param lsn: the WAL position
+    @type  lsn: string
+    @return: the WAL position as an int
+    @rtype:  int
+    '''
+    hi, lo = lsn.split('/')
+    return (int(hi, 16) << 32) + int(lo, 16)
@@ -39,18 +39,21 @@ description.
 @version: February 18, 2013
 '''
 
-import psycopg2
-import thread
+from worldlib.connection_pool import ConnectionPool
+from worldlib.descriptor_hash import descriptor_hash
+from worldlib.statements import execute
+from worldlib.storage_interface import DescriptorStorage
 
-class DescriptorConnection(object):
+class DescriptorConnection(DescriptorStorage):
     '''
     The main DescriptorConnection object which communicates with the PostgreSQL World Model 
     database.
     '''
 
-    def __init__(self, user, pwd, host='localhost'):
+    def __init__(self, user=None, pwd=None, host='localhost', pool=None):
         '''
-        Creates the DescriptorConnection object and connects to the descriptors table.
+        Creates the DescriptorConnection object and connects to the descriptors table. If a shared
+        pool is given, the user, pwd, and host are ignored.
         
         @param user: the database username
         @type  user: string
@@ -58,22 +61,37 @@ class DescriptorConnection(object):
         @type  pwd: string
         @param host: the database hostname
         @type  host: string
+        @param pool: the shared connection pool to use, if any
+        @type  pool: ConnectionPool
         '''
         # name of the descriptors table
         self._descriptors = 'descriptors'
-        # name of the database
-        self._db = 'world_model'
-        # connect to the world model database
-        self.conn = psycopg2.connect(database=self._db, user=user, password=pwd, host=host)
-        # create a lock 
-        self.lock = thread.allocate_lock()
+        # columns of the descriptors table in the order used by _db_to_dict
+        self._cols = 'descriptor_id, description_id, type, data, ref, tags, data_size, encoding'
+        # connections to the world model database
+        self.pool = pool if pool is not None else ConnectionPool(user, pwd, host)
+        # the largest data in bytes read by the query of a batch search (larger data is streamed)
+        self.inline_data_size = 1048576
+        # functions to call with the description_id of each descriptor written through this object
+        self._write_listeners = []
+
+    def add_write_listener(self, callback):
+        '''
+        Add a function to call with the description_id of each descriptor written to the 
+        descriptors table through this object (e.g., to invalidate a cache).
+        
+        @param callback: the function to call with the description_id
+        @type  callback: function
+        '''
+        self._write_listeners.append(callback)
 
     def insert(self, entity):
         '''
         Insert the given entity into the descriptors table. This will create a new descriptor. The 
         descriptor_id will be set to a unique value and returned. Note that any data found in the 
         data field (if any) will be stored into a Large Object and the OID will be placed in the 
-        spot of their value.
+        spot of their value. The content hash of the descriptor is stored with it, and if a 
+        descriptor with the same hash already exists, its Large Object is shared.
         
         @param entity: the entity to insert with the correct keys for the columns
         @type  entity: dict
@@ -83,53 +101,170 @@ class DescriptorConnection(object):
         # ensure the descriptor ID does not get set by the user
         if 'descriptor_id' in entity.keys():
             del entity['descriptor_id']
-        with self.lock:
+        # hash the contents
+        data = entity['data'] if 'data' in entity.keys() else ''
+        entity['data_hash'] = descriptor_hash(entity.get('type', ''), data, 
+                                              entity.get('encoding', ''))
+        with self.pool.connection() as conn:
+            # create a cursor
+            cur = conn.cursor()
             # check if there is data
             if 'data' in entity.keys():
-                # store the data in a Large Object
-                lobj = self.conn.lobject()
-                lobj.write(entity['data'])
-                self.conn.commit()
-                entity['data'] = lobj.oid
+                # check for identical data that is already stored
+                cur.execute("""SELECT data FROM """ + self._descriptors + 
+                            """ WHERE data_hash = %s AND data IS NOT NULL LIMIT 1""", 
+                            (entity['data_hash'],))
+                result = cur.fetchone()
+                if result is not None:
+                    oid = result[0]
+                else:
+                    # store the data as is in a Large Object (committed along with the descriptor)
+                    lobj = conn.lobject(0, 'wb')
+                    lobj.write(entity['data'])
+                    lobj.close()
+                    oid = lobj.oid
+                entity['data_size'] = len(entity['data'])
+                entity['data'] = oid
             # build the SQL
             helper = self._build_sql_helper(entity)
-            # create a cursor
-            cur = self.conn.cursor()
             cur.execute("""INSERT INTO """ + self._descriptors + 
                         """ (descriptor_id, """ + helper['cols'] + """) 
                         VALUES (nextval('descriptors_descriptor_id_seq'), 
                         """ + helper['holders'] + """) RETURNING descriptor_id""", helper['values'])
             descriptor_id = cur.fetchone()[0]
-            self.conn.commit()
+            conn.commit()
             cur.close()
+        self._written(entity.get('description_id'))
         # return the descriptor ID
         return descriptor_id
     
-    def search_by_description_id(self, description_id):
+    def search_by_description_id(self, description_id, load_data=False):
         '''
         Search for and return all entities in the descriptors table with the given description_id, 
-        if any. This will load the file and return the contents.
+        if any. By default, only the size of the data is returned and the data itself can be read
+        with read_data.
         
         @param description_id: the description_id to search for
         @type  description_id: int
+        @param load_data: if the data of each entity should be loaded
+        @type  load_data: bool
+        @return: the entities found
+        @rtype:  list
+        '''
+        return self.search_by_description_ids([description_id], load_data)[description_id]
+
+    def search_by_description_ids(self, description_ids, load_data=False):
+        '''
+        Search for and return all entities in the descriptors table with any of the given 
+        description_ids with a single query. If the data is loaded, data smaller than the inline
+        data size is read by the same query rather than one Large Object at a time. Larger data is
+        read from its Large Object so the results of the query stay small.
+        
+        @param description_ids: the description_ids to search for
+        @type  description_ids: list
+        @param load_data: if the data of each entity should be loaded
+        @type  load_data: bool
+        @return: the entities found for each description_id (ordered by descriptor_id), keyed by 
+                 description_id
+        @rtype:  dict
+        '''
+        final = dict([(description_id, []) for description_id in description_ids])
+        # do not search empty arrays
+        if len(final) is 0:
+            return final
+        data = 'CASE WHEN data_size < %s THEN lo_get(data) END' if load_data else 'NULL::bytea'
+        values = (self.inline_data_size,) if load_data else ()
+        with self.pool.connection(read_only=True) as conn:
+            # create a cursor
+            cur = conn.cursor()
+            execute(cur, 'descriptors_get_many', """SELECT """ + self._cols + """, """ + data + 
+                    """ FROM """ + self._descriptors + """ 
+                    WHERE description_id = ANY (%s::bigint[]) 
+                    ORDER BY description_id, descriptor_id""", values + (final.keys(),))
+            # extract the values
+            results = cur.fetchall()
+            cur.close()
+            for r in results:
+                if r[8] is not None:
+                    # the data was already read
+                    entity = self._db_to_dict(conn, r, False)
+                    entity['data'] = str(r[8])
+                    self.pool.stats.count('lobject.bytes', len(entity['data']))
+                else:
+                    # large data is streamed (if requested)
+                    entity = self._db_to_dict(conn, r, load_data)
+                final[r[1]].append(entity)
+        return final
+
+    def search_hash(self, data_hash):
+        '''
+        Search for and return all entities in the descriptors table with the given content hash, if
+        any. The data is not loaded.
+        
+        @param data_hash: the content hash to search for (see descriptor_hash)
+        @type  data_hash: string
         @return: the entities found
         @rtype:  list
         '''
         final = []
-        with self.lock:
+        with self.pool.connection(read_only=True) as conn:
             # create a cursor
-            cur = self.conn.cursor()
-            # check if the description actually exists
-            cur.execute("""SELECT * FROM """ + self._descriptors + 
-                        """ WHERE description_id = %s""", (description_id,))
+            cur = conn.cursor()
+            execute(cur, 'descriptors_hash', """SELECT """ + self._cols + """ FROM """ + 
+                    self._descriptors + """ WHERE data_hash = %s ORDER BY descriptor_id""", 
+                    (data_hash,))
             # extract the values
             results = cur.fetchall()
             for r in results:
-                # convert to a dictionary and convert the timestamps
-                final.append(self._db_to_dict(r))
+                final.append(self._db_to_dict(conn, r, False))
             cur.close()
         return final
+
+    def read_data(self, descriptor_id, offset=0, length=-1):
+        '''
+        Read the data of the entity in the descriptors table with the given descriptor_id, if one 
+        exists. Only the requested part of the Large Object is read.
+        
+        @param descriptor_id: the descriptor_id of the entity to read the data of
+        @type  descriptor_id: int
+        @param offset: the byte offset to start reading at
+        @type  offset: int
+        @param length: the maximum number of bytes to read, or -1 to read until the end
+        @type  length: int
+        @return: the data read and the total size of the data, or None if the entity was not found
+        @rtype:  tuple
+        '''
+        with self.pool.connection(read_only=True) as conn:
+            # create a cursor
+            cur = conn.cursor()
+            execute(cur, 'descriptors_data', """SELECT data FROM """ + self._descriptors + 
+                    """ WHERE descriptor_id = %s""", (descriptor_id,))
+            result = cur.fetchone()
+            cur.close()
+            if result is None:
+                return None
+            elif result[0] is None:
+                return ('', 0)
+            with self.pool.stats.time('lobject.read'):
+                lobj = conn.lobject(result[0], 'rb')
+                # find the size from the end of the Large Object
+                size = lobj.seek(0, 2)
+                lobj.seek(min(offset, size))
+                data = lobj.read(length)
+                lobj.close()
+            self.pool.stats.count('lobject.bytes', len(data))
+        return (data, size)
     
+    def _written(self, description_id):
+        '''
+        Call each write listener with the given description_id.
+        
+        @param description_id: the description_id of the descriptor written
+        @type  description_id: int
+        '''
+        for callback in self._write_listeners:
+            callback(description_id)
+
     def _build_sql_helper(self, entity):
         '''
         A helper function to build the SQL for an insertion/update. This will take the entity dict
@@ -151,20 +286,27 @@ class DescriptorConnection(object):
         final['holders'] = final['holders'][:-2]
         return final
 
-    def _db_to_dict(self, entity):
+    def _db_to_dict(self, conn, entity, load_data):
         '''
         Convert a database tuple to a dict. This function assumes the tuple is in the correct order.
-        This function will load the data in the data field.
+        If the data is not loaded, it is set to None.
         
+        @param conn: the connection to load the data with
+        @type  conn: connection
         @param entity: the entity to build the dictionary for
         @type  entity: tuple
+        @param load_data: if the data should be loaded
+        @type  load_data: bool
         @return: the dictionary containing the information from the database
         @rtype: dict
         '''
         # load the data
-        if entity[3] is not None:
-            lobj = self.conn.lobject(entity[3])
-            data = lobj.read()
+        if load_data and entity[3] is not None:
+            with self.pool.stats.time('lobject.read'):
+                lobj = conn.lobject(entity[3], 'rb')
+                data = lobj.read()
+                lobj.close()
+            self.pool.stats.count('lobject.bytes', len(data))
         else:
             data = None
         # convert each one assuming the ordering is correct
@@ -175,5 +317,7 @@ class DescriptorConnection(object):
                 'data' : data,
                 'ref' : entity[4],
                 'tags' : entity[5],
+                'size' : entity[6],
+                'encoding' : entity[7],
                 }
         return final
\ No newline at end of file
@@ -0,0 +1,156 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2013, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+# * Neither the name of Willow Garage, Inc. nor the names of its
+# contributors may be used to endorse or promote products derived
+# from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+'''
+The descriptor_encoding module encodes and decodes ROS messages stored as descriptor data. An 
+encoding is the format of the message ('json' or 'ros' for the serialized ROS message) optionally 
+followed by a compression ('+zlib' or '+lz4'), e.g., 'ros+zlib'. An empty encoding is plain JSON.
+
+@author:  Russell Toris
+@version: April 29, 2013
+'''
+
+from rospy_message_converter.json_message_converter import convert_ros_message_to_json
+from rospy_message_converter.message_converter import convert_dictionary_to_ros_message
+from StringIO import StringIO
+import json
+import zlib
+
+# lz4 compression is optional
+try:
+    import lz4.frame as lz4
+except ImportError:
+    lz4 = None
+
+# plain JSON (the default)
+JSON = 'json'
+# the serialized ROS message
+ROS = 'ros'
+# zlib compression
+ZLIB = 'zlib'
+# lz4 compression (requires the lz4 module)
+LZ4 = 'lz4'
+
+def encode_message(msg, encoding=JSON):
+    '''
+    Encode the given ROS message as descriptor data.
+    
+    @param msg: the ROS message to encode
+    @type  msg: Message
+    @param encoding: the encoding to use (e.g., 'json', 'ros', or 'ros+zlib')
+    @type  encoding: string
+    @return: the encoded data
+    @rtype: string
+    '''
+    fmt, compression = _parse_encoding(encoding)
+    if fmt == ROS:
+        buff = StringIO()
+        msg.serialize(buff)
+        data = buff.getvalue()
+    else:
+        data = convert_ros_message_to_json(msg)
+    return _compress(data, compression)
+
+def decode_message(data, encoding, msg_class):
+    '''
+    Decode the given descriptor data into a ROS message.
+    
+    @param data: the descriptor data to decode
+    @type  data: string
+    @param encoding: the encoding of the data (e.g., 'json', 'ros', or 'ros+zlib')
+    @type  encoding: string
+    @param msg_class: the class of the ROS message (e.g., OccupancyGrid)
+    @type  msg_class: type
+    @return: the decoded ROS message
+    @rtype: Message
+    '''
+    fmt, compression = _parse_encoding(encoding)
+    data = _decompress(data, compression)
+    if fmt == ROS:
+        return msg_class().deserialize(data)
+    else:
+        return convert_dictionary_to_ros_message(msg_class._type, json.loads(data))
+
+def _parse_encoding(encoding):
+    '''
+    Split the given encoding into its format and compression.
+    
+    @param encoding: the encoding (e.g., 'ros+zlib')
+    @type  encoding: string
+    @return: the format and compression (None if not compressed)
+    @rtype: tuple
+    '''
+    parts = encoding.split('+') if len(encoding) > 0 else [JSON]
+    fmt = parts[0]
+    compression = parts[1] if len(parts) > 1 else None
+    if fmt not in [JSON, ROS] or compression not in [None, ZLIB, LZ4] or len(parts) > 2:
+        raise ValueError('Invalid descriptor encoding: ' + encoding)
+    if compression == LZ4 and lz4 is None:
+        raise ValueError('The lz4 module is required for the ' + encoding + ' encoding.')
+    return (fmt, compression)
+
+def _compress(data, compression):
+    '''
+    Compress the given data.
+    
+    @param data: the data to compress
+    @type  data: string
+    @param compression: the compression to use (None for no compression)
+    @type  compression: string
+    @return: the compressed data
+    @rtype: string
+    '''
+    if compression == ZLIB:
+        return zlib.compress(data)
+    elif compression == LZ4:
+        return lz4.compress(data)
+    else:
+        return data
+
+def _decompress(data, compression):
+    '''
+    Decompress the given data.
+    
+    @param data: the data to decompress
+    @type  data: string
+    @param compression: the compression that was used (None for no compression)
+    @type  compression: string
+    @return: the decompressed data
+    @rtype: string
+    '''
+    if compression == ZLIB:
+        return zlib.decompress(data)
+    elif compression == LZ4:
+        return lz4.decompress(data)
+    else:
+        return data
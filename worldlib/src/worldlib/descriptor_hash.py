@@ -0,0 +1,72 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2013, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+# * Neither the name of Willow Garage, Inc. nor the names of its
+# contributors may be used to endorse or promote products derived
+# from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+'''
+The descriptor_hash module computes the content hash of a descriptor. The hash is stored with each
+descriptor so identical descriptors can be found with a single index lookup.
+
+@author:  Russell Toris
+@version: April 26, 2013
+'''
+
+import hashlib
+
+def descriptor_hash(type, data, encoding=''):
+    '''
+    Compute the content hash of a descriptor. This is the SHA-256 of the type, a null byte, the
+    encoding and a null byte (only if an encoding is given), and the data.
+    
+    @param type: the type of the descriptor
+    @type  type: string
+    @param data: the data of the descriptor
+    @type  data: string
+    @param encoding: the encoding of the data (see worldlib.descriptor_encoding)
+    @type  encoding: string
+    @return: the hex digest of the hash
+    @rtype: string
+    '''
+    # hash the UTF-8 bytes of any unicode strings
+    if isinstance(type, unicode):
+        type = type.encode('utf-8')
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    if isinstance(encoding, unicode):
+        encoding = encoding.encode('utf-8')
+    h = hashlib.sha256()
+    h.update(type)
+    h.update('\0')
+    if len(encoding) > 0:
+        h.update(encoding)
+        h.update('\0')
+    h.update(data)
+    return h.hexdigest()
@@ -0,0 +1,1545 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2013, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+# * Neither the name of Willow Garage, Inc. nor the names of its
+# contributors may be used to endorse or promote products derived
+# from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+
+'''
+The embedded_store module is a storage backend for worldlib which needs no PostgreSQL server (e.g., 
+for robots at the edge). Everything is kept in memory with indexes on the tags, upsert keys, expiry
+times, description_ids, and content hashes, and is optionally persisted to a SQLite file. The 
+connection classes implement the same interface as the PostgreSQL connections (see 
+storage_interface), and the EmbeddedStore can be used in place of a ChangeFeed.
+
+@author:  Russell Toris
+@version: May 16, 2013
+'''
+
+from worldlib.descriptor_hash import descriptor_hash
+from worldlib.kd_tree import KDTree
+from worldlib.row_converter import timestamp_to_unix, unix_to_timestamp
+from worldlib.stats import Stats
+from worldlib.storage_interface import WorldObjectInstanceStorage, WorldObjectDescriptionStorage
+from worldlib.storage_interface import DescriptorStorage, MapTileStorage
+from worldlib.tag_key import tag_key
+from worldlib.tag_search import MATCH_ALL, MATCH_ANY, MATCH_NONE, page_entities, tags_match
+import Queue
+import heapq
+import json
+import sqlite3
+import threading
+import thread
+import time
+import traceback
+
+# the names of the tables (the same as in the PostgreSQL database)
+INSTANCES = 'world_object_instances'
+ARCHIVE = 'world_object_instances_archive'
+DESCRIPTIONS = 'world_object_descriptions'
+DESCRIPTORS = 'descriptors'
+# the name of the table of descriptor data (shared by descriptors with the same content hash)
+DATA = 'descriptor_data'
+# the names of the tiled maps and map tiles tables
+MAP_TILE_SETS = 'map_tile_sets'
+MAP_TILES = 'map_tiles'
+
+# the types of changes
+INSERT = 'insert'
+UPDATE = 'update'
+EXPIRE = 'expire'
+DELETE = 'delete'
+
+class EmbeddedStore(object):
+    '''
+    The main EmbeddedStore object which holds the tables and indexes of an embedded World Model. 
+    Each change is passed to the listeners as a dictionary with the table, operation (insert, 
+    update, expire, or delete), id, and tags of the changed entity.
+    '''
+
+    def __init__(self, path=None, stats=None):
+        '''
+        Creates the EmbeddedStore object. If a path is given, the store is loaded from the SQLite
+        file and each write is committed to it before returning.
+        
+        @param path: the SQLite file to persist to, or None to only keep the store in memory
+        @type  path: string
+        @param stats: the statistics to record to, if any
+        @type  stats: Stats
+        '''
+        self.path = path
+        self.stats = stats if stats is not None else Stats()
+        # instances as instance_id : entity (entities are replaced, never changed in place)
+        self.instances = {}
+        # archived instances as instance_id : entity
+        self.archive = {}
+        # the instance_ids of the live instances (i.e., without a perceived_end) and by tag
+        self.live = set()
+        self.tags = {}
+        # the instance_ids of the expired instances that are not archived yet
+        self.expired = set()
+        # the instance_ids of the instances holding each tag_key as tag_key : instance_id
+        self.tag_keys = {}
+        # a heap of (expiry time, instance_id) with at most one entry per instance
+        self.expiry = []
+        self.scheduled = set()
+        # descriptions as description_id : entity
+        self.descriptions = {}
+        # descriptors as descriptor_id : entity, and their descriptor_ids by description_id and hash
+        self.descriptors = {}
+        self.by_description = {}
+        self.by_hash = {}
+        # the descriptor data as data_hash : data
+        self.data = {}
+        # tiled maps as description_id : entity, and their tiles as 
+        # description_id : {(level, x, y) : (version, data)}
+        self.tile_sets = {}
+        self.tiles = {}
+        # the last ID assigned in each table
+        self._ids = {INSTANCES : 0, DESCRIPTIONS : 0, DESCRIPTORS : 0}
+        # incremented on each write of an instance (e.g., to invalidate spatial indexes)
+        self.version = 0
+        # create a lock for the tables
+        self.lock = thread.allocate_lock()
+        # functions to call with each list of changes
+        self._listeners = []
+        self._listeners_lock = thread.allocate_lock()
+        self._changes = Queue.Queue()
+        self._thread = None
+        self._running = False
+        self._db = None
+        if path is not None:
+            self._open(path)
+
+    def next_id(self, table):
+        '''
+        Assign a new unique ID in the given table. The lock must be held.
+        
+        @param table: the name of the table
+        @type  table: string
+        @return: the ID
+        @rtype:  int
+        '''
+        self._ids[table] += 1
+        return self._ids[table]
+
+    def put_instance(self, entity):
+        '''
+        Store the given instance, replacing and un-indexing any previous version of it. The lock 
+        must be held.
+        
+        @param entity: the complete instance to store
+        @type  entity: dict
+        @return: the previous version of the instance, or None if it is new
+        @rtype:  dict
+        '''
+        instance_id = entity['instance_id']
+        old = self.instances.get(instance_id)
+        if old is not None:
+            self._unindex(old)
+        self.instances[instance_id] = entity
+        # index the instance
+        if entity['perceived_end'] is None:
+            self.live.add(instance_id)
+            for tag in entity['tags'] or []:
+                self.tags.setdefault(tag, set()).add(instance_id)
+            # instances are rescheduled lazily when their expiry is reached
+            if _expires(entity) and instance_id not in self.scheduled:
+                heapq.heappush(self.expiry, (_expiry_time(entity), instance_id))
+                self.scheduled.add(instance_id)
+        else:
+            self.expired.add(instance_id)
+        if entity.get('tag_key') is not None:
+            self.tag_keys[entity['tag_key']] = instance_id
+        self.version += 1
+        self._persist(INSTANCES, instance_id, entity)
+        return old
+
+    def archive_instance(self, instance_id):
+        '''
+        Move the instance with the given instance_id to the archive. The lock must be held.
+        
+        @param instance_id: the instance_id of the instance
+        @type  instance_id: int
+        @return: the archived instance
+        @rtype:  dict
+        '''
+        entity = self.instances.pop(instance_id)
+        self._unindex(entity)
+        self.archive[instance_id] = entity
+        self.version += 1
+        if self._db is not None:
+            self._db.execute('DELETE FROM ' + INSTANCES + ' WHERE id = ?', (instance_id,))
+        self._persist(ARCHIVE, instance_id, entity)
+        return entity
+
+    def put_description(self, entity):
+        '''
+        Store the given description. The lock must be held.
+        
+        @param entity: the complete description to store
+        @type  entity: dict
+        '''
+        self.descriptions[entity['description_id']] = entity
+        self._persist(DESCRIPTIONS, entity['description_id'], entity)
+
+    def put_descriptor(self, entity, data=None):
+        '''
+        Store the given descriptor and its data, if it is not stored already. The lock must be held.
+        
+        @param entity: the complete descriptor to store
+        @type  entity: dict
+        @param data: the data of the descriptor, if any
+        @type  data: string
+        '''
+        descriptor_id = entity['descriptor_id']
+        self.descriptors[descriptor_id] = entity
+        self.by_description.setdefault(entity['description_id'], []).append(descriptor_id)
+        self.by_hash.setdefault(entity['data_hash'], []).append(descriptor_id)
+        if data is not None and entity['data_hash'] not in self.data:
+            self.data[entity['data_hash']] = data
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO ' + DATA + ' (data_hash, data) VALUES ' + 
+                                 '(?, ?)', (entity['data_hash'], sqlite3.Binary(data)))
+        self._persist(DESCRIPTORS, descriptor_id, entity)
+
+    def put_tile_set(self, entity):
+        '''
+        Store the given tiled map. The lock must be held.
+        
+        @param entity: the complete tiled map to store
+        @type  entity: dict
+        '''
+        self.tile_sets[entity['description_id']] = entity
+        self.tiles.setdefault(entity['description_id'], {})
+        self._persist(MAP_TILE_SETS, entity['description_id'], entity)
+
+    def put_tile(self, description_id, key, version, data):
+        '''
+        Store the given tile of a tiled map. The lock must be held.
+        
+        @param description_id: the description_id of the tiled map
+        @type  description_id: int
+        @param key: the (level, x, y) of the tile
+        @type  key: tuple
+        @param version: the version of the tile
+        @type  version: int
+        @param data: the cells of the tile
+        @type  data: string
+        '''
+        self.tiles[description_id][key] = (version, data)
+        if self._db is not None:
+            self._db.execute('INSERT OR REPLACE INTO ' + MAP_TILES + ' (description_id, level, ' +
+                             'x, y, version, data) VALUES (?, ?, ?, ?, ?, ?)', 
+                             (description_id,) + key + (version, sqlite3.Binary(data)))
+
+    def delete_tiles(self, description_id, keys):
+        '''
+        Delete the given tiles of a tiled map. The lock must be held.
+        
+        @param description_id: the description_id of the tiled map
+        @type  description_id: int
+        @param keys: the (level, x, y) of each tile
+        @type  keys: list
+        '''
+        for key in keys:
+            del self.tiles[description_id][key]
+        if self._db is not None:
+            self._db.executemany('DELETE FROM ' + MAP_TILES + ' WHERE description_id = ? AND ' + 
+                                 'level = ? AND x = ? AND y = ?', 
+                                 [(description_id,) + key for key in keys])
+
+    def commit(self, changes):
+        '''
+        Commit the writes made since the last commit to the SQLite file, if any, and queue the 
+        given changes for the listeners. The lock must be held so changes are queued in order.
+        
+        @param changes: the list of change dictionaries
+        @type  changes: list
+        '''
+        if self._db is not None:
+            with self.stats.time('sqlite.commit'):
+                self._db.commit()
+        if self._running and len(changes) > 0:
+            self._changes.put(changes)
+
+    def close(self):
+        '''
+        Stop the listeners and close the SQLite file, if any.
+        '''
+        self.stop()
+        with self.lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def add_listener(self, callback):
+        '''
+        Add a function to call with each list of changes. Changes made together (e.g., by a single
+        call) are passed in one list, in the order they were made.
+        
+        @param callback: the function to call with the list of change dictionaries
+        @type  callback: function
+        '''
+        with self._listeners_lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        '''
+        Remove a function previously given to add_listener.
+        
+        @param callback: the function to remove
+        @type  callback: function
+        '''
+        with self._listeners_lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def start(self):
+        '''
+        Start calling the listeners from a background thread. Changes made before the store is 
+        started are not delivered.
+        '''
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        '''
+        Stop calling the listeners. This will block until the background thread has finished.
+        '''
+        self._running = False
+        if self._thread is not None:
+            self._changes.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        '''
+        The main loop of the background thread. Errors in the listeners are printed and do not stop
+        the thread.
+        '''
+        while True:
+            changes = self._changes.get()
+            if changes is None:
+                return
+            with self._listeners_lock:
+                listeners = list(self._listeners)
+            for callback in listeners:
+                try:
+                    callback(changes)
+                except Exception:
+                    traceback.print_exc()
+
+    def _unindex(self, entity):
+        '''
+        Remove the given instance from the indexes. The expiry heap is cleaned lazily.
+        
+        @param entity: the instance to remove
+        @type  entity: dict
+        '''
+        instance_id = entity['instance_id']
+        self.live.discard(instance_id)
+        self.expired.discard(instance_id)
+        for tag in entity['tags'] or []:
+            ids = self.tags.get(tag)
+            if ids is not None:
+                ids.discard(instance_id)
+                if len(ids) is 0:
+                    del self.tags[tag]
+        if self.tag_keys.get(entity.get('tag_key')) == instance_id:
+            del self.tag_keys[entity['tag_key']]
+
+    def _persist(self, table, key, entity):
+        '''
+        Write the given entity to the SQLite file, if any. The lock must be held.
+        
+        @param table: the name of the table
+        @type  table: string
+        @param key: the unique ID of the entity
+        @type  key: int
+        @param entity: the entity to write
+        @type  entity: dict
+        '''
+        if self._db is not None:
+            self._db.execute('INSERT OR REPLACE INTO ' + table + ' (id, entity) VALUES (?, ?)', 
+                             (key, json.dumps(entity, separators=(',', ':'))))
+
+    def _open(self, path):
+        '''
+        Open the SQLite file at the given path, creating the tables if needed, and load the store 
+        from it.
+        
+        @param path: the SQLite file
+        @type  path: string
+        '''
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # the write-ahead log makes each commit a single append
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        for table in [INSTANCES, ARCHIVE, DESCRIPTIONS, DESCRIPTORS, MAP_TILE_SETS]:
+            self._db.execute('CREATE TABLE IF NOT EXISTS ' + table + 
+                             ' (id INTEGER PRIMARY KEY, entity TEXT NOT NULL)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS ' + DATA + 
+                         ' (data_hash TEXT PRIMARY KEY, data BLOB NOT NULL)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS ' + MAP_TILES + ' (description_id INTEGER, ' + 
+                         'level INTEGER, x INTEGER, y INTEGER, version INTEGER NOT NULL, ' + 
+                         'data BLOB NOT NULL, PRIMARY KEY (description_id, level, x, y))')
+        self._db.commit()
+        # the loaded entities are indexed without being written back
+        db = self._db
+        self._db = None
+        with self.lock:
+            for data_hash, data in db.execute('SELECT data_hash, data FROM ' + DATA):
+                self.data[data_hash] = str(data)
+            for key, entity in db.execute('SELECT id, entity FROM ' + DESCRIPTIONS):
+                self.put_description(_load(entity))
+                self._ids[DESCRIPTIONS] = max(self._ids[DESCRIPTIONS], key)
+            for key, entity in db.execute('SELECT id, entity FROM ' + DESCRIPTORS + 
+                                          ' ORDER BY id'):
+                self.put_descriptor(_load(entity))
+                self._ids[DESCRIPTORS] = max(self._ids[DESCRIPTORS], key)
+            for key, entity in db.execute('SELECT id, entity FROM ' + ARCHIVE):
+                self.archive[key] = _load(entity)
+                self._ids[INSTANCES] = max(self._ids[INSTANCES], key)
+            for key, entity in db.execute('SELECT id, entity FROM ' + INSTANCES):
+                self.put_instance(_load(entity))
+                self._ids[INSTANCES] = max(self._ids[INSTANCES], key)
+            for key, entity in db.execute('SELECT id, entity FROM ' + MAP_TILE_SETS):
+                self.put_tile_set(_load(entity))
+            for row in db.execute('SELECT description_id, level, x, y, version, data FROM ' + 
+                                  MAP_TILES):
+                self.put_tile(row[0], tuple(row[1:4]), row[4], str(row[5]))
+        self._db = db
+
+class EmbeddedWorldObjectInstanceConnection(WorldObjectInstanceStorage):
+    '''
+    The EmbeddedWorldObjectInstanceConnection object which reads and writes the instances of an 
+    EmbeddedStore. It has the same methods as the WorldObjectInstanceConnection.
+    '''
+
+    def __init__(self, store):
+        '''
+        Creates the EmbeddedWorldObjectInstanceConnection object.
+        
+        @param store: the embedded store to use
+        @type  store: EmbeddedStore
+        '''
+        # fields that are timestamps
+        self.timestamps = ['creation', 'update', 'perceived_end', 'pose_stamp']
+        # the columns of the rows given to the row factory (the same as the PostgreSQL table)
+        self.columns = ['instance_id', 'name', 'creation', 'update', 'expected_ttl', 
+                        'perceived_end', 'source_origin', 'source_creator', 'pose_seq', 
+                        'pose_stamp', 'pose_frame_id', 'pose_position', 'pose_orientation', 
+                        'pose_covariance', 'description_id', 'properties', 'tags']
+        # the function used to convert each row found (e.g., a row_converter), dicts by default
+        self.row_factory = self._db_to_dict
+        # the function which creates the row factory of a search for only some of the columns 
+        # (given those columns in order), dicts by default
+        self.projection_factory = self._projected_dict_factory
+        # the row factories of searches for only some of the columns keyed by the columns
+        self._projections = {}
+        # columns that tag search results can be ordered by
+        self._order_cols = ['name', 'creation', 'update']
+        self.store = store
+        # spatial searches always use in-process spatial indexes
+        self.spatial = False
+        # expired instances are archived in the store
+        self.history = True
+        # poses are not recorded
+        self.pose_history = False
+        # in-process spatial indexes as (frame_id, tags, history) : (version, KDTree)
+        self._trees = {}
+        # create a lock for the in-process spatial indexes
+        self._trees_lock = thread.allocate_lock()
+
+    def insert(self, entity):
+        '''
+        Insert the given entity. This will create a new instance. The instance_id will be set to a 
+        unique value and returned.
+        
+        @param entity: the entity to insert with the correct keys for the columns
+        @type  entity: dict
+        @return: the instance_id
+        @rtype: integer
+        '''
+        return self.insert_many([entity])[0]
+
+    def insert_many(self, entities):
+        '''
+        Insert the given entities. The instance_id of each will be set to a unique value and 
+        returned in the same order as the entities.
+        
+        @param entities: the entities to insert with the correct keys for the columns
+        @type  entities: list
+        @return: the instance_ids
+        @rtype: list
+        '''
+        for entity in entities:
+            # ensure the instance ID does not get set by the user
+            if 'instance_id' in entity.keys():
+                del entity['instance_id']
+            self._check_columns(entity)
+        instance_ids = []
+        changes = []
+        with self.store.lock:
+            for entity in entities:
+                stored = self._new_instance(self.store.next_id(INSTANCES), entity)
+                self._hold_tag_key(stored)
+                self.store.put_instance(stored)
+                instance_ids.append(stored['instance_id'])
+                changes.append(_change(INSTANCES, INSERT, stored['instance_id'], stored['tags']))
+            self.store.commit(changes)
+        return instance_ids
+
+    def update_entity_by_instance_id(self, instance_id, entity):
+        '''
+        Update the entity with the given instance_id, if one exists.
+        
+        @param instance_id: the instance_id of the entity to update
+        @type  instance_id: int
+        @param entity: the entity to update with
+        @type  entity: dict
+        @return: if an entity was found and updated with the given instance_id
+        @rtype:  bool
+        '''
+        return self.update_entities_by_instance_id([(instance_id, entity)])[0]
+
+    def update_entities_by_instance_id(self, updates):
+        '''
+        Update the entities with the given instance_ids, if they exist. Archived entities are not
+        updated.
+        
+        @param updates: the (instance_id, entity) pairs to update
+        @type  updates: list
+        @return: if an entity was found and updated for each of the given instance_ids
+        @rtype:  list
+        '''
+        for instance_id, entity in updates:
+            # ensure the instance ID does not get set by the user
+            if 'instance_id' in entity.keys():
+                del entity['instance_id']
+            self._check_columns(entity)
+        final = []
+        changes = []
+        with self.store.lock:
+            for instance_id, entity in updates:
+                old = self.store.instances.get(instance_id)
+                final.append(old is not None)
+                # nothing to set
+                if old is None or len(entity) is 0:
+                    continue
+                stored = dict(old)
+                stored.update(_copy(entity))
+                if 'tags' in entity.keys():
+                    self._hold_tag_key(stored)
+                self.store.put_instance(stored)
+                changes.append(_change(INSTANCES, _operation(old, stored), instance_id, 
+                                       stored['tags']))
+            self.store.commit(changes)
+        return final
+
+    def upsert_by_tags(self, entity):
+        '''
+        Insert the given entity or, if an entity with exactly the same set of tags was already 
+        upserted, update that entity instead. The creation time of an existing entity is never 
+        changed and, unless it is given, the perceived_end is cleared.
+        
+        @param entity: the entity to upsert with the correct keys for the columns
+        @type  entity: dict
+        @return: the instance_id and if a new entity was created
+        @rtype: tuple
+        '''
+        # ensure the instance ID does not get set by the user
+        if 'instance_id' in entity.keys():
+            del entity['instance_id']
+        self._check_columns(entity)
+        # the tags are the key
+        key = self.tag_key(entity['tags'])
+        with self.store.lock:
+            instance_id = self.store.tag_keys.get(key)
+            if instance_id is None:
+                stored = self._new_instance(self.store.next_id(INSTANCES), entity)
+                stored['tag_key'] = key
+                self.store.put_instance(stored)
+                operation = INSERT
+            else:
+                old = self.store.instances[instance_id]
+                stored = dict(old)
+                stored.update(_copy(entity))
+                stored['creation'] = old['creation']
+                # an upserted entity is live again
+                if 'perceived_end' not in entity.keys():
+                    stored['perceived_end'] = None
+                self.store.put_instance(stored)
+                operation = _operation(old, stored)
+            self.store.commit([_change(INSTANCES, operation, stored['instance_id'], 
+                                       stored['tags'])])
+        return (stored['instance_id'], instance_id is None)
+
+    def tag_key(self, tags):
+        '''
+        Create the unique key for the given set of tags used by upsert_by_tags. The order of the
+        tags and any duplicates are ignored.
+        
+        @param tags: the list of tags
+        @type  tags: list
+        @return: the key (a JSON array of the sorted tags, see worldlib.tag_key)
+        @rtype: string
+        '''
+        return tag_key(tags)
+
+    def search_instance_ids(self, instance_ids, history=False, columns=None):
+        '''
+        Search for and return all entities with the given instance_ids, if any. Expired entities 
+        are returned until they are archived.
+        
+        @param instance_ids: the instance_ids to search for
+        @type  instance_ids: list
+        @param history: if archived entities should be searched as well
+        @type  history: bool
+        @param columns: the columns to return (the instance_id is always returned), or None for all
+        @type  columns: list
+        @return: the entities found keyed by instance_id
+        @rtype:  dict
+        '''
+        selected, row_factory = self._projection(columns)
+        found = []
+        with self.store.lock:
+            for instance_id in set(instance_ids):
+                entity = self.store.instances.get(instance_id)
+                if entity is None and history:
+                    entity = self.store.archive.get(instance_id)
+                if entity is not None:
+                    found.append(entity)
+        final = {}
+        with self.store.stats.time('woi.convert'):
+            for entity in found:
+                final[entity['instance_id']] = row_factory(self._row(entity, selected))
+        return final
+
+    def search_tags(self, tags, match=MATCH_ALL, order_by=None, descending=False, limit=0, 
+                    offset=0, after_id=0, history=False, columns=None):
+        '''
+        Search for and return all entities that match the given list of tags. By default, only live
+        entities are searched (with the tag index), entities must contain all of the tags, and 
+        entities are ordered by their instance_id.
+        
+        @param tags: the list of tags to search for
+        @type  tags: list
+        @param match: how to match the tags (MATCH_ALL, MATCH_ANY, or MATCH_NONE)
+        @type  match: int
+        @param order_by: the column to order by (name, creation, update), or None to order by the 
+                         instance_id
+        @type  order_by: string
+        @param descending: if the results should be in descending order
+        @type  descending: bool
+        @param limit: the maximum number of entities to return, or 0 for no limit
+        @type  limit: int
+        @param offset: the number of entities to skip
+        @type  offset: int
+        @param after_id: only return entities after this instance_id (requires ordering by 
+                         instance_id)
+        @type  after_id: int
+        @param history: if expired and archived entities should be searched as well
+        @type  history: bool
+        @param columns: the columns to return (the instance_id is always returned), or None for all
+        @type  columns: list
+        @return: the entities found
+        @rtype: list
+        '''
+        final = []
+        # do not search empty arrays
+        if len(tags) is 0:
+            return final
+        selected, row_factory = self._projection(columns)
+        with self.store.lock:
+            if history:
+                found = [e for e in self.store.instances.values() + self.store.archive.values() 
+                         if tags_match(e['tags'], tags, match)]
+            else:
+                found = [self.store.instances[i] for i in self._match_live(tags, match)]
+        found = page_entities(found, INSTANCES, 'instance_id', order_by, self._order_cols, 
+                              descending, limit, offset, after_id)
+        with self.store.stats.time('woi.convert'):
+            for entity in found:
+                final.append(row_factory(self._row(entity, selected)))
+        return final
+
+    def search_radius(self, frame_id, center, radius, tags=[], history=False, columns=None):
+        '''
+        Search for and return all entities with a pose in the given frame within the given distance
+        of the center point.
+        
+        @param frame_id: the frame_id of the poses to search
+        @type  frame_id: string
+        @param center: the X, Y, Z center point
+        @type  center: list
+        @param radius: the maximum distance from the center point
+        @type  radius: float
+        @param tags: only return entities that contain all of these tags (optional)
+        @type  tags: list
+        @param history: if expired and archived entities should be searched as well
+        @type  history: bool
+        @param columns: the columns to return (the instance_id is always returned), or None for all
+        @type  columns: list
+        @return: the entities found, sorted by distance
+        @rtype: list
+        '''
+        tree = self._spatial_index(frame_id, tags, history)
+        return self._search_keys([key for d, key in tree.radius(center, radius)], history, 
+                                 columns)
+
+    def search_box(self, frame_id, lo, hi, tags=[], history=False, columns=None):
+        '''
+        Search for and return all entities with a pose in the given frame within the given 
+        axis-aligned box.
+        
+        @param frame_id: the frame_id of the poses to search
+        @type  frame_id: string
+        @param lo: the X, Y, Z minimum corner of the box
+        @type  lo: list
+        @param hi: the X, Y, Z maximum corner of the box
+        @type  hi: list
+        @param tags: only return entities that contain all of these tags (optional)
+        @type  tags: list
+        @param history: if expired and archived entities should be searched as well
+        @type  history: bool
+        @param columns: the columns to return (the instance_id is always returned), or None for all
+        @type  columns: list
+        @return: the entities found
+        @rtype: list
+        '''
+        tree = self._spatial_index(frame_id, tags, history)
+        return self._search_keys(tree.box(lo, hi), history, columns)
+
+    def search_nearest(self, frame_id, center, k, tags=[], history=False, columns=None):
+        '''
+        Search for and return the k entities with a pose in the given frame nearest to the center 
+        point.
+        
+        @param frame_id: the frame_id of the poses to search
+        @type  frame_id: string
+        @param center: the X, Y, Z center point
+        @type  center: list
+        @param k: the number of entities to return
+        @type  k: int
+        @param tags: only return entities that contain all of these tags (optional)
+        @type  tags: list
+        @param history: if expired and archived entities should be searched as well
+        @type  history: bool
+        @param columns: the columns to return (the instance_id is always returned), or None for all
+        @type  columns: list
+        @return: the entities found, sorted by distance
+        @rtype: list
+        '''
+        if k <= 0:
+            return []
+        tree = self._spatial_index(frame_id, tags, history)
+        return self._search_keys([key for d, key in tree.nearest(center, k)], history, columns)
+
+    def search_pose_history(self, instance_id, start=None, end=None, every=1, max_points=0):
+        '''
+        Poses are not recorded by the embedded store, so no poses are ever found.
+        
+        @param instance_id: the instance_id of the entity
+        @type  instance_id: int
+        @param start: only return poses stamped at or after this unix time, or None for no limit
+        @type  start: float
+        @param end: only return poses stamped at or before this unix time, or None for no limit
+        @type  end: float
+        @param every: only return every Nth pose
+        @type  every: int
+        @param max_points: the maximum number of poses to return, or 0 for no limit
+        @type  max_points: int
+        @return: an empty list
+        @rtype:  list
+        '''
+        return []
+
+    def create_pose_partitions(self, days=2):
+        '''
+        Poses are not recorded by the embedded store, so there is nothing to create.
+        
+        @param days: the number of days to create partitions for
+        @type  days: int
+        '''
+        pass
+
+    def expire_entities(self, limit=1000):
+        '''
+        Set the perceived_end of live entities whose expected_ttl has passed since their last 
+        update. The expiry heap is used to find them.
+        
+        @param limit: the maximum number of entities to expire at once
+        @type  limit: int
+        @return: the instance_ids of the expired entities
+        @rtype:  list
+        '''
+        now = time.time()
+        instance_ids = []
+        changes = []
+        with self.store.lock:
+            heap = self.store.expiry
+            while len(instance_ids) < limit and len(heap) > 0 and heap[0][0] < now:
+                expiry, instance_id = heapq.heappop(heap)
+                self.store.scheduled.discard(instance_id)
+                entity = self.store.instances.get(instance_id)
+                if entity is None or entity['perceived_end'] is not None or not _expires(entity):
+                    continue
+                # the entity was updated since it was scheduled
+                if _expiry_time(entity) >= now:
+                    heapq.heappush(heap, (_expiry_time(entity), instance_id))
+                    self.store.scheduled.add(instance_id)
+                    continue
+                stored = dict(entity)
+                stored['perceived_end'] = now
+                self.store.put_instance(stored)
+                instance_ids.append(instance_id)
+                changes.append(_change(INSTANCES, EXPIRE, instance_id, stored['tags']))
+            self.store.commit(changes)
+        return instance_ids
+
+    def archive_entities(self, older_than, limit=1000):
+        '''
+        Move entities which expired more than the given number of seconds ago to the archive.
+        
+        @param older_than: the minimum number of seconds since the perceived_end
+        @type  older_than: float
+        @param limit: the maximum number of entities to archive at once
+        @type  limit: int
+        @return: the number of entities archived
+        @rtype:  int
+        '''
+        cutoff = time.time() - older_than
+        changes = []
+        with self.store.lock:
+            old = [(self.store.instances[i]['perceived_end'], i) for i in self.store.expired 
+                   if self.store.instances[i]['perceived_end'] < cutoff]
+            for perceived_end, instance_id in heapq.nsmallest(limit, old):
+                entity = self.store.archive_instance(instance_id)
+                changes.append(_change(INSTANCES, DELETE, instance_id, entity['tags']))
+            self.store.commit(changes)
+        return len(changes)
+
+    def _match_live(self, tags, match):
+        '''
+        Find the instance_ids of the live entities that match the given tags with the tag index. 
+        The lock must be held.
+        
+        @param tags: the list of tags to match
+        @type  tags: list
+        @param match: how to match the tags (MATCH_ALL, MATCH_ANY, or MATCH_NONE)
+        @type  match: int
+        @return: the instance_ids found
+        @rtype:  set
+        '''
+        index = self.store.tags
+        if match == MATCH_ALL:
+            # intersect starting from the rarest tag
+            sets = sorted([index.get(tag, set()) for tag in set(tags)], key=len)
+            found = set(sets[0])
+            for s in sets[1:]:
+                found &= s
+            return found
+        any_ids = set()
+        for tag in set(tags):
+            any_ids |= index.get(tag, set())
+        if match == MATCH_ANY:
+            return any_ids
+        elif match == MATCH_NONE:
+            return self.store.live - any_ids
+        else:
+            raise ValueError('Invalid tag match mode: ' + str(match))
+
+    def _search_keys(self, instance_ids, history=False, columns=None):
+        '''
+        Get the entities with the given instance_ids, in the same order. Entities that no longer 
+        exist are skipped.
+        
+        @param instance_ids: the instance_ids to get
+        @type  instance_ids: list
+        @param history: if archived entities should be searched as well
+        @type  history: bool
+        @param columns: the columns to return, or None for all
+        @type  columns: list
+        @return: the entities found
+        @rtype: list
+        '''
+        entities = self.search_instance_ids(instance_ids, history, columns)
+        return [entities[i] for i in instance_ids if i in entities]
+
+    def _spatial_index(self, frame_id, tags, history=False):
+        '''
+        Get the in-process spatial index of the positions in the given frame of the entities with
+        the given tags. Indexes are rebuilt after any write of an instance.
+        
+        @param frame_id: the frame_id of the poses to index
+        @type  frame_id: string
+        @param tags: only index entities that contain all of these tags (optional)
+        @type  tags: list
+        @param history: if expired and archived entities should be indexed as well
+        @type  history: bool
+        @return: the spatial index keyed by instance_id
+        @rtype: KDTree
+        '''
+        key = (frame_id, tuple(sorted(set(tags))), history)
+        # empty frames are stored as None
+        frame_id = frame_id if len(frame_id) > 0 else None
+        with self._trees_lock:
+            version = self.store.version
+            if key in self._trees and self._trees[key][0] == version:
+                return self._trees[key][1]
+        with self.store.lock:
+            version = self.store.version
+            if history:
+                entities = self.store.instances.values() + self.store.archive.values()
+            elif len(tags) > 0:
+                entities = [self.store.instances[i] for i in self._match_live(tags, MATCH_ALL)]
+            else:
+                entities = [self.store.instances[i] for i in self.store.live]
+        points = []
+        for e in entities:
+            if (e['pose_frame_id'] == frame_id and len(e['pose_position'] or []) == 3 and 
+                tags_match(e['tags'], tags)):
+                points.append((e['pose_position'], e['instance_id']))
+        tree = KDTree(points)
+        with self._trees_lock:
+            self._trees[key] = (version, tree)
+        return tree
+
+    def _new_instance(self, instance_id, entity):
+        '''
+        Create the complete stored version of a new entity. Missing columns are None.
+        
+        @param instance_id: the instance_id of the new entity
+        @type  instance_id: int
+        @param entity: the entity to insert
+        @type  entity: dict
+        @return: the entity to store
+        @rtype:  dict
+        '''
+        stored = dict.fromkeys(self.columns)
+        stored['tag_key'] = None
+        stored.update(_copy(entity))
+        stored['instance_id'] = instance_id
+        return stored
+
+    def _hold_tag_key(self, stored):
+        '''
+        Set the tag_key of the given stored entity to the key of its tags, unless another instance
+        holds that key. The lock must be held.
+        
+        @param stored: the stored entity
+        @type  stored: dict
+        '''
+        key = self.tag_key(stored['tags']) if stored['tags'] is not None else None
+        holder = self.store.tag_keys.get(key)
+        stored['tag_key'] = key if holder is None or holder == stored['instance_id'] else None
+
+    def _check_columns(self, entity):
+        '''
+        Check that the given entity only has known columns.
+        
+        @param entity: the entity to check
+        @type  entity: dict
+        '''
+        for k in entity.keys():
+            if k not in self.columns:
+                raise ValueError('Unknown column of ' + INSTANCES + ': ' + str(k))
+
+    def _row(self, entity, columns=None):
+        '''
+        Convert a stored entity into a row in the same form as the PostgreSQL database (e.g., with 
+        timestamps) for the row factory.
+        
+        @param entity: the stored entity
+        @type  entity: dict
+        @param columns: the columns of the row in order, or None for all
+        @type  columns: list
+        @return: the row in the order of the columns
+        @rtype:  tuple
+        '''
+        return tuple([unix_to_timestamp(entity[c]) if c in self.timestamps else entity[c] 
+                      for c in (columns or self.columns)])
+
+    def _projection(self, columns):
+        '''
+        Get the columns and the row factory of a search for the given columns. The instance_id is 
+        always selected first and the other columns are kept in the order of the table.
+        
+        @param columns: the columns to select, or None for all
+        @type  columns: list
+        @return: the selected columns (or None for all) and the row factory
+        @rtype:  tuple
+        '''
+        if columns is None:
+            return (None, self.row_factory)
+        for c in columns:
+            if c not in self.columns:
+                raise ValueError('Unknown column of ' + INSTANCES + ': ' + str(c))
+        selected = tuple([c for c in self.columns if c == 'instance_id' or c in columns])
+        # row factories are only created once for each set of columns
+        row_factory = self._projections.get(selected)
+        if row_factory is None:
+            row_factory = self.projection_factory(list(selected))
+            self._projections[selected] = row_factory
+        return (selected, row_factory)
+
+    def _db_to_dict(self, entity):
+        '''
+        Convert a row to a dict. This will also convert timestamps back into unix time.
+        
+        @param entity: the row to build the dictionary for
+        @type  entity: tuple
+        @return: the dictionary containing the information from the row
+        @rtype: dict
+        '''
+        final = dict(zip(self.columns, entity))
+        for k in self.timestamps:
+            final[k] = timestamp_to_unix(final[k])
+        return final
+
+    def _projected_dict_factory(self, columns):
+        '''
+        Create the function which converts a row with only the given columns to a dict. This will
+        also convert timestamps back into unix time.
+        
+        @param columns: the columns of the rows in order
+        @type  columns: list
+        @return: the function which converts a row into a dict
+        @rtype:  function
+        '''
+        timestamps = [c for c in columns if c in self.timestamps]
+        def convert(entity):
+            final = dict(zip(columns, entity))
+            for k in timestamps:
+                final[k] = timestamp_to_unix(final[k])
+            return final
+        return convert
+
+class EmbeddedWorldObjectDescriptionConnection(WorldObjectDescriptionStorage):
+    '''
+    The EmbeddedWorldObjectDescriptionConnection object which reads and writes the descriptions of 
+    an EmbeddedStore. It has the same methods as the WorldObjectDescriptionConnection.
+    '''
+    
+    def __init__(self, store):
+        '''
+        Creates the EmbeddedWorldObjectDescriptionConnection object.
+        
+        @param store: the embedded store to use
+        @type  store: EmbeddedStore
+        '''
+        # columns of the descriptions
+        self._cols = ['description_id', 'name', 'tags']
+        # columns that tag search results can be ordered by
+        self._order_cols = ['name']
+        self.store = store
+        # functions to call with the description_id of each description written through this object
+        self._write_listeners = []
+        
+    def add_write_listener(self, callback):
+        '''
+        Add a function to call with the description_id of each description written through this 
+        object (e.g., to invalidate a cache).
+        
+        @param callback: the function to call with the description_id
+        @type  callback: function
+        '''
+        self._write_listeners.append(callback)
+
+    def insert(self, entity):
+        '''
+        Insert the given entity. This will create a new description. The description_id will be set
+        to a unique value and returned.
+        
+        @param entity: the entity to insert
+        @type  entity: dict
+        @return: the description_id
+        @rtype: int
+        '''
+        # ensure the description ID does not get set by the user
+        if 'description_id' in entity.keys():
+            del entity['description_id']
+        for k in entity.keys():
+            if k not in self._cols:
+                raise ValueError('Unknown column of ' + DESCRIPTIONS + ': ' + str(k))
+        with self.store.lock:
+            stored = dict.fromkeys(self._cols)
+            stored.update(_copy(entity))
+            stored['description_id'] = self.store.next_id(DESCRIPTIONS)
+            self.store.put_description(stored)
+            self.store.commit([_change(DESCRIPTIONS, INSERT, stored['description_id'], 
+                                       stored['tags'])])
+        self._written(stored['description_id'])
+        # return the description ID
+        return stored['description_id']
+
+    def search_description_id(self, description_id):
+        '''
+        Search for and return the entity with the given description_id, if one exists.
+        
+        @param description_id: the description_id field of the entity to search for
+        @type  description_id: int
+        @return: the entity found, or None if an invalid description_id was given
+        @rtype:  dict
+        '''
+        with self.store.lock:
+            entity = self.store.descriptions.get(description_id)
+        if entity is None:
+            return None
+        else:
+            return _copy(entity)
+
+    def search_description_ids(self, description_ids):
+        '''
+        Search for and return all entities with the given description_ids, if any.
+        
+        @param description_ids: the description_ids to search for
+        @type  description_ids: list
+        @return: the entities found keyed by description_id
+        @rtype:  dict
+        '''
+        final = {}
+        with self.store.lock:
+            for description_id in set(description_ids):
+                entity = self.store.descriptions.get(description_id)
+                if entity is not None:
+                    final[description_id] = _copy(entity)
+        return final
+        
+    def search_tags(self, tags, match=MATCH_ALL, order_by=None, descending=False, limit=0, 
+                    offset=0, after_id=0):
+        '''
+        Search for and return all entities that match the given list of tags. By default, entities 
+        must contain all of the tags and are ordered by their description_id.
+        
+        @param tags: the list of tags to search for
+        @type  tags: list
+        @param match: how to match the tags (MATCH_ALL, MATCH_ANY, or MATCH_NONE)
+        @type  match: int
+        @param order_by: the column to order by (name), or None to order by the description_id
+        @type  order_by: string
+        @param descending: if the results should be in descending order
+        @type  descending: bool
+        @param limit: the maximum number of entities to return, or 0 for no limit
+        @type  limit: int
+        @param offset: the number of entities to skip
+        @type  offset: int
+        @param after_id: only return entities after this description_id (requires ordering by 
+                         description_id)
+        @type  after_id: int
+        @return: the entities found
+        @rtype: list
+        '''
+        # do not search empty arrays
+        if len(tags) is 0:
+            return []
+        with self.store.lock:
+            found = [e for e in self.store.descriptions.values() 
+                     if tags_match(e['tags'], tags, match)]
+        found = page_entities(found, DESCRIPTIONS, 'description_id', order_by, self._order_cols,
+                              descending, limit, offset, after_id)
+        return [_copy(e) for e in found]
+    
+    def _written(self, description_id):
+        '''
+        Call each write listener with the given description_id.
+        
+        @param description_id: the description_id of the description written
+        @type  description_id: int
+        '''
+        for callback in self._write_listeners:
+            callback(description_id)
+
+class EmbeddedDescriptorConnection(DescriptorStorage):
+    '''
+    The EmbeddedDescriptorConnection object which reads and writes the descriptors of an 
+    EmbeddedStore. It has the same methods as the DescriptorConnection.
+    '''
+
+    def __init__(self, store):
+        '''
+        Creates the EmbeddedDescriptorConnection object.
+        
+        @param store: the embedded store to use
+        @type  store: EmbeddedStore
+        '''
+        # columns of the descriptors that can be written
+        self._cols = ['description_id', 'type', 'data', 'ref', 'tags', 'encoding']
+        self.store = store
+        # functions to call with the description_id of each descriptor written through this object
+        self._write_listeners = []
+
+    def add_write_listener(self, callback):
+        '''
+        Add a function to call with the description_id of each descriptor written through this 
+        object (e.g., to invalidate a cache).
+        
+        @param callback: the function to call with the description_id
+        @type  callback: function
+        '''
+        self._write_listeners.append(callback)
+
+    def insert(self, entity):
+        '''
+        Insert the given entity. This will create a new descriptor. The descriptor_id will be set 
+        to a unique value and returned. The content hash of the descriptor is stored with it, and 
+        if a descriptor with the same hash already exists, its data is shared.
+        
+        @param entity: the entity to insert with the correct keys for the columns
+        @type  entity: dict
+        @return: the descriptor_id
+        @rtype: integer
+        '''
+        # ensure the descriptor ID does not get set by the user
+        if 'descriptor_id' in entity.keys():
+            del entity['descriptor_id']
+        for k in entity.keys():
+            if k not in self._cols:
+                raise ValueError('Unknown column of ' + DESCRIPTORS + ': ' + str(k))
+        data = entity.get('data')
+        stored = dict.fromkeys(['description_id', 'type', 'ref', 'tags', 'encoding'])
+        stored.update(_copy(entity))
+        stored.pop('data', None)
+        # hash the contents
+        stored['data_hash'] = descriptor_hash(entity.get('type', ''), 
+                                              data if data is not None else '', 
+                                              entity.get('encoding', ''))
+        stored['data_size'] = len(data) if data is not None else None
+        with self.store.lock:
+            stored['descriptor_id'] = self.store.next_id(DESCRIPTORS)
+            self.store.put_descriptor(stored, data)
+            self.store.commit([_change(DESCRIPTORS, INSERT, stored['descriptor_id'], 
+                                       stored['tags'])])
+        self._written(stored['description_id'])
+        # return the descriptor ID
+        return stored['descriptor_id']
+    
+    def search_by_description_id(self, description_id, load_data=False):
+        '''
+        Search for and return all entities with the given description_id, if any. By default, only
+        the size of the data is returned and the data itself can be read with read_data.
+        
+        @param description_id: the description_id to search for
+        @type  description_id: int
+        @param load_data: if the data of each entity should be loaded
+        @type  load_data: bool
+        @return: the entities found
+        @rtype:  list
+        '''
+        return self.search_by_description_ids([description_id], load_data)[description_id]
+
+    def search_by_description_ids(self, description_ids, load_data=False):
+        '''
+        Search for and return all entities with any of the given description_ids.
+        
+        @param description_ids: the description_ids to search for
+        @type  description_ids: list
+        @param load_data: if the data of each entity should be loaded
+        @type  load_data: bool
+        @return: the entities found for each description_id (ordered by descriptor_id), keyed by 
+                 description_id
+        @rtype:  dict
+        '''
+        final = {}
+        with self.store.lock:
+            for description_id in description_ids:
+                found = [self.store.descriptors[i] 
+                         for i in self.store.by_description.get(description_id, [])]
+                final[description_id] = [self._db_to_dict(e, load_data) for e in found]
+        return final
+
+    def search_hash(self, data_hash):
+        '''
+        Search for and return all entities with the given content hash, if any. The data is not 
+        loaded.
+        
+        @param data_hash: the content hash to search for (see descriptor_hash)
+        @type  data_hash: string
+        @return: the entities found
+        @rtype:  list
+        '''
+        with self.store.lock:
+            found = [self.store.descriptors[i] for i in self.store.by_hash.get(data_hash, [])]
+            return [self._db_to_dict(e, False) for e in found]
+
+    def read_data(self, descriptor_id, offset=0, length=-1):
+        '''
+        Read the data of the entity with the given descriptor_id, if one exists. Only the requested
+        part of the data is copied.
+        
+        @param descriptor_id: the descriptor_id of the entity to read the data of
+        @type  descriptor_id: int
+        @param offset: the byte offset to start reading at
+        @type  offset: int
+        @param length: the maximum number of bytes to read, or -1 to read until the end
+        @type  length: int
+        @return: the data read and the total size of the data, or None if the entity was not found
+        @rtype:  tuple
+        '''
+        with self.store.lock:
+            entity = self.store.descriptors.get(descriptor_id)
+            if entity is None:
+                return None
+            elif entity['data_size'] is None:
+                return ('', 0)
+            data = self.store.data[entity['data_hash']]
+        size = len(data)
+        offset = min(offset, size)
+        data = data[offset:] if length < 0 else data[offset:offset + length]
+        self.store.stats.count('lobject.bytes', len(data))
+        return (data, size)
+    
+    def _written(self, description_id):
+        '''
+        Call each write listener with the given description_id.
+        
+        @param description_id: the description_id of the descriptor written
+        @type  description_id: int
+        '''
+        for callback in self._write_listeners:
+            callback(description_id)
+
+    def _db_to_dict(self, entity, load_data):
+        '''
+        Convert a stored entity to a dict in the same form as the DescriptorConnection. If the data
+        is not loaded, it is set to None. The lock must be held.
+        
+        @param entity: the stored entity
+        @type  entity: dict
+        @param load_data: if the data should be loaded
+        @type  load_data: bool
+        @return: the dictionary containing the information from the store
+        @rtype: dict
+        '''
+        data = None
+        if load_data and entity['data_size'] is not None:
+            data = self.store.data[entity['data_hash']]
+            self.store.stats.count('lobject.bytes', len(data))
+        final = {
+                'descriptor_id' : entity['descriptor_id'],
+                'description_id' : entity['description_id'],
+                'type' : entity['type'],
+                'data' : data,
+                'ref' : entity['ref'],
+                'tags' : _copy(entity['tags']),
+                'size' : entity['data_size'],
+                'encoding' : entity['encoding'],
+                }
+        return final
+
+class EmbeddedMapTileConnection(MapTileStorage):
+    '''
+    The EmbeddedMapTileConnection object which reads and writes the tiled maps of an EmbeddedStore.
+    It has the same methods as the MapTileConnection.
+    '''
+
+    def __init__(self, store):
+        '''
+        Creates the EmbeddedMapTileConnection object.
+        
+        @param store: the embedded store to use
+        @type  store: EmbeddedStore
+        '''
+        # columns of the tiled maps
+        self._cols = ['description_id', 'resolution', 'width', 'height', 'origin_position', 
+                      'origin_orientation', 'tile_size', 'levels']
+        self.store = store
+        # tiled maps are always available
+        self.available = True
+
+    def write_tiles(self, tile_set, tiles):
+        '''
+        Write the given tiles of a tiled map. The tiled map is created or updated first. If the map
+        shrank or its tile size changed, the tiles no longer covering the map are deleted.
+        
+        @param tile_set: the tiled map with the keys of the columns of the map_tile_sets table
+        @type  tile_set: dict
+        @param tiles: the (level, x, y, data) of each tile to write
+        @type  tiles: list
+        @return: the version of each tile after the write and the number of tiles that changed
+        @rtype:  tuple
+        '''
+        description_id = tile_set['description_id']
+        stored = dict([(c, _copy(tile_set[c])) for c in self._cols])
+        versions = []
+        written = 0
+        with self.store.lock:
+            old = self.store.tile_sets.get(description_id)
+            self.store.put_tile_set(stored)
+            existing = self.store.tiles[description_id]
+            if old is not None and old['tile_size'] != stored['tile_size']:
+                self.store.delete_tiles(description_id, existing.keys())
+            elif old is not None:
+                # the first cell of a tile at full resolution is at its index times its size
+                size = stored['tile_size']
+                self.store.delete_tiles(description_id, 
+                                        [(l, x, y) for l, x, y in existing.keys() 
+                                         if l >= stored['levels'] or 
+                                         (x * size) << l >= stored['width'] or 
+                                         (y * size) << l >= stored['height']])
+            for level, x, y, data in tiles:
+                version, current = existing.get((level, x, y), (0, None))
+                # tiles with the same cells are not rewritten (so keep their version)
+                if current != data:
+                    version += 1
+                    written += 1
+                    self.store.put_tile(description_id, (level, x, y), version, data)
+                versions.append(version)
+            self.store.commit([])
+        return (versions, written)
+
+    def search_tile_set(self, description_id):
+        '''
+        Search for and return the tiled map of the given description, if one exists.
+        
+        @param description_id: the description_id of the tiled map
+        @type  description_id: int
+        @return: the tiled map found, or None if the description has no tiled map
+        @rtype:  dict
+        '''
+        with self.store.lock:
+            entity = self.store.tile_sets.get(description_id)
+        if entity is None:
+            return None
+        else:
+            return _copy(entity)
+
+    def search_tiles(self, description_id, level, lo, hi):
+        '''
+        Search for and return the tiles of the given tiled map at the given level within the given
+        range of columns and rows.
+        
+        @param description_id: the description_id of the tiled map
+        @type  description_id: int
+        @param level: the level of the tiles
+        @type  level: int
+        @param lo: the first column and row
+        @type  lo: list
+        @param hi: the last column and row
+        @type  hi: list
+        @return: the (x, y, version, data) of each tile found
+        @rtype:  list
+        '''
+        final = []
+        with self.store.lock:
+            tiles = self.store.tiles.get(description_id, {})
+            for y in range(lo[1], hi[1] + 1):
+                for x in range(lo[0], hi[0] + 1):
+                    tile = tiles.get((level, x, y))
+                    if tile is not None:
+                        final.append((x, y, tile[0], tile[1]))
+        return final
+
+def _expires(entity):
+    '''
+    Check if an instance can expire, i.e., if it has an update time and an expected_ttl.
+    
+    @param entity: the stored instance
+    @type  entity: dict
+    @return: if the instance can expire
+    @rtype:  bool
+    '''
+    return entity['update'] is not None and (entity['expected_ttl'] or 0) > 0
+
+def _expiry_time(entity):
+    '''
+    Get the unix time an instance expires at, i.e., its update time plus its expected_ttl.
+    
+    @param entity: the stored instance
+    @type  entity: dict
+    @return: the expiry time
+    @rtype:  float
+    '''
+    return entity['update'] + entity['expected_ttl']
+
+def _operation(old, new):
+    '''
+    Get the type of change of an updated instance. Setting the perceived_end is an expiration.
+    
+    @param old: the instance before the update
+    @type  old: dict
+    @param new: the instance after the update
+    @type  new: dict
+    @return: the type of change
+    @rtype:  string
+    '''
+    if new['perceived_end'] is not None and old['perceived_end'] is None:
+        return EXPIRE
+    return UPDATE
+
+def _change(table, operation, key, tags):
+    '''
+    Create a change dictionary in the same form as the ChangeFeed.
+    
+    @param table: the name of the table
+    @type  table: string
+    @param operation: the type of change
+    @type  operation: string
+    @param key: the unique ID of the changed entity
+    @type  key: int
+    @param tags: the tags of the changed entity, or None
+    @type  tags: list
+    @return: the change dictionary
+    @rtype:  dict
+    '''
+    return {'table' : table, 'operation' : operation, 'id' : key, 'tags' : list(tags or [])}
+
+def _copy(value):
+    '''
+    Copy the lists in the given entity (or the given list) so stored entities are never changed by
+    the caller.
+    
+    @param value: the entity or list to copy
+    @type  value: dict
+    @return: the copy
+    @rtype:  dict
+    '''
+    if isinstance(value, dict):
+        return dict([(k, _copy(v)) for k, v in value.items()])
+    elif isinstance(value, list):
+        return list(value)
+    return value
+
+def _load(entity):
+    '''
+    Load an entity written to the SQLite file.
+    
+    @param entity: the JSON of the entity
+    @type  entity: string
+    @return: the entity with string keys
+    @rtype:  dict
+    '''
+    return dict([(str(k), v) for k, v in json.loads(entity).items()])
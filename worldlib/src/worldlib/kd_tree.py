@@ -0,0 +1,201 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2013, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+# * Neither the name of Willow Garage, Inc. nor the names of its
+# contributors may be used to endorse or promote products derived
+# from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+'''
+The KDTree class provides an in-process spatial index over points. It is used by worldlib to answer
+spatial queries when the database does not provide a spatial index.
+
+@author:  Russell Toris
+@version: April 22, 2013
+'''
+
+import heapq
+
+class KDTree(object):
+    '''
+    The main KDTree object which indexes a static set of points with keys.
+    '''
+
+    def __init__(self, points):
+        '''
+        Creates the KDTree object and builds the tree for the given points.
+        
+        @param points: the (point, key) pairs to index, where each point is a list of coordinates
+        @type  points: list
+        '''
+        self._dims = len(points[0][0]) if len(points) > 0 else 0
+        self._keys = set([key for point, key in points])
+        self._root = self._build(list(points), 0)
+
+    def has_key(self, key):
+        '''
+        Check if a point with the given key is indexed.
+        
+        @param key: the key to check
+        @type  key: object
+        @return: if the key is indexed
+        @rtype: bool
+        '''
+        return key in self._keys
+
+    def radius(self, center, radius):
+        '''
+        Find all keys with points within the given distance of the center point.
+        
+        @param center: the center point
+        @type  center: list
+        @param radius: the maximum distance
+        @type  radius: float
+        @return: the (distance, key) pairs found, sorted by distance
+        @rtype: list
+        '''
+        final = []
+        stack = [self._root]
+        while len(stack) > 0:
+            node = stack.pop()
+            if node is None:
+                continue
+            point, key, axis, left, right = node
+            d = self._distance(center, point)
+            if d <= radius:
+                final.append((d, key))
+            diff = center[axis] - point[axis]
+            # only visit the sides of the split the sphere reaches
+            if diff - radius <= 0:
+                stack.append(left)
+            if diff + radius >= 0:
+                stack.append(right)
+        final.sort()
+        return final
+
+    def box(self, lo, hi):
+        '''
+        Find all keys with points within the given axis-aligned box.
+        
+        @param lo: the minimum corner of the box
+        @type  lo: list
+        @param hi: the maximum corner of the box
+        @type  hi: list
+        @return: the keys found
+        @rtype: list
+        '''
+        final = []
+        stack = [self._root]
+        while len(stack) > 0:
+            node = stack.pop()
+            if node is None:
+                continue
+            point, key, axis, left, right = node
+            inside = True
+            for i in range(self._dims):
+                if point[i] < lo[i] or point[i] > hi[i]:
+                    inside = False
+                    break
+            if inside:
+                final.append(key)
+            # only visit the sides of the split the box reaches
+            if lo[axis] <= point[axis]:
+                stack.append(left)
+            if hi[axis] >= point[axis]:
+                stack.append(right)
+        return final
+
+    def nearest(self, center, k):
+        '''
+        Find the k keys with points nearest to the center point.
+        
+        @param center: the center point
+        @type  center: list
+        @param k: the number of keys to find
+        @type  k: int
+        @return: the (distance, key) pairs found, sorted by distance
+        @rtype: list
+        '''
+        if k <= 0:
+            return []
+        # max-heap (by negated distance) of the best k found so far
+        best = []
+        stack = [self._root]
+        while len(stack) > 0:
+            node = stack.pop()
+            if node is None:
+                continue
+            point, key, axis, left, right = node
+            d = self._distance(center, point)
+            if len(best) < k:
+                heapq.heappush(best, (-d, key))
+            elif d < -best[0][0]:
+                heapq.heapreplace(best, (-d, key))
+            diff = center[axis] - point[axis]
+            near, far = (left, right) if diff <= 0 else (right, left)
+            # visit the far side only if it could contain something closer (pushed first)
+            if len(best) < k or abs(diff) < -best[0][0]:
+                stack.append(far)
+            stack.append(near)
+        return sorted([(-d, key) for d, key in best])
+
+    def _build(self, points, depth):
+        '''
+        Recursively build the tree by splitting on the median of each axis in turn.
+        
+        @param points: the (point, key) pairs to build the tree for
+        @type  points: list
+        @param depth: the depth of the tree
+        @type  depth: int
+        @return: the node as a (point, key, axis, left, right) tuple or None if there are no points
+        @rtype: tuple
+        '''
+        if len(points) is 0:
+            return None
+        axis = depth % self._dims
+        points.sort(key=lambda p: p[0][axis])
+        median = len(points) // 2
+        return (points[median][0], points[median][1], axis, 
+                self._build(points[:median], depth + 1), 
+                self._build(points[median + 1:], depth + 1))
+
+    def _distance(self, a, b):
+        '''
+        Calculate the Euclidean distance between two points.
+        
+        @param a: the first point
+        @type  a: list
+        @param b: the second point
+        @type  b: list
+        @return: the distance
+        @rtype: float
+        '''
+        total = 0.0
+        for i in range(self._dims):
+            total += (a[i] - b[i]) ** 2
+        return total ** 0.5
@@ -0,0 +1,81 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2013, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+# * Neither the name of Willow Garage, Inc. nor the names of its
+# contributors may be used to endorse or promote products derived
+# from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+
+'''
+The legacy_maps module matches maps stored by map listeners before descriptors had an encoding. 
+Their descriptor data is the JSON of the whole OccupancyGrid (including its header and map load 
+time), so their content hash never matches the hash of the same map stored today. Such maps are 
+matched by their content instead.
+
+@author:  Russell Toris
+@version: May 16, 2013
+'''
+
+import json
+
+# the descriptor type of maps stored by map listeners
+OCCUPANCY_GRID = 'nav_msgs/OccupancyGrid'
+
+def is_legacy_map(descriptor):
+    '''
+    Check if the given descriptor is a map stored before descriptors had an encoding.
+    
+    @param descriptor: the descriptor to check (its data does not need to be loaded)
+    @type  descriptor: Descriptor
+    @return: if the descriptor is a legacy map
+    @rtype:  bool
+    '''
+    return descriptor.type == OCCUPANCY_GRID and len(descriptor.encoding) is 0
+
+def matches_legacy_map(data, msg):
+    '''
+    Check if the given data of a legacy map is the same map as the given OccupancyGrid message. 
+    Only the size, resolution, and cells are compared, as the old map listener did.
+    
+    @param data: the JSON data of the legacy map
+    @type  data: string
+    @param msg: the ROS message for the map
+    @type  msg: OccupancyGrid
+    @return: if the legacy map is the given map
+    @rtype:  bool
+    '''
+    try:
+        legacy = json.loads(data)
+        info = legacy['info']
+        return (info['width'] == msg.info.width and info['height'] == msg.info.height 
+                and info['resolution'] == msg.info.resolution 
+                and tuple(legacy['data']) == tuple(msg.data))
+    except (ValueError, KeyError, TypeError), e:
+        # not the JSON of an OccupancyGrid
+        return False
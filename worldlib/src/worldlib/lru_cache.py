@@ -0,0 +1,150 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2013, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+# * Neither the name of Willow Garage, Inc. nor the names of its
+# contributors may be used to endorse or promote products derived
+# from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+
+'''
+The LRUCache class is a thread-safe cache bounded by the total size in bytes of its values. When
+the cache is full, the least recently used values are evicted first.
+
+@author:  Russell Toris
+@version: May 2, 2013
+'''
+
+import collections
+import thread
+
+class LRUCache(object):
+    '''
+    The main LRUCache object. Hit, miss, and eviction counts are kept for monitoring.
+    '''
+
+    def __init__(self, max_bytes):
+        '''
+        Creates an empty LRUCache object.
+        
+        @param max_bytes: the maximum total size of the values in bytes, or 0 to disable the cache
+        @type  max_bytes: int
+        '''
+        self.max_bytes = max_bytes
+        # the total size of the values in bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # incremented on each invalidation so values read before it are not stored
+        self.version = 0
+        # the cached values as key : (value, size), least recently used first
+        self._entries = collections.OrderedDict()
+        # create a lock for the entries
+        self.lock = thread.allocate_lock()
+
+    def __len__(self):
+        '''
+        Get the number of values in the cache.
+        
+        @return: the number of values
+        @rtype:  int
+        '''
+        return len(self._entries)
+
+    def get(self, key):
+        '''
+        Get the value for the given key and mark it as the most recently used.
+        
+        @param key: the key to get
+        @type  key: object
+        @return: the value, or None if the key is not in the cache
+        @rtype:  object
+        '''
+        with self.lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size, version=None):
+        '''
+        Store the value for the given key, evicting the least recently used values as needed. To
+        avoid storing stale values, callers can pass the version of the cache from before the 
+        value was read. The value is then only stored if nothing was invalidated since.
+        
+        @param key: the key to store
+        @type  key: object
+        @param value: the value to store
+        @type  value: object
+        @param size: the size of the value in bytes
+        @type  size: int
+        @param version: the version of the cache before the value was read, if any
+        @type  version: int
+        @return: if the value was stored
+        @rtype:  bool
+        '''
+        with self.lock:
+            if size > self.max_bytes or (version is not None and version != self.version):
+                return False
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            # evict the least recently used values
+            while self.bytes + size > self.max_bytes:
+                evicted = self._entries.popitem(last=False)[1]
+                self.bytes -= evicted[1]
+                self.evictions += 1
+            self._entries[key] = (value, size)
+            self.bytes += size
+            return True
+
+    def invalidate(self, key):
+        '''
+        Remove the value for the given key, if any.
+        
+        @param key: the key to remove
+        @type  key: object
+        '''
+        with self.lock:
+            self.version += 1
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.bytes -= entry[1]
+
+    def clear(self):
+        '''
+        Remove all values from the cache. The counters are not reset.
+        '''
+        with self.lock:
+            self.version += 1
+            self._entries.clear()
+            self.bytes = 0
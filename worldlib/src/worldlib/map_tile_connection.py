@@ -0,0 +1,244 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2013, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+# * Neither the name of Willow Garage, Inc. nor the names of its
+# contributors may be used to endorse or promote products derived
+# from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+
+'''
+The MapTileConnection class reads and writes the tiles of the tiled occupancy grid maps in the 
+World Model database. Tiles are written in a single statement and only tiles whose cells changed
+are rewritten, which increments their version.
+
+@author:  Russell Toris
+@version: May 15, 2013
+'''
+
+from worldlib.connection_pool import ConnectionPool
+from worldlib.statements import execute
+from worldlib.storage_interface import MapTileStorage
+import psycopg2
+
+class MapTileConnection(MapTileStorage):
+    '''
+    The main MapTileConnection object which communicates with the PostgreSQL World Model database.
+    '''
+
+    def __init__(self, user=None, pwd=None, host='localhost', pool=None):
+        '''
+        Creates the MapTileConnection object. If a shared pool is given, the user, pwd, and host 
+        are ignored.
+        
+        @param user: the database username
+        @type  user: string
+        @param pwd: the database password
+        @type  pwd: string
+        @param host: the database hostname
+        @type  host: string
+        @param pool: the shared connection pool to use, if any
+        @type  pool: ConnectionPool
+        '''
+        # name of the tiled maps table
+        self._tile_sets = 'map_tile_sets'
+        # name of the map tiles table
+        self._tiles = 'map_tiles'
+        # columns of the tiled maps table in the order used by _db_to_dict
+        self._cols = ('description_id, resolution, width, height, origin_position, '
+                      + 'origin_orientation, tile_size, levels')
+        # connections to the world model database
+        self.pool = pool if pool is not None else ConnectionPool(user, pwd, host)
+        # check if the database has tiled maps
+        self.available = self._check_table(self._tiles)
+
+    def write_tiles(self, tile_set, tiles):
+        '''
+        Write the given tiles of a tiled map in one transaction. The tiled map is created or 
+        updated first. If the map shrank or its tile size changed, the tiles no longer covering the
+        map are deleted.
+        
+        @param tile_set: the tiled map with the keys of the columns of the map_tile_sets table
+        @type  tile_set: dict
+        @param tiles: the (level, x, y, data) of each tile to write
+        @type  tiles: list
+        @return: the version of each tile after the write and the number of tiles that changed
+        @rtype:  tuple
+        '''
+        description_id = tile_set['description_id']
+        with self.pool.connection() as conn:
+            # create a cursor
+            cur = conn.cursor()
+            execute(cur, 'tiles_set_lock', """SELECT """ + self._cols + """ FROM """ + 
+                    self._tile_sets + """ WHERE description_id = %s FOR UPDATE""", 
+                    (description_id,))
+            result = cur.fetchone()
+            if result is not None:
+                old = self._db_to_dict(result)
+                if old['tile_size'] != tile_set['tile_size']:
+                    execute(cur, 'tiles_delete', """DELETE FROM """ + self._tiles + 
+                            """ WHERE description_id = %s""", (description_id,))
+                elif old['width'] > tile_set['width'] or old['height'] > tile_set['height']:
+                    # the first cell of a tile at full resolution is at its index times its size
+                    execute(cur, 'tiles_crop', """DELETE FROM """ + self._tiles + """ 
+                            WHERE description_id = %s AND (level >= %s 
+                                OR x::bigint * %s * (1::bigint << level) >= %s 
+                                OR y::bigint * %s * (1::bigint << level) >= %s)""", 
+                            (description_id, tile_set['levels'], tile_set['tile_size'], 
+                             tile_set['width'], tile_set['tile_size'], tile_set['height']))
+            execute(cur, 'tiles_set_upsert', """INSERT INTO """ + self._tile_sets + """ 
+                        (""" + self._cols + """, update) 
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, now()) 
+                    ON CONFLICT (description_id) DO UPDATE SET 
+                        resolution = EXCLUDED.resolution, width = EXCLUDED.width, 
+                        height = EXCLUDED.height, origin_position = EXCLUDED.origin_position, 
+                        origin_orientation = EXCLUDED.origin_orientation, 
+                        tile_size = EXCLUDED.tile_size, levels = EXCLUDED.levels, 
+                        update = EXCLUDED.update""", 
+                    tuple([tile_set[c] for c in self._cols.split(', ')]))
+            versions = {}
+            written = 0
+            if len(tiles) > 0:
+                # tiles with the same cells are not rewritten (so keep their version)
+                execute(cur, 'tiles_upsert', """INSERT INTO """ + self._tiles + """ 
+                            (description_id, level, x, y, version, data, update) 
+                        SELECT %s::bigint, t.level, t.x, t.y, 1, t.data, now() 
+                        FROM unnest(%s::smallint[], %s::integer[], %s::integer[], %s::bytea[]) 
+                            AS t (level, x, y, data) 
+                        ON CONFLICT (description_id, level, x, y) DO UPDATE SET 
+                            version = """ + self._tiles + """.version + 1, data = EXCLUDED.data, 
+                            update = EXCLUDED.update 
+                        WHERE """ + self._tiles + """.data <> EXCLUDED.data 
+                        RETURNING level, x, y, version""", 
+                        (description_id, [t[0] for t in tiles], [t[1] for t in tiles], 
+                         [t[2] for t in tiles], [psycopg2.Binary(t[3]) for t in tiles]))
+                for level, x, y, version in cur.fetchall():
+                    versions[(level, x, y)] = version
+                written = len(versions)
+                # find the versions of the unchanged tiles
+                unchanged = [t for t in tiles if (t[0], t[1], t[2]) not in versions]
+                if len(unchanged) > 0:
+                    execute(cur, 'tiles_versions', """SELECT level, x, y, version FROM """ + 
+                            self._tiles + """ JOIN unnest(%s::smallint[], %s::integer[], 
+                                %s::integer[]) AS t (level, x, y) USING (level, x, y) 
+                            WHERE description_id = %s""", 
+                            ([t[0] for t in unchanged], [t[1] for t in unchanged], 
+                             [t[2] for t in unchanged], description_id))
+                    for level, x, y, version in cur.fetchall():
+                        versions[(level, x, y)] = version
+            conn.commit()
+            cur.close()
+        return ([versions.get((t[0], t[1], t[2]), 0) for t in tiles], written)
+
+    def search_tile_set(self, description_id):
+        '''
+        Search for and return the tiled map of the given description, if one exists.
+        
+        @param description_id: the description_id of the tiled map
+        @type  description_id: int
+        @return: the tiled map found, or None if the description has no tiled map
+        @rtype:  dict
+        '''
+        with self.pool.connection(read_only=True) as conn:
+            # create a cursor
+            cur = conn.cursor()
+            execute(cur, 'tiles_set_get', """SELECT """ + self._cols + """ FROM """ + 
+                    self._tile_sets + """ WHERE description_id = %s""", (description_id,))
+            result = cur.fetchone()
+            cur.close()
+        if result is None:
+            return None
+        else:
+            return self._db_to_dict(result)
+
+    def search_tiles(self, description_id, level, lo, hi):
+        '''
+        Search for and return the tiles of the given tiled map at the given level within the given
+        range of columns and rows.
+        
+        @param description_id: the description_id of the tiled map
+        @type  description_id: int
+        @param level: the level of the tiles
+        @type  level: int
+        @param lo: the first column and row
+        @type  lo: list
+        @param hi: the last column and row
+        @type  hi: list
+        @return: the (x, y, version, data) of each tile found
+        @rtype:  list
+        '''
+        with self.pool.connection(read_only=True) as conn:
+            # create a cursor
+            cur = conn.cursor()
+            execute(cur, 'tiles_get', """SELECT x, y, version, data FROM """ + self._tiles + """ 
+                    WHERE description_id = %s AND level = %s AND x BETWEEN %s AND %s 
+                    AND y BETWEEN %s AND %s ORDER BY y, x""", 
+                    (description_id, level, lo[0], hi[0], lo[1], hi[1]))
+            final = [(r[0], r[1], r[2], str(r[3])) for r in cur.fetchall()]
+            cur.close()
+        return final
+
+    def _check_table(self, table):
+        '''
+        Check if the given table exists.
+        
+        @param table: the name of the table
+        @type  table: string
+        @return: if the table exists
+        @rtype: bool
+        '''
+        with self.pool.connection() as conn:
+            # create a cursor
+            cur = conn.cursor()
+            cur.execute("""SELECT table_name FROM information_schema.tables 
+                        WHERE table_name = %s""", (table,))
+            result = len(cur.fetchall()) > 0
+            cur.close()
+        return result
+
+    def _db_to_dict(self, entity):
+        '''
+        Convert a database tuple to a dict. This function assumes the tuple is in the correct order.
+        
+        @param entity: the entity to build the dictionary for
+        @type  entity: tuple
+        @return: the dictionary containing the information from the database
+        @rtype: dict
+        '''
+        # convert each one assuming the ordering is correct
+        final = {
+                'description_id' : entity[0],
+                'resolution' : entity[1],
+                'width' : entity[2],
+                'height' : entity[3],
+                'origin_position' : entity[4],
+                'origin_orientation' : entity[5],
+                'tile_size' : entity[6],
+                'levels' : entity[7],
+                }
+        return final
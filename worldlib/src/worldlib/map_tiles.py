@@ -0,0 +1,235 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2013, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+# * Neither the name of Willow Garage, Inc. nor the names of its
+# contributors may be used to endorse or promote products derived
+# from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+
+'''
+The map_tiles module splits occupancy grids into fixed size tiles and builds a resolution pyramid
+from them. Each level of the pyramid halves the resolution of the level below it and a cell is as
+occupied as the most occupied of the cells it covers (unknown only if they are all unknown). Tiles
+are byte strings of signed occupancies in row-major order and are always full, with the cells 
+outside of the map unknown.
+
+@author:  Russell Toris
+@version: May 15, 2013
+'''
+
+from array import array
+
+# the occupancy of unknown cells
+UNKNOWN = -1
+
+def pyramid_levels(width, height, tile_size):
+    '''
+    Get the number of levels of the pyramid of a map. The highest level fits in a single tile.
+    
+    @param width: the width of the map at full resolution in cells
+    @type  width: int
+    @param height: the height of the map at full resolution in cells
+    @type  height: int
+    @param tile_size: the width and height of each tile in cells
+    @type  tile_size: int
+    @return: the number of levels
+    @rtype:  int
+    '''
+    levels = 1
+    while max(width, height) > tile_size << (levels - 1):
+        levels += 1
+    return levels
+
+def level_size(size, level):
+    '''
+    Get the width or height in cells of a map at the given level.
+    
+    @param size: the width or height at full resolution in cells
+    @type  size: int
+    @param level: the level
+    @type  level: int
+    @return: the width or height at the level
+    @rtype:  int
+    '''
+    return (size + (1 << level) - 1) >> level
+
+def build_pyramid(cells, width, height, tile_size, previous=None):
+    '''
+    Build all tiles of the pyramid of the given map. If the tiles of the previous version of the 
+    map (with the same size and tile size) are given, only the tiles above changed tiles are 
+    downsampled again.
+    
+    @param cells: the occupancy of each cell of the map in row-major order (e.g., the data of an 
+                  OccupancyGrid)
+    @type  cells: list
+    @param width: the width of the map in cells
+    @type  width: int
+    @param height: the height of the map in cells
+    @type  height: int
+    @param tile_size: the width and height of each tile in cells (an even number)
+    @type  tile_size: int
+    @param previous: the tiles of the previous version of the map, if any
+    @type  previous: dict
+    @return: the tiles as (level, x, y) : data, and the set of keys of the tiles that changed
+    @rtype:  tuple
+    '''
+    if previous is None:
+        previous = {}
+    tiles = {}
+    changed = set()
+    cells = array('b', cells)
+    pad = array('b', [UNKNOWN]) * tile_size
+    # split the map into tiles
+    for y in range(_tile_count(height, tile_size)):
+        for x in range(_tile_count(width, tile_size)):
+            x0 = x * tile_size
+            x1 = min(x0 + tile_size, width)
+            tile = array('b')
+            for row in range(y * tile_size, (y + 1) * tile_size):
+                if row < height:
+                    tile.extend(cells[row * width + x0:row * width + x1])
+                    tile.extend(pad[:tile_size - (x1 - x0)])
+                else:
+                    tile.extend(pad)
+            _add_tile(tiles, changed, previous, (0, x, y), tile.tostring())
+    # downsample the tiles above the changed tiles of each level
+    for level in range(1, pyramid_levels(width, height, tile_size)):
+        columns = _tile_count(level_size(width, level), tile_size)
+        rows = _tile_count(level_size(height, level), tile_size)
+        dirty = set([(x / 2, y / 2) for l, x, y in changed if l == level - 1])
+        for y in range(rows):
+            for x in range(columns):
+                key = (level, x, y)
+                if (x, y) in dirty or key not in previous:
+                    children = [[tiles.get((level - 1, 2 * x + i, 2 * y + j)) for i in (0, 1)] 
+                                for j in (0, 1)]
+                    _add_tile(tiles, changed, previous, key, downsample(children, tile_size))
+                else:
+                    tiles[key] = previous[key]
+    return (tiles, changed)
+
+def downsample(children, tile_size):
+    '''
+    Downsample the four tiles below a tile in the pyramid into the tile.
+    
+    @param children: the lower left, lower right, upper left, and upper right tiles as 
+                     [[lower left, lower right], [upper left, upper right]] (None if outside of the
+                     map)
+    @type  children: list
+    @param tile_size: the width and height of each tile in cells
+    @type  tile_size: int
+    @return: the tile
+    @rtype:  string
+    '''
+    half = tile_size / 2
+    unknown = array('b', [UNKNOWN]) * (tile_size * tile_size)
+    children = [[array('b', c) if c is not None else unknown for c in row] for row in children]
+    tile = array('b')
+    for row in range(tile_size):
+        # each row of the tile covers two rows of the lower or the upper children
+        below = 2 * (row % half) * tile_size
+        for child in children[row / half]:
+            a = child[below:below + tile_size]
+            b = child[below + tile_size:below + 2 * tile_size]
+            tile.extend(map(max, a[0::2], a[1::2], b[0::2], b[1::2]))
+    return tile.tostring()
+
+def assemble(tiles, tile_size, x0, y0, width, height):
+    '''
+    Assemble the cells of the given window of a level of a map from its tiles. Cells of missing 
+    tiles are unknown.
+    
+    @param tiles: the tiles covering the window as (x, y) : data
+    @type  tiles: dict
+    @param tile_size: the width and height of each tile in cells
+    @type  tile_size: int
+    @param x0: the first column of the window in cells
+    @type  x0: int
+    @param y0: the first row of the window in cells
+    @type  y0: int
+    @param width: the width of the window in cells
+    @type  width: int
+    @param height: the height of the window in cells
+    @type  height: int
+    @return: the occupancy of each cell of the window in row-major order
+    @rtype:  array
+    '''
+    cells = array('b')
+    unknown = array('b', [UNKNOWN]) * tile_size
+    for row in range(y0, y0 + height):
+        ty = row / tile_size
+        start = (row % tile_size) * tile_size
+        x = x0
+        while x < x0 + width:
+            tx = x / tile_size
+            # the part of this tile in the window
+            end = min((tx + 1) * tile_size, x0 + width)
+            data = tiles.get((tx, ty))
+            if data is None:
+                cells.extend(unknown[:end - x])
+            else:
+                offset = start + x - tx * tile_size
+                cells.fromstring(data[offset:offset + end - x])
+            x = end
+    return cells
+
+def _tile_count(size, tile_size):
+    '''
+    Get the number of tiles needed to cover the given number of cells.
+    
+    @param size: the number of cells
+    @type  size: int
+    @param tile_size: the width and height of each tile in cells
+    @type  tile_size: int
+    @return: the number of tiles
+    @rtype:  int
+    '''
+    return (size + tile_size - 1) / tile_size
+
+def _add_tile(tiles, changed, previous, key, data):
+    '''
+    Add a tile to the pyramid, marking it as changed if it differs from the previous tile.
+    
+    @param tiles: the tiles of the pyramid
+    @type  tiles: dict
+    @param changed: the keys of the changed tiles
+    @type  changed: set
+    @param previous: the tiles of the previous version of the map
+    @type  previous: dict
+    @param key: the (level, x, y) of the tile
+    @type  key: tuple
+    @param data: the cells of the tile
+    @type  data: string
+    '''
+    if previous.get(key) != data:
+        changed.add(key)
+        tiles[key] = data
+    else:
+        # share the unchanged string
+        tiles[key] = previous[key]
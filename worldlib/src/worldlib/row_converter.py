@@ -0,0 +1,262 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2013, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+# * Neither the name of Willow Garage, Inc. nor the names of its
+# contributors may be used to endorse or promote products derived
+# from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+
+'''
+The row_converter module generates converters between database rows and ROS messages. Each 
+converter is generated once from a list of fields and then fills the message slots (or entity 
+columns) directly, without intermediate dictionaries. Timestamps are converted arithmetically.
+Converters can also be generated for only some of the fields (see project_fields). Nothing here 
+depends on psycopg2, so the embedded store can use the timestamp conversions too.
+
+@author:  Russell Toris
+@version: May 16, 2013
+'''
+
+import datetime
+
+# copy the value as is
+VALUE = 0
+# copy the value as is, even if it is empty (only differs when converting messages to entities)
+REQUIRED = 1
+# a timestamp with time zone column and a ROS time field
+TIME = 2
+# a number of seconds column and a ROS duration field
+DURATION = 3
+# an array column of X, Y, Z and a point field
+POINT = 4
+# an array column of X, Y, Z, W and a quaternion field
+QUATERNION = 5
+# an array column and a list field (left out of entities if it is empty)
+LIST = 6
+# an array column and a fixed size array field
+ARRAY = 7
+
+# the columns and fields of a WorldObjectInstance as (column, field, kind)
+INSTANCE_FIELDS = [('instance_id', 'instance_id', VALUE),
+                   ('name', 'name', VALUE),
+                   ('creation', 'creation', TIME),
+                   ('update', 'update', TIME),
+                   ('expected_ttl', 'expected_ttl', DURATION),
+                   ('perceived_end', 'perceived_end', TIME),
+                   ('source_origin', 'source.origin', VALUE),
+                   ('source_creator', 'source.creator', VALUE),
+                   ('pose_seq', 'pose.header.seq', REQUIRED),
+                   ('pose_stamp', 'pose.header.stamp', TIME),
+                   ('pose_frame_id', 'pose.header.frame_id', VALUE),
+                   ('pose_position', 'pose.pose.pose.position', POINT),
+                   ('pose_orientation', 'pose.pose.pose.orientation', QUATERNION),
+                   ('pose_covariance', 'pose.pose.covariance', ARRAY),
+                   ('description_id', 'description_id', VALUE),
+                   ('properties', 'properties', LIST),
+                   ('tags', 'tags', LIST)]
+
+class UTC(datetime.tzinfo):
+    '''
+    The UTC time zone (timestamps read from the database may use any time zone).
+    '''
+
+    def utcoffset(self, dt):
+        '''
+        Get the offset of the time zone from UTC.
+        
+        @param dt: the datetime
+        @type  dt: datetime
+        @return: no offset
+        @rtype:  timedelta
+        '''
+        return datetime.timedelta(0)
+
+    def tzname(self, dt):
+        '''
+        Get the name of the time zone.
+        
+        @param dt: the datetime
+        @type  dt: datetime
+        @return: the name
+        @rtype:  string
+        '''
+        return 'UTC'
+
+    def dst(self, dt):
+        '''
+        Get the daylight saving time adjustment of the time zone.
+        
+        @param dt: the datetime
+        @type  dt: datetime
+        @return: no adjustment
+        @rtype:  timedelta
+        '''
+        return datetime.timedelta(0)
+
+# the start of unix time
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=UTC())
+
+def timestamp_to_unix(ts):
+    '''
+    Convert a timestamp with time zone into unix time.
+    
+    @param ts: the timestamp, or None
+    @type  ts: datetime
+    @return: the unix time, or None
+    @rtype:  float
+    '''
+    if ts is None:
+        return None
+    d = ts - _EPOCH
+    return d.days * 86400 + d.seconds + d.microseconds / 1000000.0
+
+def unix_to_timestamp(t):
+    '''
+    Convert unix time into a timestamp with time zone which can be bound as a parameter.
+    
+    @param t: the unix time, or None
+    @type  t: float
+    @return: the timestamp (in UTC), or None
+    @rtype:  datetime
+    '''
+    if t is None:
+        return None
+    return _EPOCH + datetime.timedelta(seconds=t)
+
+def project_fields(fields, mask):
+    '''
+    Get the fields selected by the given field mask, in their original order. Each name in the mask
+    selects the field with that name and all of the fields within it (e.g., 'pose' selects every 
+    field of the pose). Naming part of a field (e.g., 'pose.pose.pose.position.x') selects the 
+    whole field.
+    
+    @param fields: the fields to select from as (column, field, kind)
+    @type  fields: list
+    @param mask: the names of the fields to select, or an empty list for all of the fields
+    @type  mask: list
+    @return: the fields selected as (column, field, kind)
+    @rtype:  list
+    '''
+    if len(mask) is 0:
+        return list(fields)
+    selected = set()
+    for name in mask:
+        matched = [f for f in fields if f[1] == name or f[1].startswith(name + '.') or 
+                   name.startswith(f[1] + '.')]
+        if len(matched) is 0:
+            raise ValueError('Unknown field: ' + str(name))
+        selected.update(matched)
+    return [f for f in fields if f in selected]
+
+def build_row_converter(msg_class, fields, columns):
+    '''
+    Generate a function which converts a database row into a new message. Columns which are NULL
+    are left at the default value of their field.
+    
+    @param msg_class: the class of the message to create
+    @type  msg_class: class
+    @param fields: the fields to convert as (column, field, kind)
+    @type  fields: list
+    @param columns: the columns of the rows in order
+    @type  columns: list
+    @return: the function which converts a row tuple into a message
+    @rtype:  function
+    '''
+    lines = ['def convert(row):', '    msg = msg_class()']
+    for column, field, kind in fields:
+        target = 'msg.' + field
+        lines.append('    v = row[%d]' % columns.index(column))
+        lines.append('    if v is not None:')
+        if kind == TIME:
+            lines.append('        d = v - _EPOCH')
+            lines.append('        %s.secs = d.days * 86400 + d.seconds' % target)
+            lines.append('        %s.nsecs = d.microseconds * 1000' % target)
+        elif kind == DURATION:
+            lines.append('        %s.secs = int(v)' % target)
+            lines.append('        %s.nsecs = int((v - int(v)) * 1000000000)' % target)
+        elif kind == POINT:
+            lines.append('        %s.x, %s.y, %s.z = v' % (target, target, target))
+        elif kind == QUATERNION:
+            lines.append('        %s.x, %s.y, %s.z, %s.w = v' % (target, target, target, target))
+        else:
+            lines.append('        %s = v' % target)
+    lines.append('    return msg')
+    return _compile(lines, {'msg_class' : msg_class, '_EPOCH' : _EPOCH})
+
+def build_entity_converter(fields):
+    '''
+    Generate a function which converts a message into an entity dictionary that can be written 
+    with the worldlib API. Empty fields and zero times are left out (unless they are REQUIRED or an
+    ARRAY).
+    
+    @param fields: the fields to convert as (column, field, kind)
+    @type  fields: list
+    @return: the function which converts a message into an entity dictionary
+    @rtype:  function
+    '''
+    lines = ['def convert(msg):', '    entity = {}']
+    for column, field, kind in fields:
+        source = 'msg.' + field
+        if kind == TIME or kind == DURATION:
+            lines.append('    v = ' + source)
+            lines.append('    if v.secs + v.nsecs > 0:')
+            lines.append("        entity['%s'] = v.secs + (v.nsecs / 1000000000.0)" % column)
+        elif kind == POINT:
+            lines.append("    entity['%s'] = [%s.x, %s.y, %s.z]" % (column, source, source, source))
+        elif kind == QUATERNION:
+            lines.append("    v = " + source)
+            lines.append("    entity['%s'] = [v.x, v.y, v.z, v.w]" % column)
+        elif kind == LIST:
+            lines.append('    v = ' + source)
+            lines.append('    if len(v) > 0:')
+            lines.append("        entity['%s'] = list(v)" % column)
+        elif kind == ARRAY:
+            lines.append("    entity['%s'] = list(%s)" % (column, source))
+        elif kind == REQUIRED:
+            lines.append("    entity['%s'] = %s" % (column, source))
+        else:
+            lines.append('    v = ' + source)
+            lines.append('    if v:')
+            lines.append("        entity['%s'] = v" % column)
+    lines.append('    return entity')
+    return _compile(lines, {})
+
+def _compile(lines, namespace):
+    '''
+    Compile the generated source of a convert function.
+    
+    @param lines: the lines of the source
+    @type  lines: list
+    @param namespace: the global names used by the source
+    @type  namespace: dict
+    @return: the compiled convert function
+    @rtype:  function
+    '''
+    exec compile('\n'.join(lines), '<row_converter>', 'exec') in namespace
+    return namespace['convert']
@@ -0,0 +1,146 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2013, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+# * Neither the name of Willow Garage, Inc. nor the names of its
+# contributors may be used to endorse or promote products derived
+# from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+
+'''
+The statements module runs the SQL of the worldlib connections as server-side prepared statements.
+Each statement is prepared once per connection and then executed by name, so PostgreSQL does not
+parse and plan it again on every call. Statements are named by a prefix for the operation and a 
+digest of their SQL, so each distinct shape (e.g., an update of only the pose columns) gets its own
+statement.
+
+@author:  Russell Toris
+@version: May 6, 2013
+'''
+
+import psycopg2.extensions
+import hashlib
+import re
+
+# the maximum number of statements prepared on a single connection (others are run directly)
+MAX_PREPARED = 256
+
+class StatementConnection(psycopg2.extensions.connection):
+    '''
+    A connection which keeps track of the statements prepared on it. This is used as the 
+    connection_factory of the ConnectionPool.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        '''
+        Creates the StatementConnection object. All arguments are passed to the connection.
+        '''
+        super(StatementConnection, self).__init__(*args, **kwargs)
+        # names of the statements prepared on this connection
+        self.prepared = set()
+        # the instrumentation statements are timed with, if any (set by the ConnectionPool)
+        self.stats = None
+        # the number of transactions committed on this connection
+        self.commits = 0
+
+    def commit(self):
+        '''
+        Commit the current transaction and count it.
+        '''
+        super(StatementConnection, self).commit()
+        self.commits += 1
+
+def execute(cur, prefix, sql, values=()):
+    '''
+    Execute the given SQL as a prepared statement, preparing it first if needed. The SQL uses the
+    same '%s' place holders as cursor.execute. Connections that are not StatementConnections run
+    the SQL directly. If the connection has a Stats object, the statement is timed as 'sql.' + 
+    prefix and the rows it returned or changed are counted.
+    
+    @param cur: the cursor to execute with
+    @type  cur: cursor
+    @param prefix: the prefix of the statement name (e.g., 'woi_insert')
+    @type  prefix: string
+    @param sql: the SQL of the statement
+    @type  sql: string
+    @param values: the values of the place holders
+    @type  values: tuple
+    '''
+    stats = getattr(cur.connection, 'stats', None)
+    if stats is None:
+        _execute(cur, prefix, sql, values)
+        return
+    with stats.time('sql.' + prefix, sql):
+        _execute(cur, prefix, sql, values)
+    stats.count('sql.' + prefix + '.rows', max(cur.rowcount, 0))
+
+def _execute(cur, prefix, sql, values):
+    '''
+    Execute the given SQL as a prepared statement (see execute).
+    
+    @param cur: the cursor to execute with
+    @type  cur: cursor
+    @param prefix: the prefix of the statement name
+    @type  prefix: string
+    @param sql: the SQL of the statement
+    @type  sql: string
+    @param values: the values of the place holders
+    @type  values: tuple
+    '''
+    prepared = getattr(cur.connection, 'prepared', None)
+    name = prefix + '_' + hashlib.md5(sql).hexdigest()[:16]
+    if prepared is None or (name not in prepared and len(prepared) >= MAX_PREPARED):
+        cur.execute(sql, values)
+        return
+    if name not in prepared:
+        # prepared statements last for the session, even if the transaction is rolled back
+        cur.execute('PREPARE ' + name + ' AS ' + _number_place_holders(sql))
+        prepared.add(name)
+    if len(values) is 0:
+        cur.execute('EXECUTE ' + name)
+    else:
+        cur.execute('EXECUTE ' + name + ' (' + ', '.join(['%s'] * len(values)) + ')', 
+                    tuple(values))
+
+def _number_place_holders(sql):
+    '''
+    Convert the '%s' place holders of the given SQL into the numbered parameters of a prepared 
+    statement (i.e., $1, $2, ...).
+    
+    @param sql: the SQL to convert
+    @type  sql: string
+    @return: the converted SQL
+    @rtype:  string
+    '''
+    count = [0]
+    def replace(m):
+        if m.group(0) == '%%':
+            return '%'
+        count[0] += 1
+        return '$' + str(count[0])
+    return re.sub(r'%%|%s', replace, sql)
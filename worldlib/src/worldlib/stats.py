@@ -0,0 +1,204 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2013, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+# * Neither the name of Willow Garage, Inc. nor the names of its
+# contributors may be used to endorse or promote products derived
+# from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+'''
+The Stats class collects timing histograms and counters from the worldlib connections and the 
+world_model node. Histograms are rolling: they are reset each time a snapshot is taken, while the
+counters keep counting. Timings over the slow threshold are also handed to an optional slow log.
+
+@author:  Russell Toris
+@version: May 10, 2013
+'''
+
+import bisect
+import thread
+import time
+from contextlib import contextmanager
+
+# the upper bounds of the histogram buckets in seconds (the last bucket has no bound)
+BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+           2.5, 5.0, 10.0]
+
+class Histogram(object):
+    '''
+    A histogram of durations with fixed, roughly logarithmic buckets.
+    '''
+
+    def __init__(self):
+        '''
+        Creates an empty Histogram object.
+        '''
+        # the number of durations in each bucket (the last is for durations over every bound)
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        '''
+        Add the given duration to the histogram.
+        
+        @param seconds: the duration in seconds
+        @type  seconds: float
+        '''
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p):
+        '''
+        Estimate the given percentile as the upper bound of the bucket it falls in.
+        
+        @param p: the percentile (e.g., 95)
+        @type  p: float
+        @return: the estimated duration in seconds, or 0 if the histogram is empty
+        @rtype:  float
+        '''
+        if self.count is 0:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+class Stats(object):
+    '''
+    The main Stats object. Timings and counters are kept by name (e.g., 'sql.woi_tag_search').
+    '''
+
+    def __init__(self, slow_threshold=0.0, slow_log=None):
+        '''
+        Creates an empty Stats object.
+        
+        @param slow_threshold: the duration in seconds over which timings are slow, or 0 to never
+                               log slow timings
+        @type  slow_threshold: float
+        @param slow_log: the function to call with the name, duration, and detail of slow timings
+        @type  slow_log: function
+        '''
+        self.slow_threshold = slow_threshold
+        self.slow_log = slow_log
+        # the rolling histograms as name : Histogram
+        self._histograms = {}
+        # the counters as name : value
+        self._counters = {}
+        # the start of the current histogram window
+        self._since = time.time()
+        # create a lock for the histograms and counters
+        self.lock = thread.allocate_lock()
+
+    @contextmanager
+    def time(self, name, detail=None):
+        '''
+        Time the duration of a with block. Errors raised in the block are counted as name + 
+        '.errors' and re-raised.
+        
+        @param name: the name of the timing
+        @type  name: string
+        @param detail: the detail given to the slow log (e.g., the SQL), if any
+        @type  detail: string
+        '''
+        start = time.time()
+        try:
+            yield
+        except:
+            self.count(name + '.errors')
+            raise
+        finally:
+            self.observe(name, time.time() - start, detail)
+
+    def observe(self, name, seconds, detail=None):
+        '''
+        Add the given duration to the histogram with the given name and count the call.
+        
+        @param name: the name of the timing
+        @type  name: string
+        @param seconds: the duration in seconds
+        @type  seconds: float
+        @param detail: the detail given to the slow log (e.g., the SQL), if any
+        @type  detail: string
+        '''
+        with self.lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.add(seconds)
+            self._counters[name + '.calls'] = self._counters.get(name + '.calls', 0) + 1
+        if self.slow_log is not None and self.slow_threshold > 0 and seconds > self.slow_threshold:
+            self.slow_log(name, seconds, detail)
+
+    def count(self, name, n=1):
+        '''
+        Add to the counter with the given name.
+        
+        @param name: the name of the counter (e.g., 'lobject.bytes')
+        @type  name: string
+        @param n: the amount to add
+        @type  n: int
+        '''
+        with self.lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def set(self, name, value):
+        '''
+        Set the counter with the given name (e.g., to a count kept elsewhere).
+        
+        @param name: the name of the counter
+        @type  name: string
+        @param value: the value
+        @type  value: int
+        '''
+        with self.lock:
+            self._counters[name] = value
+
+    def snapshot(self):
+        '''
+        Get the histograms since the last snapshot and the current counters. The histograms are 
+        reset.
+        
+        @return: the length of the window in seconds, the histograms as name : Histogram, and the 
+                 counters as name : value
+        @rtype:  tuple
+        '''
+        now = time.time()
+        with self.lock:
+            histograms = self._histograms
+            self._histograms = {}
+            counters = dict(self._counters)
+            period = now - self._since
+            self._since = now
+        return (period, histograms, counters)
@@ -0,0 +1,508 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2013, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+# * Neither the name of Willow Garage, Inc. nor the names of its
+# contributors may be used to endorse or promote products derived
+# from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+
+
+'''
+The storage_interface module defines the interface of the storage backends of worldlib. Each kind 
+of entity has an abstract base class which both the PostgreSQL connections and the connections of
+the embedded store (see embedded_store) implement, and the world_model node only relies on the 
+methods and attributes defined here. Entities are dictionaries keyed by column with times in unix 
+time. The behavior every backend must share is checked by test/test_storage_interface.py.
+
+@author:  Russell Toris
+@version: May 16, 2013
+'''
+
+from worldlib.tag_search import MATCH_ALL
+import abc
+
+class WorldObjectInstanceStorage(object):
+    '''
+    The interface of the storage of world object instances. Besides the methods below, each 
+    implementation has the following attributes:
+     - columns: the columns of an instance, in the order of its rows
+     - row_factory: the function used to convert each row found (dicts by default)
+     - projection_factory: the function which creates the row factory of a search for only some 
+       of the columns (given those columns in order)
+     - history: if expired instances are archived (and can be searched)
+     - pose_history: if the poses of the instances are recorded on each write
+    '''
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def insert(self, entity):
+        '''
+        Insert the given entity as a new instance. If no other instance holds the tag_key of its 
+        tags, the new instance holds it (so it is updated by upserts with the same tags).
+        
+        @param entity: the entity to insert with the correct keys for the columns
+        @type  entity: dict
+        @return: the new instance_id
+        @rtype: integer
+        '''
+
+    @abc.abstractmethod
+    def insert_many(self, entities):
+        '''
+        Insert the given entities as new instances at once. The tag_keys are held as by insert.
+        
+        @param entities: the entities to insert with the correct keys for the columns
+        @type  entities: list
+        @return: the new instance_ids in the same order as the entities
+        @rtype: list
+        '''
+
+    @abc.abstractmethod
+    def update_entity_by_instance_id(self, instance_id, entity):
+        '''
+        Update the columns given in the entity of the instance with the given instance_id, if one 
+        exists.
+        
+        @param instance_id: the instance_id of the entity to update
+        @type  instance_id: int
+        @param entity: the entity to update with
+        @type  entity: dict
+        @return: if an entity was found and updated with the given instance_id
+        @rtype:  bool
+        '''
+
+    @abc.abstractmethod
+    def update_entities_by_instance_id(self, updates):
+        '''
+        Update the instances with the given instance_ids, if they exist, all at once. An update of
+        the tags releases the old tag_key and holds the new one, unless another instance holds it.
+        
+        @param updates: the (instance_id, entity) pairs to update
+        @type  updates: list
+        @return: if an entity was found and updated for each of the given instance_ids
+        @rtype:  list
+        '''
+
+    @abc.abstractmethod
+    def upsert_by_tags(self, entity):
+        '''
+        Insert the given entity or, if an instance holds the tag_key of its tags, update that 
+        instance instead. Concurrent upserts with the same tags never create duplicates. The 
+        creation time of an existing instance is never changed and, unless it is given, the 
+        perceived_end is cleared.
+        
+        @param entity: the entity to upsert with the correct keys for the columns
+        @type  entity: dict
+        @return: the instance_id and if a new entity was created
+        @rtype: tuple
+        '''
+
+    @abc.abstractmethod
+    def tag_key(self, tags):
+        '''
+        Create the unique key for the given set of tags used by upsert_by_tags.
+        
+        @param tags: the list of tags
+        @type  tags: list
+        @return: the key (see worldlib.tag_key)
+        @rtype: string
+        '''
+
+    @abc.abstractmethod
+    def search_instance_ids(self, instance_ids, history=False, columns=None):
+        '''
+        Search for the instances with the given instance_ids. Expired instances are returned until 
+        they are archived.
+        
+        @param instance_ids: the instance_ids to search for
+        @type  instance_ids: list
+        @param history: if archived entities should be searched as well
+        @type  history: bool
+        @param columns: the columns to return (the instance_id is always returned), or None for all
+        @type  columns: list
+        @return: the entities found keyed by instance_id
+        @rtype:  dict
+        '''
+
+    @abc.abstractmethod
+    def search_tags(self, tags, match=MATCH_ALL, order_by=None, descending=False, limit=0, 
+                    offset=0, after_id=0, history=False, columns=None):
+        '''
+        Search for the instances that match the given list of tags. By default, only live instances
+        are searched, instances must contain all of the tags, and they are ordered by instance_id.
+        
+        @param tags: the list of tags to search for
+        @type  tags: list
+        @param match: how to match the tags (MATCH_ALL, MATCH_ANY, or MATCH_NONE)
+        @type  match: int
+        @param order_by: the column to order by (name, creation, update), or None to order by the 
+                         instance_id
+        @type  order_by: string
+        @param descending: if the results should be in descending order
+        @type  descending: bool
+        @param limit: the maximum number of entities to return, or 0 for no limit
+        @type  limit: int
+        @param offset: the number of entities to skip
+        @type  offset: int
+        @param after_id: only return entities after this instance_id (requires ordering by 
+                         instance_id)
+        @type  after_id: int
+        @param history: if expired and archived entities should be searched as well
+        @type  history: bool
+        @param columns: the columns to return (the instance_id is always returned), or None for all
+        @type  columns: list
+        @return: the entities found
+        @rtype: list
+        '''
+
+    @abc.abstractmethod
+    def search_radius(self, frame_id, center, radius, tags=[], history=False, columns=None):
+        '''
+        Search for the instances with a pose in the given frame within the given distance of the 
+        center point.
+        
+        @param frame_id: the frame_id of the poses to search
+        @type  frame_id: string
+        @param center: the X, Y, Z center point
+        @type  center: list
+        @param radius: the maximum distance from the center point
+        @type  radius: float
+        @param tags: only return entities that contain all of these tags (optional)
+        @type  tags: list
+        @param history: if expired and archived entities should be searched as well
+        @type  history: bool
+        @param columns: the columns to return (the instance_id is always returned), or None for all
+        @type  columns: list
+        @return: the entities found, sorted by distance
+        @rtype: list
+        '''
+
+    @abc.abstractmethod
+    def search_box(self, frame_id, lo, hi, tags=[], history=False, columns=None):
+        '''
+        Search for the instances with a pose in the given frame within the given axis-aligned box.
+        
+        @param frame_id: the frame_id of the poses to search
+        @type  frame_id: string
+        @param lo: the X, Y, Z minimum corner of the box
+        @type  lo: list
+        @param hi: the X, Y, Z maximum corner of the box
+        @type  hi: list
+        @param tags: only return entities that contain all of these tags (optional)
+        @type  tags: list
+        @param history: if expired and archived entities should be searched as well
+        @type  history: bool
+        @param columns: the columns to return (the instance_id is always returned), or None for all
+        @type  columns: list
+        @return: the entities found
+        @rtype: list
+        '''
+
+    @abc.abstractmethod
+    def search_nearest(self, frame_id, center, k, tags=[], history=False, columns=None):
+        '''
+        Search for the k instances with a pose in the given frame nearest to the center point.
+        
+        @param frame_id: the frame_id of the poses to search
+        @type  frame_id: string
+        @param center: the X, Y, Z center point
+        @type  center: list
+        @param k: the number of entities to return
+        @type  k: int
+        @param tags: only return entities that contain all of these tags (optional)
+        @type  tags: list
+        @param history: if expired and archived entities should be searched as well
+        @type  history: bool
+        @param columns: the columns to return (the instance_id is always returned), or None for all
+        @type  columns: list
+        @return: the entities found, sorted by distance
+        @rtype: list
+        '''
+
+    @abc.abstractmethod
+    def search_pose_history(self, instance_id, start=None, end=None, every=1, max_points=0):
+        '''
+        Search the pose history of the instance with the given instance_id. Every Nth pose is 
+        kept, or more if there would be more than max_points.
+        
+        @param instance_id: the instance_id of the entity
+        @type  instance_id: int
+        @param start: only return poses stamped at or after this unix time, or None for no limit
+        @type  start: float
+        @param end: only return poses stamped at or before this unix time, or None for no limit
+        @type  end: float
+        @param every: only return every Nth pose
+        @type  every: int
+        @param max_points: the maximum number of poses to return, or 0 for no limit
+        @type  max_points: int
+        @return: the (stamp, frame_id, position, orientation) of each pose found ordered by stamp
+        @rtype:  list
+        '''
+
+    @abc.abstractmethod
+    def expire_entities(self, limit=1000):
+        '''
+        Set the perceived_end of the live instances whose expected_ttl has passed since their last
+        update.
+        
+        @param limit: the maximum number of entities to expire at once
+        @type  limit: int
+        @return: the instance_ids of the expired entities
+        @rtype:  list
+        '''
+
+    @abc.abstractmethod
+    def archive_entities(self, older_than, limit=1000):
+        '''
+        Archive the instances which expired more than the given number of seconds ago.
+        
+        @param older_than: the minimum number of seconds since the perceived_end
+        @type  older_than: float
+        @param limit: the maximum number of entities to archive at once
+        @type  limit: int
+        @return: the number of entities archived
+        @rtype:  int
+        '''
+
+    @abc.abstractmethod
+    def create_pose_partitions(self, days=2):
+        '''
+        Prepare the pose history for today and the following days (in UTC), so writers do not have
+        to.
+        
+        @param days: the number of days to prepare
+        @type  days: int
+        '''
+
+class WorldObjectDescriptionStorage(object):
+    '''
+    The interface of the storage of world object descriptions.
+    '''
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def add_write_listener(self, callback):
+        '''
+        Add a function to call with the description_id of each description written through this
+        object (e.g., to invalidate a cache).
+        
+        @param callback: the function to call with the description_id
+        @type  callback: function
+        '''
+
+    @abc.abstractmethod
+    def insert(self, entity):
+        '''
+        Insert the given entity as a new description.
+        
+        @param entity: the entity to insert
+        @type  entity: dict
+        @return: the new description_id
+        @rtype: integer
+        '''
+
+    @abc.abstractmethod
+    def search_description_id(self, description_id):
+        '''
+        Search for the description with the given description_id, if one exists.
+        
+        @param description_id: the description_id field of the entity to search for
+        @type  description_id: int
+        @return: the entity found, or None if an invalid description_id was given
+        @rtype:  dict
+        '''
+
+    @abc.abstractmethod
+    def search_description_ids(self, description_ids):
+        '''
+        Search for the descriptions with the given description_ids, if any.
+        
+        @param description_ids: the description_ids to search for
+        @type  description_ids: list
+        @return: the entities found keyed by description_id
+        @rtype:  dict
+        '''
+
+    @abc.abstractmethod
+    def search_tags(self, tags, match=MATCH_ALL, order_by=None, descending=False, limit=0, 
+                    offset=0, after_id=0):
+        '''
+        Search for the descriptions that match the given list of tags. By default, descriptions 
+        must contain all of the tags and are ordered by their description_id.
+        
+        @param tags: the list of tags to search for
+        @type  tags: list
+        @param match: how to match the tags (MATCH_ALL, MATCH_ANY, or MATCH_NONE)
+        @type  match: int
+        @param order_by: the column to order by (name), or None to order by the description_id
+        @type  order_by: string
+        @param descending: if the results should be in descending order
+        @type  descending: bool
+        @param limit: the maximum number of entities to return, or 0 for no limit
+        @type  limit: int
+        @param offset: the number of entities to skip
+        @type  offset: int
+        @param after_id: only return entities after this description_id (requires ordering by 
+                         description_id)
+        @type  after_id: int
+        @return: the entities found
+        @rtype: list
+        '''
+
+class DescriptorStorage(object):
+    '''
+    The interface of the storage of descriptors. The content hash of each descriptor is stored with
+    it and its data is only loaded when it is asked for.
+    '''
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def add_write_listener(self, callback):
+        '''
+        Add a function to call with the description_id of each descriptor written through this 
+        object (e.g., to invalidate a cache).
+        
+        @param callback: the function to call with the description_id
+        @type  callback: function
+        '''
+
+    @abc.abstractmethod
+    def insert(self, entity):
+        '''
+        Insert the given entity as a new descriptor, along with its data (if any).
+        
+        @param entity: the entity to insert with the correct keys for the columns
+        @type  entity: dict
+        @return: the new descriptor_id
+        @rtype: integer
+        '''
+
+    @abc.abstractmethod
+    def search_by_description_id(self, description_id, load_data=False):
+        '''
+        Search for the descriptors of the given description, if any. By default, only the size of 
+        the data is returned and the data itself can be read with read_data.
+        
+        @param description_id: the description_id to search for
+        @type  description_id: int
+        @param load_data: if the data of each entity should be loaded
+        @type  load_data: bool
+        @return: the entities found
+        @rtype:  list
+        '''
+
+    @abc.abstractmethod
+    def search_by_description_ids(self, description_ids, load_data=False):
+        '''
+        Search for the descriptors of any of the given descriptions.
+        
+        @param description_ids: the description_ids to search for
+        @type  description_ids: list
+        @param load_data: if the data of each entity should be loaded
+        @type  load_data: bool
+        @return: the entities found for each description_id (ordered by descriptor_id), keyed by 
+                 description_id
+        @rtype:  dict
+        '''
+
+    @abc.abstractmethod
+    def search_hash(self, data_hash):
+        '''
+        Search for the descriptors with the given content hash, if any. The data is not loaded.
+        
+        @param data_hash: the content hash to search for (see descriptor_hash)
+        @type  data_hash: string
+        @return: the entities found
+        @rtype:  list
+        '''
+
+    @abc.abstractmethod
+    def read_data(self, descriptor_id, offset=0, length=-1):
+        '''
+        Read part of the data of the descriptor with the given descriptor_id, if one exists.
+        
+        @param descriptor_id: the descriptor_id of the entity to read the data of
+        @type  descriptor_id: int
+        @param offset: the byte offset to start reading at
+        @type  offset: int
+        @param length: the maximum number of bytes to read, or -1 to read until the end
+        @type  length: int
+        @return: the data read and the total size of the data, or None if the entity was not found
+        @rtype:  tuple
+        '''
+
+class MapTileStorage(object):
+    '''
+    The interface of the storage of tiled maps. Each implementation has an available attribute 
+    which is set if tiled maps can be stored.
+    '''
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def write_tiles(self, tile_set, tiles):
+        '''
+        Write the given tiles of a tiled map at once. The tiled map is created or updated first. If
+        the map shrank or its tile size changed, the tiles no longer covering the map are deleted.
+        
+        @param tile_set: the tiled map with the keys of the columns of a tiled map
+        @type  tile_set: dict
+        @param tiles: the (level, x, y, data) of each tile to write
+        @type  tiles: list
+        @return: the version of each tile after the write and the number of tiles that changed
+        @rtype:  tuple
+        '''
+
+    @abc.abstractmethod
+    def search_tile_set(self, description_id):
+        '''
+        Search for the tiled map of the given description, if one exists.
+        
+        @param description_id: the description_id of the tiled map
+        @type  description_id: int
+        @return: the tiled map found, or None if the description has no tiled map
+        @rtype:  dict
+        '''
+
+    @abc.abstractmethod
+    def search_tiles(self, description_id, level, lo, hi):
+        '''
+        Search for the tiles of the given tiled map at the given level within the given range of
+        columns and rows.
+        
+        @param description_id: the description_id of the tiled map
+        @type  description_id: int
+        @param level: the level of the tiles
+        @type  level: int
+        @param lo: the first column and row
+        @type  lo: list
+        @param hi: the last column and row
+        @type  hi: list
+        @return: the (x, y, version, data) of each tile found
+        @rtype:  list
+        '''
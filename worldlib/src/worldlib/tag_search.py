@@ -0,0 +1,212 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2013, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+# * Neither the name of Willow Garage, Inc. nor the names of its
+# contributors may be used to endorse or promote products derived
+# from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+'''
+The tag_search module builds the SQL used by the worldlib connections to search tables by tags.
+Tags are matched with the array operators (@> and &&) so the GIN indexes on the tags columns can be 
+used, and results can be ordered and paged. Entities held in memory are matched, ordered, and paged 
+the same way by tags_match and page_entities.
+
+@author:  Russell Toris
+@version: April 18, 2013
+'''
+
+import heapq
+
+# match entities that contain all of the tags
+MATCH_ALL = 0
+# match entities that contain any of the tags
+MATCH_ANY = 1
+# match entities that contain none of the tags
+MATCH_NONE = 2
+
+def build_tag_search(table, id_col, tags, match=MATCH_ALL, order_by=None, order_cols=(), 
+                     descending=False, limit=0, offset=0, after_id=0, columns='*'):
+    '''
+    Build the SQL and values to search the given table by tags.
+    
+    @param table: the name of the table to search
+    @type  table: string
+    @param id_col: the name of the unique ID column of the table
+    @type  id_col: string
+    @param tags: the list of tags to search for
+    @type  tags: list
+    @param match: how to match the tags (MATCH_ALL, MATCH_ANY, or MATCH_NONE)
+    @type  match: int
+    @param order_by: the column to order by, or None to order by the ID column
+    @type  order_by: string
+    @param order_cols: the columns (other than the ID column) that can be ordered by
+    @type  order_cols: list
+    @param descending: if the results should be in descending order
+    @type  descending: bool
+    @param limit: the maximum number of results to return, or 0 for no limit
+    @type  limit: int
+    @param offset: the number of results to skip
+    @type  offset: int
+    @param after_id: only return results after this ID (only valid when ordering by the ID column)
+    @type  after_id: int
+    @param columns: the comma separated columns to return
+    @type  columns: string
+    @return: the SQL and the tuple of values
+    @rtype: tuple
+    '''
+    # check the match mode
+    if match == MATCH_ALL:
+        sql = ("""SELECT """ + columns + """ FROM """ + table + 
+               """ WHERE tags @> %s::character varying[]""")
+    elif match == MATCH_ANY:
+        sql = ("""SELECT """ + columns + """ FROM """ + table + 
+               """ WHERE tags && %s::character varying[]""")
+    elif match == MATCH_NONE:
+        sql = ("""SELECT """ + columns + """ FROM """ + table + 
+               """ WHERE (tags IS NULL OR NOT tags && %s::character varying[])""")
+    else:
+        raise ValueError('Invalid tag match mode: ' + str(match))
+    values = (list(tags),)
+    # check the ordering
+    order_by = _check_order(table, id_col, order_by, order_cols, after_id)
+    direction = ' DESC' if descending else ' ASC'
+    # keyset paging
+    if after_id > 0:
+        sql += ' AND ' + id_col + (' < %s' if descending else ' > %s')
+        values += (after_id,)
+    # always break ties on the ID so paging is stable
+    sql += ' ORDER BY "' + order_by + '"' + direction
+    if order_by != id_col:
+        sql += ', ' + id_col + direction
+    if limit > 0:
+        sql += ' LIMIT %s'
+        values += (limit,)
+    if offset > 0:
+        sql += ' OFFSET %s'
+        values += (offset,)
+    return (sql, values)
+
+def tags_match(entity_tags, tags, match=MATCH_ALL):
+    '''
+    Check if the tags of an entity match the given tags in the same way as build_tag_search. An
+    empty list of tags matches every entity.
+    
+    @param entity_tags: the tags of the entity, or None
+    @type  entity_tags: list
+    @param tags: the list of tags to match
+    @type  tags: list
+    @param match: how to match the tags (MATCH_ALL, MATCH_ANY, or MATCH_NONE)
+    @type  match: int
+    @return: if the entity matches
+    @rtype:  bool
+    '''
+    if len(tags) is 0:
+        return True
+    entity_tags = set(entity_tags or [])
+    if match == MATCH_ALL:
+        return entity_tags.issuperset(tags)
+    elif match == MATCH_ANY:
+        return not entity_tags.isdisjoint(tags)
+    elif match == MATCH_NONE:
+        return entity_tags.isdisjoint(tags)
+    else:
+        raise ValueError('Invalid tag match mode: ' + str(match))
+
+def page_entities(entities, table, id_col, order_by=None, order_cols=(), descending=False, limit=0, 
+                  offset=0, after_id=0):
+    '''
+    Order and page the given entity dictionaries (e.g., of an in-memory store) in the same way as 
+    build_tag_search. NULL values are ordered last, or first when descending.
+    
+    @param entities: the entities to order
+    @type  entities: list
+    @param table: the name of the table of the entities (used in errors)
+    @type  table: string
+    @param id_col: the name of the unique ID column of the table
+    @type  id_col: string
+    @param order_by: the column to order by, or None to order by the ID column
+    @type  order_by: string
+    @param order_cols: the columns (other than the ID column) that can be ordered by
+    @type  order_cols: list
+    @param descending: if the results should be in descending order
+    @type  descending: bool
+    @param limit: the maximum number of results to return, or 0 for no limit
+    @type  limit: int
+    @param offset: the number of results to skip
+    @type  offset: int
+    @param after_id: only return results after this ID (only valid when ordering by the ID column)
+    @type  after_id: int
+    @return: the ordered entities
+    @rtype:  list
+    '''
+    order_by = _check_order(table, id_col, order_by, order_cols, after_id)
+    # keyset paging
+    if after_id > 0:
+        if descending:
+            entities = [e for e in entities if e[id_col] < after_id]
+        else:
+            entities = [e for e in entities if e[id_col] > after_id]
+    # always break ties on the ID so paging is stable
+    if order_by == id_col:
+        key = lambda e: e[id_col]
+    else:
+        key = lambda e: (e[order_by] is None, e[order_by], e[id_col])
+    # only the first page is sorted when there is a limit
+    if limit > 0 and descending:
+        entities = heapq.nlargest(offset + limit, entities, key)
+    elif limit > 0:
+        entities = heapq.nsmallest(offset + limit, entities, key)
+    else:
+        entities = sorted(entities, key=key, reverse=descending)
+    return entities[offset:]
+
+def _check_order(table, id_col, order_by, order_cols, after_id):
+    '''
+    Check the ordering of a tag search.
+    
+    @param table: the name of the table to search
+    @type  table: string
+    @param id_col: the name of the unique ID column of the table
+    @type  id_col: string
+    @param order_by: the column to order by, or None to order by the ID column
+    @type  order_by: string
+    @param order_cols: the columns (other than the ID column) that can be ordered by
+    @type  order_cols: list
+    @param after_id: the ID to page after, or 0
+    @type  after_id: int
+    @return: the column to order by
+    @rtype:  string
+    '''
+    if order_by is None or len(order_by) is 0:
+        order_by = id_col
+    if order_by != id_col and order_by not in order_cols:
+        raise ValueError('Cannot order ' + table + ' by ' + order_by + '.')
+    if after_id > 0 and order_by != id_col:
+        raise ValueError('Paging after an ID requires ordering by ' + id_col + '.')
+    return order_by
@@ -0,0 +1,380 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2013, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+# * Neither the name of Willow Garage, Inc. nor the names of its
+# contributors may be used to endorse or promote products derived
+# from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+'''
+The WorldModelClient class is an asynchronous client for the world_model action servers. Work is
+queued by key and done by background threads, with only the latest work for each key kept, so ROS
+callbacks never wait on world model round trips. Goals are sent over shared action clients so 
+several can be in flight at once, and the instance_id found for each set of tags is cached.
+
+@author:  Russell Toris
+@version: May 8, 2013
+'''
+
+import rospy
+import actionlib
+import collections
+import threading
+import thread
+import time
+import traceback
+from worldlib.msg import *
+
+class WorldModelClient(object):
+    '''
+    The main WorldModelClient object. The number of queued work items dropped because newer work 
+    with the same key arrived is kept for monitoring.
+    '''
+
+    def __init__(self, workers=2, max_in_flight=16, timeout=10.0, refresh_interval=10.0):
+        '''
+        Creates the WorldModelClient object and starts its background threads.
+        
+        @param workers: the number of background threads doing queued work
+        @type  workers: int
+        @param max_in_flight: the maximum number of goals sent without waiting for their result
+        @type  max_in_flight: int
+        @param timeout: the maximum time in seconds to wait for a server or a result
+        @type  timeout: float
+        @param refresh_interval: the time in seconds a cached instance_id is used before the 
+                                 instance is upserted again (which also revives expired instances)
+        @type  refresh_interval: float
+        '''
+        self.timeout = timeout
+        self.refresh_interval = refresh_interval
+        self.dropped = 0
+        # action clients as name : ActionClient
+        self._clients = {}
+        # create a lock for the action clients
+        self._clients_lock = thread.allocate_lock()
+        # goals without a result as token : [handle, deadline, done_cb] (the handles must be kept 
+        # for their callbacks to be called)
+        self._in_flight = {}
+        self._in_flight_lock = thread.allocate_lock()
+        self._slots = threading.Semaphore(max_in_flight)
+        # cached instance_ids as tags : (instance_id, time found)
+        self._instance_ids = {}
+        # queued work as key : (function, args), oldest first
+        self._queue = collections.OrderedDict()
+        # keys with work being done (work for the same key is never done concurrently)
+        self._busy = set()
+        # create a condition for the queue
+        self._cond = threading.Condition()
+        for i in range(workers):
+            t = threading.Thread(target=self._work)
+            t.daemon = True
+            t.start()
+
+    def connect(self, name, action, timeout=None):
+        '''
+        Connect to the given action server, waiting for it to become available.
+        
+        @param name: the name of the action server (e.g., '/world_model/find_descriptor_by_hash')
+        @type  name: string
+        @param action: the action class (e.g., FindDescriptorByHashAction)
+        @type  action: class
+        @param timeout: the maximum time in seconds to wait, or None to wait forever
+        @type  timeout: float
+        @return: the action client, or None if the server is not available
+        @rtype:  ActionClient
+        '''
+        with self._clients_lock:
+            client = self._clients.get(name)
+        if client is not None:
+            return client
+        # wait without the lock so other servers can be used meanwhile
+        client = actionlib.ActionClient(name, action)
+        wait = rospy.Duration(timeout) if timeout is not None else rospy.Duration()
+        if not client.wait_for_server(wait):
+            rospy.logwarn('Action server ' + name + ' is not available.')
+            return None
+        with self._clients_lock:
+            # another thread may have connected meanwhile
+            return self._clients.setdefault(name, client)
+
+    def submit(self, key, function, *args):
+        '''
+        Queue a call to the given function in a background thread. If work with the same key is 
+        still queued, it is replaced. This never waits on the world model.
+        
+        @param key: the key of the work (e.g., the topic it came from)
+        @type  key: object
+        @param function: the function to call
+        @type  function: function
+        @param args: the arguments to call the function with
+        @type  args: list
+        '''
+        with self._cond:
+            if self._queue.pop(key, None) is not None:
+                self.dropped += 1
+            self._queue[key] = (function, args)
+            self._cond.notify()
+
+    def call(self, name, action, goal):
+        '''
+        Send the goal to the given action server and wait for the result. Other threads can have 
+        goals in flight at the same time.
+        
+        @param name: the name of the action server
+        @type  name: string
+        @param action: the action class
+        @type  action: class
+        @param goal: the goal to send
+        @type  goal: object
+        @return: the result, or None if the server did not respond in time or gave no result
+        @rtype:  object
+        '''
+        done = threading.Event()
+        results = []
+        def done_cb(result):
+            results.append(result)
+            done.set()
+        token = self.send(name, action, goal, done_cb)
+        if token is None:
+            return None
+        done.wait(self.timeout)
+        if not done.is_set():
+            self._cancel(token)
+            return None
+        return results[0]
+
+    def send(self, name, action, goal, done_cb=None):
+        '''
+        Send the goal to the given action server without waiting for the result. If too many goals
+        are in flight, this waits for one of them to finish first. Goals without a result after 
+        the timeout are canceled to free their slots.
+        
+        @param name: the name of the action server
+        @type  name: string
+        @param action: the action class
+        @type  action: class
+        @param goal: the goal to send
+        @type  goal: object
+        @param done_cb: the function to call with the result (or None) once the goal is done
+        @type  done_cb: function
+        @return: the token of the goal, or None if the server is not available or no slot was freed
+                 in time
+        @rtype:  object
+        '''
+        client = self.connect(name, action, self.timeout)
+        if client is None:
+            return None
+        if not self._acquire_slot(self.timeout):
+            rospy.logwarn('Timed out waiting to send a goal to ' + name + '.')
+            return None
+        token = object()
+        def transition_cb(gh):
+            if gh.get_comm_state() == actionlib.CommState.DONE and self._finished(token):
+                if done_cb is not None:
+                    done_cb(gh.get_result())
+        with self._in_flight_lock:
+            self._in_flight[token] = [None, time.time() + self.timeout, done_cb]
+        gh = client.send_goal(goal, transition_cb)
+        with self._in_flight_lock:
+            # the goal may already be done
+            if token in self._in_flight:
+                self._in_flight[token][0] = gh
+        return token
+
+    def tag_search(self, tags, fields=[], include_history=False, limit=0):
+        '''
+        Search for the instances with all of the given tags. Only live instances are searched 
+        unless the history is included, in which case the most recently updated come first.
+        
+        @param tags: the tags to search for
+        @type  tags: list
+        @param fields: the fields of each instance to return, or an empty list for all fields
+        @type  fields: list
+        @param include_history: if expired and archived instances should be searched as well
+        @type  include_history: bool
+        @param limit: the maximum number of instances to return, or 0 for no limit
+        @type  limit: int
+        @return: the instances found, or None if the search failed
+        @rtype:  list
+        '''
+        goal = WorldObjectInstanceTagSearchGoal(tags=tags, fields=fields, limit=limit,
+                                                include_history=include_history)
+        if include_history:
+            goal.order_by = 'update'
+            goal.descending = True
+        resp = self.call('/world_model/world_object_instance_tag_search', 
+                         WorldObjectInstanceTagSearchAction, goal)
+        return resp.instances if resp is not None else None
+
+    def read_descriptor_data(self, descriptor_id):
+        '''
+        Read all of the data of the given descriptor, one chunk at a time.
+
+        @param descriptor_id: the descriptor_id of the descriptor
+        @type  descriptor_id: int
+        @return: the data of the descriptor, or None if it does not exist or could not be read
+        @rtype:  string
+        '''
+        chunks = []
+        offset = 0
+        while True:
+            resp = self.call('/world_model/get_descriptor_data', GetDescriptorDataAction,
+                             GetDescriptorDataGoal(descriptor_id=descriptor_id, offset=offset))
+            if resp is None or not resp.exists:
+                return None
+            chunks.append(resp.data)
+            offset += len(resp.data)
+            if offset >= resp.size or len(resp.data) is 0:
+                return ''.join(chunks)
+
+    def upsert_by_tags(self, instance):
+        '''
+        Upsert the given instance by its tags and cache its instance_id.
+        
+        @param instance: the instance to upsert
+        @type  instance: WorldObjectInstance
+        @return: the instance_id, or None if the upsert failed
+        @rtype:  int
+        '''
+        key = tuple(sorted(set(instance.tags)))
+        resp = self.call('/world_model/upsert_world_object_instance_by_tags', 
+                         UpsertWorldObjectInstanceByTagsAction, 
+                         UpsertWorldObjectInstanceByTagsGoal(instance))
+        if resp is None:
+            return None
+        self._instance_ids[key] = (resp.instance_id, time.time())
+        return resp.instance_id
+
+    def update_by_tags(self, instance):
+        '''
+        Update the instance with the same tags as the given instance. Once the instance_id is 
+        cached, the update is sent without waiting for the result. Otherwise, or if the cached
+        instance_id is older than the refresh interval, the instance is upserted.
+        
+        @param instance: the instance to write
+        @type  instance: WorldObjectInstance
+        @return: the instance_id, or None if the upsert failed
+        @rtype:  int
+        '''
+        key = tuple(sorted(set(instance.tags)))
+        cached = self._instance_ids.get(key)
+        if cached is None or time.time() - cached[1] > self.refresh_interval:
+            return self.upsert_by_tags(instance)
+        instance_id = cached[0]
+        def done_cb(result):
+            # forget instances that no longer exist so they are upserted again
+            if result is None or not result.success:
+                self._instance_ids.pop(key, None)
+        token = self.send('/world_model/update_world_object_instance', 
+                          UpdateWorldObjectInstanceAction, 
+                          UpdateWorldObjectInstanceGoal(instance_id, instance), done_cb)
+        if token is None:
+            return None
+        return instance_id
+
+    def _acquire_slot(self, timeout):
+        '''
+        Wait for a free slot to send a goal. Goals past their deadline are canceled meanwhile.
+        
+        @param timeout: the maximum time in seconds to wait
+        @type  timeout: float
+        @return: if a slot was acquired
+        @rtype:  bool
+        '''
+        deadline = time.time() + timeout
+        while not self._slots.acquire(False):
+            now = time.time()
+            with self._in_flight_lock:
+                expired = [t for t, f in self._in_flight.items() if f[1] < now]
+            for token in expired:
+                self._cancel(token)
+            if len(expired) is 0:
+                if now >= deadline or rospy.is_shutdown():
+                    return False
+                time.sleep(0.01)
+        return True
+
+    def _cancel(self, token):
+        '''
+        Cancel the given goal and free its slot. Its done function is called with None.
+        
+        @param token: the token of the goal returned by send
+        @type  token: object
+        '''
+        with self._in_flight_lock:
+            flight = self._in_flight.get(token)
+        if flight is None:
+            return
+        if flight[0] is not None:
+            flight[0].cancel()
+        if self._finished(token) and flight[2] is not None:
+            flight[2](None)
+
+    def _finished(self, token):
+        '''
+        Forget the goal handle of the given goal and free its slot.
+        
+        @param token: the token of the goal returned by send
+        @type  token: object
+        @return: if the goal was still in flight
+        @rtype:  bool
+        '''
+        with self._in_flight_lock:
+            if token not in self._in_flight:
+                return False
+            del self._in_flight[token]
+        self._slots.release()
+        return True
+
+    def _work(self):
+        '''
+        The main loop of each background thread. Errors in the work are printed and do not stop
+        the thread.
+        '''
+        while not rospy.is_shutdown():
+            with self._cond:
+                key = None
+                while key is None and not rospy.is_shutdown():
+                    for k in self._queue.keys():
+                        if k not in self._busy:
+                            key = k
+                            break
+                    else:
+                        self._cond.wait(1.0)
+                if key is None:
+                    return
+                function, args = self._queue.pop(key)
+                self._busy.add(key)
+            try:
+                function(*args)
+            except Exception:
+                traceback.print_exc()
+            with self._cond:
+                self._busy.remove(key)
+                # work for this key may have been queued meanwhile
+                self._cond.notify_all()
@@ -40,27 +40,52 @@ individual descriptors.
 @version: February 18, 2013
 '''
 
-import psycopg2
-import thread
+from worldlib.connection_pool import ConnectionPool
+from worldlib.tag_search import MATCH_ALL, build_tag_search
+from worldlib.statements import execute
+from worldlib.storage_interface import WorldObjectDescriptionStorage
 
-class WorldObjectDescriptionConnection(object):
+class WorldObjectDescriptionConnection(WorldObjectDescriptionStorage):
     '''
     The main WorldObjectDescriptionConnection object which communicates with the PostgreSQL world 
     model database.
     '''
     
-    def __init__(self, user, pwd, host='localhost'):
+    def __init__(self, user=None, pwd=None, host='localhost', pool=None):
         '''
         Creates the WorldObjectDescriptionDatabase object and connects to the world object
-        description database.
+        description database. If a shared pool is given, the user, pwd, and host are ignored.
+        
+        @param user: the database username
+        @type  user: string
+        @param pwd: the database password
+        @type  pwd: string
+        @param host: the database hostname
+        @type  host: string
+        @param pool: the shared connection pool to use, if any
+        @type  pool: ConnectionPool
         '''
         # name of the world object descriptions table
         self._wod = 'world_object_descriptions'
-        # connect to the world model database
-        self.conn = psycopg2.connect(database='world_model', user=user, password=pwd, host=host)
-        # create a lock 
-        self.lock = thread.allocate_lock()
+        # columns of the world object descriptions table in the order used by _db_to_dict
+        self._cols = 'description_id, name, tags'
+        # columns that tag search results can be ordered by
+        self._order_cols = ['name']
+        # connections to the world model database
+        self.pool = pool if pool is not None else ConnectionPool(user, pwd, host)
+        # functions to call with the description_id of each description written through this object
+        self._write_listeners = []
+        
+    def add_write_listener(self, callback):
+        '''
+        Add a function to call with the description_id of each description written to the 
+        world_object_descriptions table through this object (e.g., to invalidate a cache).
         
+        @param callback: the function to call with the description_id
+        @type  callback: function
+        '''
+        self._write_listeners.append(callback)
+
     def insert(self, entity):
         '''
         Insert the given entity into the world object description database. This will create a new 
@@ -77,17 +102,18 @@ class WorldObjectDescriptionConnection(object):
             del entity['description_id']
         # build the SQL
         helper = self._build_sql_helper(entity)
-        with self.lock:
+        with self.pool.connection() as conn:
             # create a cursor
-            cur = self.conn.cursor()
+            cur = conn.cursor()
             # build the SQL
             cur.execute("""INSERT INTO """ + self._wod + 
                         """ (description_id, """ + helper['cols'] + """) 
                         VALUES (nextval('world_object_descriptions_description_id_seq'), 
                         """ + helper['holders'] + """) RETURNING description_id""", helper['values'])
             description_id = cur.fetchone()[0]
-            self.conn.commit()
+            conn.commit()
             cur.close()
+        self._written(description_id)
         # return the description ID
         return description_id
 
@@ -101,26 +127,67 @@ class WorldObjectDescriptionConnection(object):
         @return: the entity found, or None if an invalid description_id was given
         @rtype:  dict
         '''
-        with self.lock:
+        with self.pool.connection(read_only=True) as conn:
             # create a cursor
-            cur = self.conn.cursor()
+            cur = conn.cursor()
             # check if the description actually exists
-            cur.execute("""SELECT * FROM """ + self._wod + 
-                        """ WHERE description_id = %s""", (description_id,))
+            execute(cur, 'wod_get', """SELECT """ + self._cols + """ FROM """ + self._wod + 
+                    """ WHERE description_id = %s""", (description_id,))
             result = cur.fetchone()
             cur.close()
         if result is None:
             return None
         else:
             return self._db_to_dict(result)
+
+    def search_description_ids(self, description_ids):
+        '''
+        Search for and return all entities in the world_object_descriptions table with the given 
+        description_ids, if any, with a single query.
         
-    def search_tags(self, tags):
+        @param description_ids: the description_ids to search for
+        @type  description_ids: list
+        @return: the entities found keyed by description_id
+        @rtype:  dict
         '''
-        Search for and return all entities in the world_object_descriptions table that contain the
-        given list of tags.
+        final = {}
+        # do not search empty arrays
+        if len(description_ids) > 0:
+            with self.pool.connection(read_only=True) as conn:
+                # create a cursor
+                cur = conn.cursor()
+                execute(cur, 'wod_get_many', """SELECT """ + self._cols + """ FROM """ + 
+                        self._wod + """ WHERE description_id = ANY (%s::bigint[])""", 
+                        (list(description_ids),))
+                # extract the values
+                results = cur.fetchall()
+                cur.close()
+            for r in results:
+                final[r[0]] = self._db_to_dict(r)
+        return final
+        
+    def search_tags(self, tags, match=MATCH_ALL, order_by=None, descending=False, limit=0, 
+                    offset=0, after_id=0):
+        '''
+        Search for and return all entities in the world_object_descriptions table that match the
+        given list of tags. By default, entities must contain all of the tags and are ordered by 
+        their description_id.
         
         @param tags: the list of tags to search for
         @type  tags: list
+        @param match: how to match the tags (MATCH_ALL, MATCH_ANY, or MATCH_NONE)
+        @type  match: int
+        @param order_by: the column to order by (name), or None to order by the description_id
+        @type  order_by: string
+        @param descending: if the results should be in descending order
+        @type  descending: bool
+        @param limit: the maximum number of entities to return, or 0 for no limit
+        @type  limit: int
+        @param offset: the number of entities to skip
+        @type  offset: int
+        @param after_id: only return entities after this description_id (requires ordering by 
+                         description_id)
+        @type  after_id: int
         @return: the entities found
         @rtype: list
         '''
@@ -128,17 +195,13 @@ class WorldObjectDescriptionConnection(object):
         # do not search empty arrays
         if len(tags) > 0:
             # build the SQL
-            sql = """SELECT * FROM """ + self._wod + """ WHERE ("""
-            values = ()
-            for t in tags:
-                sql += "%s = ANY (tags) AND "
-                values += (t,)
-            # remove the trailing ' AND '
-            sql = sql[:-5] + """);"""
-            with self.lock:
+            sql, values = build_tag_search(self._wod, 'description_id', tags, match, order_by, 
+                                           self._order_cols, descending, limit, offset, after_id,
+                                           self._cols)
+            with self.pool.connection(read_only=True) as conn:
                 # create a cursor
-                cur = self.conn.cursor()
-                cur.execute(sql, values)
+                cur = conn.cursor()
+                execute(cur, 'wod_tag_search', sql, values)
                 # extract the values
                 results = cur.fetchall()
                 for r in results:
@@ -147,6 +210,16 @@ class WorldObjectDescriptionConnection(object):
                 cur.close()
         return final
     
+    def _written(self, description_id):
+        '''
+        Call each write listener with the given description_id.
+        
+        @param description_id: the description_id of the description written
+        @type  description_id: int
+        '''
+        for callback in self._write_listeners:
+            callback(description_id)
+
     def _build_sql_helper(self, entity):
         '''
         A helper function to build the SQL for an insertion/update. This will take the entity dict
@@ -40,19 +40,28 @@ working memory.
 @version: February 18, 2013
 '''
 
+from worldlib.connection_pool import ConnectionPool
+from worldlib.tag_key import tag_key
+from worldlib.tag_search import MATCH_ALL, build_tag_search
+from worldlib.kd_tree import KDTree
+from worldlib.row_converter import timestamp_to_unix, unix_to_timestamp
+from worldlib.statements import execute
+from worldlib.storage_interface import WorldObjectInstanceStorage
+import datetime
 import psycopg2
 import thread
+import time
 
-class WorldObjectInstanceConnection(object):
+class WorldObjectInstanceConnection(WorldObjectInstanceStorage):
     '''
     The main WorldObjectInstanceConnection object which communicates with the PostgreSQL World Model 
     database.
     '''
 
-    def __init__(self, user, pwd, host='localhost'):
+    def __init__(self, user=None, pwd=None, host='localhost', pool=None):
         '''
         Creates the WorldObjectInstanceDatabase object and connects to the world object instance
-        database.
+        database. If a shared pool is given, the user, pwd, and host are ignored.
         
         @param user: the database username
         @type  user: string
@@ -60,22 +69,61 @@ class WorldObjectInstanceConnection(object):
         @type  pwd: string
         @param host: the database hostname
         @type  host: string
+        @param pool: the shared connection pool to use, if any
+        @type  pool: ConnectionPool
         '''
         # fields in the database that are timestamps
         self.timestamps = ['creation', 'update', 'perceived_end', 'pose_stamp']
         # name of the world object instances table
         self._woi = 'world_object_instances'
-        # name of the database
-        self._db = 'world_model'
-        # connect to the world model database
-        self.conn = psycopg2.connect(database=self._db, user=user, password=pwd, host=host)
-        # create a lock 
-        self.lock = thread.allocate_lock()
+        # name of the archive of expired world object instances
+        self._archive = 'world_object_instances_archive'
+        # name of the pose history of the world object instances
+        self._poses = 'world_object_instance_poses'
+        # the columns of the world object instances table in the order used by _db_to_dict
+        self.columns = ['instance_id', 'name', 'creation', 'update', 'expected_ttl', 
+                        'perceived_end', 'source_origin', 'source_creator', 'pose_seq', 
+                        'pose_stamp', 'pose_frame_id', 'pose_position', 'pose_orientation', 
+                        'pose_covariance', 'description_id', 'properties', 'tags']
+        # the columns set by inserts (the tags also set the tag_key)
+        self._insert_cols = self.columns[1:] + ['tag_key']
+        # the columns selected by searches
+        self._select = ', '.join(self.columns)
+        # the function used to convert each row found (e.g., a row_converter), dicts by default
+        self.row_factory = self._db_to_dict
+        # the function which creates the row factory of a search for only some of the columns 
+        # (given those columns in order), dicts by default
+        self.projection_factory = self._projected_dict_factory
+        # the row factories of searches for only some of the columns keyed by the columns
+        self._projections = {}
+        # columns that tag search results can be ordered by
+        self._order_cols = ['name', 'creation', 'update']
+        # connections to the world model database
+        self.pool = pool if pool is not None else ConnectionPool(user, pwd, host)
+        # check if the database has a spatial index on the pose position
+        self.spatial = self._check_spatial()
+        # check if the database has an archive of expired instances
+        self.history = self._check_table(self._archive)
+        # check if the database has a pose history (poses are recorded on each write if so)
+        self.pose_history = self._check_table(self._poses)
+        # the days (in UTC) known to have a partition in the pose history
+        self._pose_days = set()
+        # otherwise, in-process spatial indexes are kept as (frame_id, tags, history) : 
+        # (time, KDTree)
+        self._trees = {}
+        # the maximum age in seconds of an in-process spatial index
+        self.spatial_max_age = 1.0
+        # the fields a write must set to change an in-process spatial index
+        self._indexed = ['pose_position', 'pose_frame_id', 'tags', 'perceived_end']
+        # create a lock for the in-process spatial indexes
+        self._trees_lock = thread.allocate_lock()
 
     def insert(self, entity):
         '''
         Insert the given entity into the world_object_instances table. This will create a new 
-        instance. The instance_id will be set to a unique value and returned.
+        instance. The instance_id will be set to a unique value and returned. If no other instance
+        holds the tag_key of its tags, the new instance holds it (so it is updated by upserts with
+        the same tags).
         
         @param entity: the entity to insert with the correct keys for the columns
         @type  entity: dict
@@ -85,22 +133,74 @@ class WorldObjectInstanceConnection(object):
         # ensure the instance ID does not get set by the user
         if 'instance_id' in entity.keys():
             del entity['instance_id']
-        # build the SQL
-        helper = self._build_sql_helper(entity)
-        with self.lock:
+        key = self._tags_key(entity)
+        with self.pool.connection() as conn:
             # create a cursor
-            cur = self.conn.cursor()
-            # build the SQL
-            cur.execute("""INSERT INTO """ + self._woi + 
-                        """ (instance_id, """ + helper['cols'] + """) 
-                        VALUES (nextval('world_object_instances_instance_id_seq'), 
-                        """ + helper['holders'] + """) RETURNING instance_id""", helper['values'])
-            instance_id = cur.fetchone()[0]
-            self.conn.commit()
+            cur = conn.cursor()
+            instance_id = self._insert_row(cur, entity, key)
+            if instance_id is None:
+                # another instance holds the key
+                instance_id = self._insert_row(cur, entity, None)
+            days = self._record_poses(cur, [(instance_id, entity)])
+            conn.commit()
             cur.close()
+        self._pose_days.update(days)
+        self._pose_written([(instance_id, entity)])
         # return the instance ID
         return instance_id
             
+    def insert_many(self, entities):
+        '''
+        Insert the given entities into the world_object_instances table with a single multi-row 
+        INSERT in one transaction. The instance_id of each will be set to a unique value and 
+        returned in the same order as the entities. The tag_keys are held as by insert.
+        
+        @param entities: the entities to insert with the correct keys for the columns
+        @type  entities: list
+        @return: the instance_ids
+        @rtype: list
+        '''
+        # do not insert empty lists
+        if len(entities) is 0:
+            return []
+        # every row must use the same columns (missing columns are set to NULL)
+        cols = []
+        for entity in entities:
+            # ensure the instance ID does not get set by the user
+            if 'instance_id' in entity.keys():
+                del entity['instance_id']
+            for k in entity.keys():
+                if k not in cols:
+                    cols.append(k)
+        cols.append('tag_key')
+        # keep the spatial index in sync with the position
+        if self.spatial and 'pose_position' in cols:
+            cols.append('pose_point')
+        # only the first entity with a set of tags can hold its key
+        keys = []
+        for entity in entities:
+            key = self._tags_key(entity)
+            keys.append(key if key not in keys else None)
+        with self.pool.connection() as conn:
+            # create a cursor
+            cur = conn.cursor()
+            rows = self._insert_rows(cur, cols, entities, keys)
+            # insert the entities whose key is held by another instance without it
+            skipped = [i for i in range(len(entities)) if rows[i] is None]
+            if len(skipped) > 0:
+                retried = self._insert_rows(cur, cols, [entities[i] for i in skipped], 
+                                            [None] * len(skipped))
+                for i, instance_id in zip(skipped, retried):
+                    rows[i] = instance_id
+            instance_ids = rows
+            days = self._record_poses(cur, zip(instance_ids, entities))
+            conn.commit()
+            cur.close()
+        self._pose_days.update(days)
+        self._pose_written(zip(instance_ids, entities))
+        # return the instance IDs
+        return instance_ids
+
     def update_entity_by_instance_id(self, instance_id, entity):
         '''
         Update the entity in the world_object_instances table with the given instance_id, if one
@@ -113,64 +213,831 @@ class WorldObjectInstanceConnection(object):
         @return: if an entity was found and updated with the given instance_id
         @rtype:  bool
         '''
-        with self.lock:
+        return self.update_entities_by_instance_id([(instance_id, entity)])[0]
+
+    def update_entities_by_instance_id(self, updates):
+        '''
+        Update the entities in the world_object_instances table with the given instance_ids, if 
+        they exist. All updates are done in a single transaction. An update of the tags releases
+        the old tag_key and holds the new one, unless another instance holds it.
+        
+        @param updates: the (instance_id, entity) pairs to update
+        @type  updates: list
+        @return: if an entity was found and updated for each of the given instance_ids
+        @rtype:  list
+        '''
+        final = []
+        # do not update empty lists
+        if len(updates) is 0:
+            return final
+        with self.pool.connection() as conn:
             # create a cursor
-            cur = self.conn.cursor()
-            # check if the instance actually exists
-            cur.execute("""SELECT instance_id FROM """ + self._woi + 
-                        """ WHERE instance_id = %s""", (instance_id,))
-            if len(cur.fetchall()) is 0:
-                cur.close()
-                result = False
-            else:
+            cur = conn.cursor()
+            for instance_id, entity in updates:
                 # ensure the instance ID does not get set by the user
                 if 'instance_id' in entity.keys():
                     del entity['instance_id']
-                # build the SQL
-                helper = self._build_sql_helper(entity)
-                # build the SQL
-                helper['values'] += (instance_id,)
-                cur.execute("""UPDATE """ + self._woi + 
-                            """ SET (""" + helper['cols'] + """) = (""" + helper['holders'] + 
-                            """) WHERE instance_id = %s""", helper['values'])
-                self.conn.commit()
+                # nothing to set
+                if len(entity) is 0:
+                    execute(cur, 'woi_exists', """SELECT instance_id FROM """ + self._woi + 
+                            """ WHERE instance_id = %s""", (instance_id,))
+                elif 'tags' in entity.keys():
+                    # the key may be held by another instance
+                    cur.execute("""SAVEPOINT tag_key""")
+                    try:
+                        self._update_row(cur, instance_id, entity, self._tags_key(entity))
+                    except psycopg2.IntegrityError:
+                        cur.execute("""ROLLBACK TO SAVEPOINT tag_key""")
+                        self._update_row(cur, instance_id, entity, None)
+                    cur.execute("""RELEASE SAVEPOINT tag_key""")
+                else:
+                    self._update_row(cur, instance_id, entity)
+                # check if the instance actually exists
+                final.append(cur.rowcount > 0)
+            days = self._record_poses(cur, updates)
+            conn.commit()
+            cur.close()
+        self._pose_days.update(days)
+        self._pose_written(updates)
+        return final
+
+    def upsert_by_tags(self, entity):
+        '''
+        Insert the given entity into the world_object_instances table or, if an entity with exactly 
+        the same set of tags was already upserted, update that entity instead. This is done with a 
+        single statement, so concurrent upserts with the same tags can never create duplicates.
+        The creation time of an existing entity is never changed and, unless it is given, the 
+        perceived_end is cleared.
+        
+        @param entity: the entity to upsert with the correct keys for the columns
+        @type  entity: dict
+        @return: the instance_id and if a new entity was created
+        @rtype: tuple
+        '''
+        # ensure the instance ID does not get set by the user
+        if 'instance_id' in entity.keys():
+            del entity['instance_id']
+        # the tags are the key
+        entity['tag_key'] = self.tag_key(entity['tags'])
+        # build the SQL
+        helper = self._build_sql_helper(entity)
+        updates = ''
+        for k in helper['cols'].split(', '):
+            if k != 'creation':
+                updates += k + ' = EXCLUDED.' + k + ', '
+        # an upserted entity is live again
+        if 'perceived_end' not in entity.keys():
+            updates += 'perceived_end = NULL, '
+        with self.pool.connection() as conn:
+            # create a cursor
+            cur = conn.cursor()
+            execute(cur, 'woi_upsert', """INSERT INTO """ + self._woi + 
+                    """ (instance_id, """ + helper['cols'] + """) 
+                    VALUES (nextval('world_object_instances_instance_id_seq'), 
+                    """ + helper['holders'] + """) ON CONFLICT (tag_key) DO UPDATE SET 
+                    """ + updates[:-2] + """ RETURNING instance_id, (xmax = 0)""", 
+                    helper['values'])
+            instance_id, created = cur.fetchone()
+            days = self._record_poses(cur, [(instance_id, entity)])
+            conn.commit()
+            cur.close()
+        self._pose_days.update(days)
+        self._pose_written([(instance_id, entity)])
+        return (instance_id, created)
+
+    def _tags_key(self, entity):
+        '''
+        Get the tag_key of the tags of the given entity.
+        
+        @param entity: the entity
+        @type  entity: dict
+        @return: the key, or None if the entity has no tags
+        @rtype:  string
+        '''
+        tags = entity.get('tags')
+        return self.tag_key(tags) if tags is not None else None
+
+    def _insert_row(self, cur, entity, key):
+        '''
+        Insert the given entity with the given tag_key, unless another instance holds the key.
+        
+        @param cur: the cursor to use
+        @type  cur: cursor
+        @param entity: the entity to insert
+        @type  entity: dict
+        @param key: the tag_key of the entity, or None
+        @type  key: string
+        @return: the instance_id, or None if another instance holds the key
+        @rtype:  int
+        '''
+        row = dict(entity)
+        row['tag_key'] = key
+        # entities with only known columns share a single statement (missing columns are NULL)
+        if set(entity.keys()).issubset(self.columns):
+            full = {}
+            for k in self._insert_cols:
+                full[k] = row.get(k)
+            helper = self._build_sql_helper(full, self._insert_cols)
+        else:
+            helper = self._build_sql_helper(row)
+        execute(cur, 'woi_insert', """INSERT INTO """ + self._woi + 
+                """ (instance_id, """ + helper['cols'] + """) 
+                VALUES (nextval('world_object_instances_instance_id_seq'), 
+                """ + helper['holders'] + """) ON CONFLICT (tag_key) DO NOTHING 
+                RETURNING instance_id""", helper['values'])
+        result = cur.fetchone()
+        return result[0] if result is not None else None
+
+    def _insert_rows(self, cur, cols, entities, keys):
+        '''
+        Insert the given entities with the given tag_keys in a single statement. Entities whose key
+        is held by another instance are not inserted.
+        
+        @param cur: the cursor to use
+        @type  cur: cursor
+        @param cols: the ordered list of column names (including the tag_key)
+        @type  cols: list
+        @param entities: the entities to insert
+        @type  entities: list
+        @param keys: the tag_key of each entity (each key other than None is only given once)
+        @type  keys: list
+        @return: the instance_id of each entity, or None if it was not inserted
+        @rtype:  list
+        '''
+        # build the SQL for each row
+        rows = []
+        for entity, key in zip(entities, keys):
+            row = dict(entity)
+            row['tag_key'] = key
+            rows.append(self._build_row_sql(cur, cols, row))
+        cur.execute("""INSERT INTO """ + self._woi + 
+                    """ (instance_id, """ + ', '.join(cols) + """) VALUES """ + 
+                    ', '.join(rows) + """ ON CONFLICT (tag_key) DO NOTHING 
+                    RETURNING instance_id, tag_key""")
+        inserted = cur.fetchall()
+        # the rows are returned in order, without the ones that were not inserted
+        final = []
+        for key in keys:
+            if len(inserted) > 0 and inserted[0][1] == key:
+                final.append(inserted.pop(0)[0])
+            else:
+                final.append(None)
+        return final
+
+    def _update_row(self, cur, instance_id, entity, key=None):
+        '''
+        Update the entity with the given instance_id. If the tags are updated, so is the tag_key.
+        
+        @param cur: the cursor to use
+        @type  cur: cursor
+        @param instance_id: the instance_id of the entity to update
+        @type  instance_id: int
+        @param entity: the entity to update with
+        @type  entity: dict
+        @param key: the new tag_key if the tags are updated
+        @type  key: string
+        '''
+        row = dict(entity)
+        if 'tags' in entity.keys():
+            row['tag_key'] = key
+        # build the SQL (each set of columns, e.g., only the pose, is prepared once)
+        helper = self._build_sql_helper(row)
+        helper['values'] += (instance_id,)
+        execute(cur, 'woi_update', """UPDATE """ + self._woi + 
+                """ SET """ + helper['sets'] + """ WHERE instance_id = %s""", 
+                helper['values'])
+
+    def tag_key(self, tags):
+        '''
+        Create the unique key for the given set of tags used by upsert_by_tags. The order of the
+        tags and any duplicates are ignored.
+        
+        @param tags: the list of tags
+        @type  tags: list
+        @return: the key (a JSON array of the sorted tags, see worldlib.tag_key)
+        @rtype: string
+        '''
+        return tag_key(tags)
+
+    def search_instance_ids(self, instance_ids, history=False, columns=None):
+        '''
+        Search for and return all entities in the world_object_instances table with the given 
+        instance_ids, if any, with a single query. Expired entities are returned until they are
+        archived.
+        
+        @param instance_ids: the instance_ids to search for
+        @type  instance_ids: list
+        @param history: if archived entities should be searched as well
+        @type  history: bool
+        @param columns: the columns to return (the instance_id is always returned), or None for all
+        @type  columns: list
+        @return: the entities found keyed by instance_id
+        @rtype:  dict
+        '''
+        final = {}
+        # do not search empty arrays
+        if len(instance_ids) > 0:
+            select, row_factory = self._projection(columns)
+            with self.pool.connection(read_only=True) as conn:
+                # create a cursor
+                cur = conn.cursor()
+                source = self._source(True) if history else self._woi
+                execute(cur, 'woi_get', """SELECT """ + select + """ FROM """ + 
+                        source + """ WHERE instance_id = ANY (%s::bigint[])""", 
+                        (list(instance_ids),))
+                # extract the values
+                results = cur.fetchall()
+                with self.pool.stats.time('woi.convert'):
+                    for r in results:
+                        # convert with the row factory
+                        final[r[0]] = row_factory(r)
                 cur.close()
-                result = True
-        return result
+        return final
     
-    def search_tags(self, tags):
+    def search_tags(self, tags, match=MATCH_ALL, order_by=None, descending=False, limit=0, 
+                    offset=0, after_id=0, history=False, columns=None):
         '''
-        Search for and return all entities in the world_object_instances table that contain the
-        given list of tags.
+        Search for and return all entities in the world_object_instances table that match the given
+        list of tags. By default, only live entities are searched, entities must contain all of the
+        tags, and entities are ordered by their instance_id.
         
         @param tags: the list of tags to search for
         @type  tags: list
+        @param match: how to match the tags (MATCH_ALL, MATCH_ANY, or MATCH_NONE)
+        @type  match: int
+        @param order_by: the column to order by (name, creation, update), or None to order by the 
+                         instance_id
+        @type  order_by: string
+        @param descending: if the results should be in descending order
+        @type  descending: bool
+        @param limit: the maximum number of entities to return, or 0 for no limit
+        @type  limit: int
+        @param offset: the number of entities to skip
+        @type  offset: int
+        @param after_id: only return entities after this instance_id (requires ordering by 
+                         instance_id)
+        @type  after_id: int
+        @param history: if expired and archived entities should be searched as well
+        @type  history: bool
+        @param columns: the columns to return (the instance_id is always returned), or None for all
+        @type  columns: list
         @return: the entities found
         @rtype: list
         '''
         final = []
         # do not search empty arrays
         if len(tags) > 0:
+            select, row_factory = self._projection(columns)
             # build the SQL
-            sql = """SELECT * FROM """ + self._woi + """ WHERE ("""
-            values = ()
-            for t in tags:
-                sql += "%s = ANY (tags) AND "
-                values += (t,)
-            # remove the trailing ' AND '
-            sql = sql[:-5] + """);"""
-            with self.lock:
+            sql, values = build_tag_search(self._source(history), 'instance_id', tags, match, 
+                                           order_by, self._order_cols, descending, limit, offset, 
+                                           after_id, select)
+            with self.pool.connection(read_only=True) as conn:
                 # create a cursor
-                cur = self.conn.cursor()
-                cur.execute(sql, values)
+                cur = conn.cursor()
+                execute(cur, 'woi_tag_search', sql, values)
                 # extract the values
                 results = cur.fetchall()
-                for r in results:
-                    # convert to a dictionary and convert the timestamps
-                    final.append(self._db_to_dict(r))
+                with self.pool.stats.time('woi.convert'):
+                    for r in results:
+                        # convert with the row factory
+                        final.append(row_factory(r))
                 cur.close()
         return final
     
+    def search_radius(self, frame_id, center, radius, tags=[], history=False, columns=None):
+        '''
+        Search for and return all entities in the world_object_instances table with a pose in the 
+        given frame within the given distance of the center point.
+        
+        @param frame_id: the frame_id of the poses to search
+        @type  frame_id: string
+        @param center: the X, Y, Z center point
+        @type  center: list
+        @param radius: the maximum distance from the center point
+        @type  radius: float
+        @param tags: only return entities that contain all of these tags (optional)
+        @type  tags: list
+        @param history: if expired and archived entities should be searched as well
+        @type  history: bool
+        @param columns: the columns to return (the instance_id is always returned), or None for all
+        @type  columns: list
+        @return: the entities found, sorted by distance
+        @rtype: list
+        '''
+        if not self.spatial:
+            tree = self._spatial_index(frame_id, tags, history)
+            return self._search_keys([key for d, key in tree.radius(center, radius)], history, 
+                                     columns)
+        lo = [c - radius for c in center]
+        hi = [c + radius for c in center]
+        # the bounding box uses the index, the distance check refines it
+        sql = ("""SELECT """ + self._projection(columns)[0] + """ FROM """ + 
+               self._source(history) + """ WHERE pose_point <@ 
+               cube(%s::double precision[], %s::double precision[]) 
+               AND cube_distance(pose_point, cube(%s::double precision[])) <= %s""")
+        values = (lo, hi, list(center), radius)
+        sql, values = self._spatial_filter(sql, values, frame_id, tags)
+        sql += """ ORDER BY cube_distance(pose_point, cube(%s::double precision[]))"""
+        values += (list(center),)
+        return self._search_sql(sql, values, columns)
+
+    def search_box(self, frame_id, lo, hi, tags=[], history=False, columns=None):
+        '''
+        Search for and return all entities in the world_object_instances table with a pose in the 
+        given frame within the given axis-aligned box.
+        
+        @param frame_id: the frame_id of the poses to search
+        @type  frame_id: string
+        @param lo: the X, Y, Z minimum corner of the box
+        @type  lo: list
+        @param hi: the X, Y, Z maximum corner of the box
+        @type  hi: list
+        @param tags: only return entities that contain all of these tags (optional)
+        @type  tags: list
+        @param history: if expired and archived entities should be searched as well
+        @type  history: bool
+        @param columns: the columns to return (the instance_id is always returned), or None for all
+        @type  columns: list
+        @return: the entities found
+        @rtype: list
+        '''
+        if not self.spatial:
+            tree = self._spatial_index(frame_id, tags, history)
+            return self._search_keys(tree.box(lo, hi), history, columns)
+        sql = ("""SELECT """ + self._projection(columns)[0] + """ FROM """ + 
+               self._source(history) + """ WHERE pose_point <@ 
+               cube(%s::double precision[], %s::double precision[])""")
+        values = (list(lo), list(hi))
+        sql, values = self._spatial_filter(sql, values, frame_id, tags)
+        return self._search_sql(sql, values, columns)
+
+    def search_nearest(self, frame_id, center, k, tags=[], history=False, columns=None):
+        '''
+        Search for and return the k entities in the world_object_instances table with a pose in the
+        given frame nearest to the center point.
+        
+        @param frame_id: the frame_id of the poses to search
+        @type  frame_id: string
+        @param center: the X, Y, Z center point
+        @type  center: list
+        @param k: the number of entities to return
+        @type  k: int
+        @param tags: only return entities that contain all of these tags (optional)
+        @type  tags: list
+        @param history: if expired and archived entities should be searched as well
+        @type  history: bool
+        @param columns: the columns to return (the instance_id is always returned), or None for all
+        @type  columns: list
+        @return: the entities found, sorted by distance
+        @rtype: list
+        '''
+        if k <= 0:
+            return []
+        if not self.spatial:
+            tree = self._spatial_index(frame_id, tags, history)
+            return self._search_keys([key for d, key in tree.nearest(center, k)], history, 
+                                     columns)
+        sql = ("""SELECT """ + self._projection(columns)[0] + """ FROM """ + 
+               self._source(history) + """ WHERE pose_point IS NOT NULL""")
+        values = ()
+        sql, values = self._spatial_filter(sql, values, frame_id, tags)
+        # the distance operator uses the index to find the nearest entities
+        sql += """ ORDER BY pose_point <-> cube(%s::double precision[]) LIMIT %s"""
+        values += (list(center), k)
+        return self._search_sql(sql, values, columns)
+
+    def search_pose_history(self, instance_id, start=None, end=None, every=1, max_points=0):
+        '''
+        Search the pose history of the entity with the given instance_id. The poses are decimated 
+        by the database: every Nth pose is kept, or more if there would be more than max_points.
+        
+        @param instance_id: the instance_id of the entity
+        @type  instance_id: int
+        @param start: only return poses stamped at or after this unix time, or None for no limit
+        @type  start: float
+        @param end: only return poses stamped at or before this unix time, or None for no limit
+        @type  end: float
+        @param every: only return every Nth pose
+        @type  every: int
+        @param max_points: the maximum number of poses to return, or 0 for no limit
+        @type  max_points: int
+        @return: the (stamp, frame_id, position, orientation) of each pose found ordered by stamp
+        @rtype:  list
+        '''
+        if not self.pose_history:
+            return []
+        start = unix_to_timestamp(start) if start is not None else '-infinity'
+        end = unix_to_timestamp(end) if end is not None else 'infinity'
+        with self.pool.connection(read_only=True) as conn:
+            # create a cursor
+            cur = conn.cursor()
+            # number the poses in the range and keep every step-th one
+            execute(cur, 'woi_pose_history', """SELECT 
+                        extract(epoch FROM pose_stamp)::double precision, pose_frame_id, 
+                        pose_position, pose_orientation 
+                    FROM (SELECT pose_stamp, pose_frame_id, pose_position, pose_orientation, 
+                            row_number() OVER (ORDER BY pose_stamp) - 1 AS n, 
+                            count(*) OVER () AS total 
+                        FROM """ + self._poses + """ WHERE instance_id = %s 
+                        AND pose_stamp >= %s::timestamp with time zone 
+                        AND pose_stamp <= %s::timestamp with time zone) AS h 
+                    WHERE n %% GREATEST(%s::bigint, 
+                        CEIL(total::double precision / NULLIF(%s::bigint, 0))::bigint) = 0 
+                    ORDER BY pose_stamp""", (instance_id, start, end, max(every, 1), max_points))
+            results = cur.fetchall()
+            cur.close()
+        return results
+
+    def expire_entities(self, limit=1000):
+        '''
+        Set the perceived_end of live entities in the world_object_instances table whose 
+        expected_ttl has passed since their last update. The expiry index is used to find them.
+        
+        @param limit: the maximum number of entities to expire at once
+        @type  limit: int
+        @return: the instance_ids of the expired entities
+        @rtype:  list
+        '''
+        with self.pool.connection() as conn:
+            # create a cursor
+            cur = conn.cursor()
+            execute(cur, 'woi_expire', """UPDATE """ + self._woi + """ SET perceived_end = now() 
+                    WHERE instance_id IN (SELECT instance_id FROM """ + self._woi + """ 
+                        WHERE perceived_end IS NULL AND expected_ttl > 0 
+                        AND world_model_expiry(update, expected_ttl) < now() 
+                        ORDER BY world_model_expiry(update, expected_ttl) LIMIT %s 
+                        FOR UPDATE SKIP LOCKED) 
+                    RETURNING instance_id""", (limit,))
+            instance_ids = [r[0] for r in cur.fetchall()]
+            conn.commit()
+            cur.close()
+        return instance_ids
+
+    def archive_entities(self, older_than, limit=1000):
+        '''
+        Move entities which expired more than the given number of seconds ago from the 
+        world_object_instances table to the archive. Monthly partitions of the archive are created 
+        as needed.
+        
+        @param older_than: the minimum number of seconds since the perceived_end
+        @type  older_than: float
+        @param limit: the maximum number of entities to archive at once
+        @type  limit: int
+        @return: the number of entities archived
+        @rtype:  int
+        '''
+        cols = self._select + (', pose_point' if self.spatial else '')
+        with self.pool.connection() as conn:
+            # create a cursor
+            cur = conn.cursor()
+            # find the months (in UTC) that need a partition
+            execute(cur, 'woi_archive_months', """SELECT generate_series(
+                        date_trunc('month', min(perceived_end) AT TIME ZONE 'UTC'), 
+                        date_trunc('month', now() AT TIME ZONE 'UTC'), interval '1 month') 
+                    FROM """ + self._woi + """ 
+                    WHERE perceived_end < now() - %s * interval '1 second'""", (older_than,))
+            for month in [r[0] for r in cur.fetchall()]:
+                self._create_archive_partition(cur, month)
+            execute(cur, 'woi_archive', """WITH moved AS (
+                        DELETE FROM """ + self._woi + """ WHERE instance_id IN (
+                            SELECT instance_id FROM """ + self._woi + """ 
+                            WHERE perceived_end < now() - %s * interval '1 second' 
+                            ORDER BY perceived_end LIMIT %s FOR UPDATE SKIP LOCKED) 
+                        RETURNING """ + cols + """) 
+                    INSERT INTO """ + self._archive + """ (""" + cols + """) 
+                    SELECT """ + cols + """ FROM moved""", (older_than, limit))
+            count = cur.rowcount
+            conn.commit()
+            cur.close()
+        return count
+
+    def _create_archive_partition(self, cur, month):
+        '''
+        Create the partition of the archive for the given month, if it does not exist yet.
+        
+        @param cur: the cursor to use
+        @type  cur: cursor
+        @param month: the first day of the month (in UTC)
+        @type  month: datetime
+        '''
+        name = self._archive + month.strftime('_%Y_%m')
+        end = (month + datetime.timedelta(days=32)).replace(day=1)
+        cur.execute("""CREATE TABLE IF NOT EXISTS """ + name + """ PARTITION OF """ + 
+                    self._archive + """ FOR VALUES FROM (%s) TO (%s);
+                    CREATE INDEX IF NOT EXISTS """ + name + """_instance_id ON """ + name + 
+                    """ (instance_id);
+                    CREATE INDEX IF NOT EXISTS """ + name + """_tags ON """ + name + 
+                    """ USING gin (tags)""", 
+                    (month.strftime('%Y-%m-%d 00:00:00+00'), end.strftime('%Y-%m-%d 00:00:00+00')))
+
+    def _record_poses(self, cur, written):
+        '''
+        Append the current pose of each of the given written entities with a position to the pose
+        history. The stamp of the pose, or the update time if it has none, is used. This must be 
+        done in the same transaction as the write. Daily partitions are normally created ahead of 
+        time (see create_pose_partitions), otherwise they are created as needed.
+        
+        @param cur: the cursor used for the write
+        @type  cur: cursor
+        @param written: the (instance_id, entity) pairs that were written
+        @type  written: list
+        @return: the days (in UTC) of the partitions used, to be remembered after a commit
+        @rtype:  set
+        '''
+        days = set()
+        if not self.pose_history:
+            return days
+        instance_ids = []
+        stamps = []
+        for instance_id, entity in written:
+            if entity.get('pose_position') is None:
+                continue
+            stamp = entity.get('pose_stamp') or entity.get('update') or time.time()
+            instance_ids.append(instance_id)
+            stamps.append(unix_to_timestamp(stamp))
+            days.add(stamps[-1].date())
+        if len(instance_ids) is 0:
+            return days
+        for day in days - self._pose_days:
+            # writers creating the same partition conflict, so the loser tries again
+            cur.execute("""SAVEPOINT pose_partition""")
+            try:
+                self._create_pose_partition(cur, day)
+            except (psycopg2.IntegrityError, psycopg2.ProgrammingError):
+                # (a duplicate type or table)
+                cur.execute("""ROLLBACK TO SAVEPOINT pose_partition""")
+                self._create_pose_partition(cur, day)
+            cur.execute("""RELEASE SAVEPOINT pose_partition""")
+        # the frame and orientation are taken from the row as written
+        execute(cur, 'woi_record_poses', """INSERT INTO """ + self._poses + """ 
+                    (instance_id, pose_stamp, pose_frame_id, pose_position, pose_orientation) 
+                SELECT instance_id, p.stamp, pose_frame_id, pose_position, pose_orientation 
+                FROM """ + self._woi + """ 
+                JOIN unnest(%s::bigint[], %s::timestamp with time zone[]) AS p (instance_id, stamp) 
+                USING (instance_id)""", (instance_ids, stamps))
+        return days
+
+    def create_pose_partitions(self, days=2):
+        '''
+        Create the partitions of the pose history for today and the following days (in UTC) in 
+        their own transaction, so writers do not have to create them.
+        
+        @param days: the number of days to create partitions for
+        @type  days: int
+        '''
+        if not self.pose_history:
+            return
+        today = datetime.datetime.utcnow().date()
+        missing = set(today + datetime.timedelta(days=i) for i in range(days)) - self._pose_days
+        if len(missing) is 0:
+            return
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            for day in sorted(missing):
+                self._create_pose_partition(cur, day)
+            conn.commit()
+            cur.close()
+        self._pose_days.update(missing)
+
+    def _create_pose_partition(self, cur, day):
+        '''
+        Create the partition of the pose history for the given day, if it does not exist yet.
+        
+        @param cur: the cursor to use
+        @type  cur: cursor
+        @param day: the day (in UTC)
+        @type  day: date
+        '''
+        name = self._poses + day.strftime('_%Y_%m_%d')
+        end = day + datetime.timedelta(days=1)
+        cur.execute("""CREATE TABLE IF NOT EXISTS """ + name + """ PARTITION OF """ + 
+                    self._poses + """ FOR VALUES FROM (%s) TO (%s);
+                    CREATE INDEX IF NOT EXISTS """ + name + """_instance_id ON """ + name + 
+                    """ (instance_id, pose_stamp)""", 
+                    (day.strftime('%Y-%m-%d 00:00:00+00'), end.strftime('%Y-%m-%d 00:00:00+00')))
+
+    def _spatial_filter(self, sql, values, frame_id, tags):
+        '''
+        Add the frame_id and tags filters of a spatial search to the given SQL.
+        
+        @param sql: the SQL to add the filters to
+        @type  sql: string
+        @param values: the values of the SQL
+        @type  values: tuple
+        @param frame_id: the frame_id of the poses to search
+        @type  frame_id: string
+        @param tags: only match entities that contain all of these tags (optional)
+        @type  tags: list
+        @return: the SQL and the values with the filters added
+        @rtype: tuple
+        '''
+        # empty frames are stored as NULL
+        sql += """ AND pose_frame_id IS NOT DISTINCT FROM %s"""
+        values += (frame_id if len(frame_id) > 0 else None,)
+        if len(tags) > 0:
+            sql += """ AND tags @> %s::character varying[]"""
+            values += (list(tags),)
+        return (sql, values)
+
+    def _search_sql(self, sql, values, columns=None):
+        '''
+        Run the given search and return the entities found.
+        
+        @param sql: the SQL of the search
+        @type  sql: string
+        @param values: the values of the SQL
+        @type  values: tuple
+        @param columns: the columns selected by the search, or None for all
+        @type  columns: list
+        @return: the entities found
+        @rtype: list
+        '''
+        final = []
+        row_factory = self._projection(columns)[1]
+        with self.pool.connection(read_only=True) as conn:
+            # create a cursor
+            cur = conn.cursor()
+            execute(cur, 'woi_spatial_search', sql, values)
+            # extract the values
+            results = cur.fetchall()
+            with self.pool.stats.time('woi.convert'):
+                for r in results:
+                    # convert with the row factory
+                    final.append(row_factory(r))
+            cur.close()
+        return final
+
+    def _search_keys(self, instance_ids, history=False, columns=None):
+        '''
+        Get the entities with the given instance_ids, in the same order. Entities that no longer 
+        exist are skipped.
+        
+        @param instance_ids: the instance_ids to get
+        @type  instance_ids: list
+        @param history: if archived entities should be searched as well
+        @type  history: bool
+        @param columns: the columns to return, or None for all
+        @type  columns: list
+        @return: the entities found
+        @rtype: list
+        '''
+        entities = self.search_instance_ids(instance_ids, history, columns)
+        return [entities[i] for i in instance_ids if i in entities]
+
+    def _projection(self, columns):
+        '''
+        Get the SELECT list and the row factory of a search for the given columns. The instance_id 
+        is always selected first and the other columns are kept in the order of the table.
+        
+        @param columns: the columns to select, or None for all
+        @type  columns: list
+        @return: the SELECT list and the row factory
+        @rtype:  tuple
+        '''
+        if columns is None:
+            return (self._select, self.row_factory)
+        for c in columns:
+            if c not in self.columns:
+                raise ValueError('Unknown column of ' + self._woi + ': ' + str(c))
+        selected = tuple([c for c in self.columns if c == 'instance_id' or c in columns])
+        # row factories are only created once for each set of columns
+        row_factory = self._projections.get(selected)
+        if row_factory is None:
+            row_factory = self.projection_factory(list(selected))
+            self._projections[selected] = row_factory
+        return (', '.join(selected), row_factory)
+
+    def _check_spatial(self):
+        '''
+        Check if the world_object_instances table has a spatially indexed pose_point column.
+        
+        @return: if the pose_point column exists
+        @rtype: bool
+        '''
+        with self.pool.connection() as conn:
+            # create a cursor
+            cur = conn.cursor()
+            cur.execute("""SELECT column_name FROM information_schema.columns 
+                        WHERE table_name = %s AND column_name = 'pose_point'""", (self._woi,))
+            result = len(cur.fetchall()) > 0
+            cur.close()
+        return result
+
+    def _check_table(self, table):
+        '''
+        Check if the given table exists.
+        
+        @param table: the name of the table
+        @type  table: string
+        @return: if the table exists
+        @rtype: bool
+        '''
+        with self.pool.connection() as conn:
+            # create a cursor
+            cur = conn.cursor()
+            cur.execute("""SELECT table_name FROM information_schema.tables 
+                        WHERE table_name = %s""", (table,))
+            result = len(cur.fetchall()) > 0
+            cur.close()
+        return result
+
+    def _source(self, history):
+        '''
+        Get the FROM clause of a search. By default, only live entities (i.e., without a 
+        perceived_end) are searched. With history, expired and archived entities are searched too.
+        
+        @param history: if expired and archived entities should be searched
+        @type  history: bool
+        @return: the table or subquery to search
+        @rtype: string
+        '''
+        cols = self._select + (', pose_point' if self.spatial else '')
+        if not history:
+            return ('(SELECT ' + cols + ' FROM ' + self._woi + 
+                    ' WHERE perceived_end IS NULL) AS ' + self._woi)
+        elif self.history:
+            return ('(SELECT ' + cols + ' FROM ' + self._woi + ' UNION ALL SELECT ' + cols + 
+                    ' FROM ' + self._archive + ') AS ' + self._woi)
+        else:
+            return self._woi
+
+    def _spatial_index(self, frame_id, tags, history=False):
+        '''
+        Get the in-process spatial index of the positions in the given frame of the entities with
+        the given tags. Indexes are rebuilt after writes through this connection that affect them or
+        once they are older than spatial_max_age (to pick up writes from elsewhere).
+        
+        @param frame_id: the frame_id of the poses to index
+        @type  frame_id: string
+        @param tags: only index entities that contain all of these tags (optional)
+        @type  tags: list
+        @param history: if expired and archived entities should be indexed as well
+        @type  history: bool
+        @return: the spatial index keyed by instance_id
+        @rtype: KDTree
+        '''
+        key = (frame_id, tuple(sorted(set(tags))), history)
+        with self._trees_lock:
+            if key in self._trees and time.time() - self._trees[key][0] < self.spatial_max_age:
+                return self._trees[key][1]
+        sql = ("""SELECT instance_id, pose_position FROM """ + self._source(history) + 
+               """ WHERE array_length(pose_position, 1) = 3""")
+        sql, values = self._spatial_filter(sql, (), frame_id, tags)
+        built = time.time()
+        with self.pool.connection(read_only=True) as conn:
+            # create a cursor
+            cur = conn.cursor()
+            execute(cur, 'woi_spatial_index', sql, values)
+            tree = KDTree([(r[1], r[0]) for r in cur.fetchall()])
+            cur.close()
+        with self._trees_lock:
+            self._trees[key] = (built, tree)
+        return tree
+
+    def _pose_written(self, writes):
+        '''
+        Invalidate the in-process spatial indexes affected by the given writes. An index is 
+        affected if it already holds a written entity or if the entity may now belong in it (its 
+        frame and tags are compared if they were written). Other indexes are kept.
+        
+        @param writes: the (instance_id, entity) pairs that were written
+        @type  writes: list
+        '''
+        if self.spatial:
+            return
+        with self._trees_lock:
+            for instance_id, entity in writes:
+                # only writes of the indexed fields change an index
+                if len(set(entity.keys()) & set(self._indexed)) is 0:
+                    continue
+                for key in self._trees.keys():
+                    if self._tree_affected(key, instance_id, entity):
+                        del self._trees[key]
+
+    def _tree_affected(self, key, instance_id, entity):
+        '''
+        Check if the in-process spatial index with the given key is affected by the given write.
+        
+        @param key: the (frame_id, tags, history) key of the index
+        @type  key: tuple
+        @param instance_id: the instance_id of the written entity
+        @type  instance_id: int
+        @param entity: the written entity
+        @type  entity: dict
+        @return: if the index must be rebuilt
+        @rtype: bool
+        '''
+        frame_id, tags, history = key
+        if self._trees[key][1].has_key(instance_id):
+            return True
+        # empty frames are stored as NULL
+        if 'pose_frame_id' in entity.keys() and (entity['pose_frame_id'] or '') != frame_id:
+            return False
+        if 'tags' in entity.keys() and not set(tags).issubset(entity['tags'] or []):
+            return False
+        return True
+
     def _db_to_dict(self, entity):
         '''
         Convert a database tuple to a dict. This will also convert timestamps back into unix time.
@@ -185,14 +1052,14 @@ class WorldObjectInstanceConnection(object):
         final = {
                 'instance_id' : entity[0],
                 'name' : entity[1],
-                'creation' : None if entity[2] is None else float(entity[2].strftime('%s.%f')),
-                'update' : None if entity[3] is None else float(entity[3].strftime('%s.%f')),
+                'creation' : timestamp_to_unix(entity[2]),
+                'update' : timestamp_to_unix(entity[3]),
                 'expected_ttl' : entity[4],
-                'perceived_end' : None if entity[5] is None else float(entity[5].strftime('%s.%f')),
+                'perceived_end' : timestamp_to_unix(entity[5]),
                 'source_origin' : entity[6],
                 'source_creator' : entity[7],
                 'pose_seq' : entity[8],
-                'pose_stamp' : None if entity[9] is None else float(entity[9].strftime('%s.%f')),
+                'pose_stamp' : timestamp_to_unix(entity[9]),
                 'pose_frame_id' : entity[10],
                 'pose_position' : entity[11],
                 'pose_orientation' : entity[12],
@@ -203,28 +1070,91 @@ class WorldObjectInstanceConnection(object):
                 }
         return final
 
-    def _build_sql_helper(self, entity):
+    def _projected_dict_factory(self, columns):
+        '''
+        Create the function which converts a database tuple with only the given columns to a dict.
+        This will also convert timestamps back into unix time.
+        
+        @param columns: the columns of the tuples in order
+        @type  columns: list
+        @return: the function which converts a tuple into a dict
+        @rtype:  function
+        '''
+        timestamps = [c for c in columns if c in self.timestamps]
+        def convert(entity):
+            final = dict(zip(columns, entity))
+            for k in timestamps:
+                final[k] = timestamp_to_unix(final[k])
+            return final
+        return convert
+
+    def _build_sql_helper(self, entity, cols=None):
         '''
         A helper function to build the SQL for an insertion/update. This will take the entity dict
         and create a new dict containing a string of comma separated column names, a string of
-        comma separated place holders (either '%s' or 'to_timestamp(...)'), and a tuple of the
-        values.
+        comma separated place holders (i.e., '%s'), a string of comma separated assignments for an
+        UPDATE (i.e., 'col = %s', since a list of a single column cannot be set from a list of
+        place holders), and a tuple of the values. Timestamps are converted so they are bound as 
+        parameters like any other value.
         
         @param entity: the entity to build the SQL helper for
         @type  entity: dict
-        @return: the dictionary containing the three helper variables
+        @param cols: the ordered list of column names to use, or None for the sorted entity keys
+        @type  cols: list
+        @return: the dictionary containing the four helper variables
         @rtype: dict
         '''
-        final = {'cols' : '', 'holders' : '', 'values' : ()}
-        for k in entity.keys():
+        final = {'cols' : '', 'holders' : '', 'sets' : '', 'values' : ()}
+        # a fixed order means entities with the same columns share a prepared statement
+        if cols is None:
+            cols = sorted(entity.keys())
+        for k in cols:
             final['cols'] += k + ', '
+            final['holders'] += '%s, '
+            final['sets'] += k + ' = %s, '
             # check if this is a timestamp
             if k in self.timestamps:
-                final['holders'] += 'to_timestamp(' + str(entity[k]) + '), '
-            else :
-                final['holders'] += '%s, '
+                final['values'] += (unix_to_timestamp(entity[k]),)
+            else:
                 final['values'] += (entity[k],)
+        # keep the spatial index in sync with the position
+        if self.spatial and 'pose_position' in cols:
+            final['cols'] += 'pose_point, '
+            final['holders'] += 'cube(%s::double precision[]), '
+            final['sets'] += 'pose_point = cube(%s::double precision[]), '
+            final['values'] += (entity['pose_position'],)
         # remove trailing ', '
         final['cols'] = final['cols'][:-2]
         final['holders'] = final['holders'][:-2]
+        final['sets'] = final['sets'][:-2]
         return final
+
+    def _build_row_sql(self, cur, cols, entity):
+        '''
+        A helper function to build the SQL for a single row of a multi-row insertion. Columns that
+        are not in the entity are set to NULL.
+        
+        @param cur: the cursor used to quote the values
+        @type  cur: cursor
+        @param cols: the ordered list of column names
+        @type  cols: list
+        @param entity: the entity to build the SQL for
+        @type  entity: dict
+        @return: the SQL for the row (e.g., '(nextval(...), %s, ...)' with the values filled in)
+        @rtype: string
+        '''
+        holders = "nextval('world_object_instances_instance_id_seq')"
+        values = ()
+        for k in cols:
+            if k == 'pose_point' and 'pose_position' in entity.keys():
+                holders += ', cube(%s::double precision[])'
+                values += (entity['pose_position'],)
+            elif k not in entity.keys():
+                holders += ', NULL'
+            elif k in self.timestamps:
+                holders += ', %s'
+                values += (unix_to_timestamp(entity[k]),)
+            else:
+                holders += ', %s'
+                values += (entity[k],)
+        return cur.mogrify('(' + holders + ')', values)
@@ -0,0 +1,378 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2013, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+# * Neither the name of Willow Garage, Inc. nor the names of its
+# contributors may be used to endorse or promote products derived
+# from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+'''
+The WriteBuffer class buffers updates and writes them in batches from a background thread. Pending
+updates with the same key (e.g., an instance_id) are merged field by field with the latest values
+winning, so a fast stream of updates to the same entity results in one write per batch. When a
+batch fails, its updates are written one at a time so a single bad update cannot hold back the 
+others, and updates which keep failing are rejected after a number of attempts.
+
+@author:  Russell Toris
+@version: May 7, 2013
+'''
+
+import collections
+import threading
+import time
+
+class WriteBuffer(object):
+    '''
+    The main WriteBuffer object. Counts are kept for monitoring the backpressure.
+    '''
+
+    def __init__(self, write, interval=0.05, batch_size=500, max_pending=10000, 
+                 retry_interval=1.0, max_attempts=5, on_error=None):
+        '''
+        Creates the WriteBuffer object. Nothing will be written until it is started.
+        
+        @param write: the function which writes a list of (key, entity) pairs in a single 
+                      transaction and returns if each was written (e.g., 
+                      update_entities_by_instance_id)
+        @type  write: function
+        @param interval: the maximum time in seconds an update waits before it is written
+        @type  interval: float
+        @param batch_size: the maximum number of updates written at once (a full batch is written
+                           without waiting for the interval)
+        @type  batch_size: int
+        @param max_pending: the maximum number of keys with pending updates (updates to other keys
+                            block until there is room)
+        @type  max_pending: int
+        @param retry_interval: the time in seconds to wait before retrying a failed write
+        @type  retry_interval: float
+        @param max_attempts: the number of times an update is tried before it is rejected
+        @type  max_attempts: int
+        @param on_error: the function to call with the message of each failed write, if any
+        @type  on_error: function
+        '''
+        self._write = write
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.retry_interval = retry_interval
+        self.max_attempts = max_attempts
+        self._on_error = on_error
+        # the number of updates given, merged into a pending update, and written
+        self.updates = 0
+        self.coalesced = 0
+        self.written = 0
+        # the number of updates the write function did not write (e.g., unknown instance_ids)
+        self.rejected = 0
+        # the number of batches written and failed writes
+        self.batches = 0
+        self.errors = 0
+        # the number of updates that had to wait for room and the total time spent waiting
+        self.blocked = 0
+        self.blocked_time = 0.0
+        # the largest number of keys pending at once
+        self.high_water = 0
+        # the pending updates as key : [entity, sequence number of the latest update, attempts]
+        self._pending = collections.OrderedDict()
+        # the sequence number of the latest update and of the latest update known to be written
+        self._seq = 0
+        self._flushed = 0
+        # the keys the write function did not write as key : sequence number
+        self._rejected = {}
+        # rejections up to this sequence number may have been forgotten
+        self._rejected_floor = 0
+        self._flush_requested = False
+        self._thread = None
+        self._running = False
+        # create a condition for the pending updates
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        '''
+        Get the number of keys with pending updates.
+        
+        @return: the number of keys
+        @rtype:  int
+        '''
+        return len(self._pending)
+
+    def start(self):
+        '''
+        Start writing the buffered updates in a background thread.
+        '''
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        '''
+        Write any pending updates and stop the background thread. This will block until the 
+        background thread has finished.
+        '''
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def put(self, key, entity):
+        '''
+        Buffer an update. If there is already a pending update for the key, the fields of the 
+        entity are merged into it. If the buffer is full, this blocks until there is room.
+        
+        @param key: the key of the entity to update (e.g., the instance_id)
+        @type  key: object
+        @param entity: the fields to update
+        @type  entity: dict
+        @return: the sequence number of the update (see wait)
+        @rtype:  int
+        '''
+        with self._cond:
+            if key not in self._pending and len(self._pending) >= self.max_pending:
+                # backpressure: write now and wait for room
+                self.blocked += 1
+                start = time.time()
+                self._flush_requested = True
+                self._cond.notify_all()
+                while (self._running and key not in self._pending 
+                       and len(self._pending) >= self.max_pending):
+                    self._cond.wait(self.interval)
+                self.blocked_time += time.time() - start
+            self._seq += 1
+            self.updates += 1
+            pending = self._pending.get(key)
+            if pending is not None:
+                # latest values win
+                pending[0].update(entity)
+                pending[1] = self._seq
+                self.coalesced += 1
+            else:
+                self._pending[key] = [dict(entity), self._seq, 0]
+                self.high_water = max(self.high_water, len(self._pending))
+                if len(self._pending) >= self.batch_size:
+                    self._cond.notify_all()
+            return self._seq
+
+    def wait(self, key, seq, timeout=None):
+        '''
+        Write the pending updates now and wait until the update with the given key and sequence 
+        number (as returned by put) is written.
+        
+        @param key: the key given to put
+        @type  key: object
+        @param seq: the sequence number returned by put
+        @type  seq: int
+        @param timeout: the maximum time in seconds to wait, or None to wait forever
+        @type  timeout: float
+        @return: if the update was written (False if it was rejected or the timeout was reached)
+        @rtype:  bool
+        '''
+        if not self.flush(seq, timeout):
+            return False
+        with self._cond:
+            # a rejection older than the floor may have been forgotten, so it is not known
+            return self._rejected.get(key, 0) < seq and seq > self._rejected_floor
+
+    def flush(self, seq=None, timeout=None):
+        '''
+        Write the pending updates now and wait until they are written.
+        
+        @param seq: only wait for the updates up to this sequence number, or None for all updates 
+                    given so far
+        @type  seq: int
+        @param timeout: the maximum time in seconds to wait, or None to wait forever
+        @type  timeout: float
+        @return: if the updates were written before the timeout
+        @rtype:  bool
+        '''
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            if seq is None:
+                seq = self._seq
+            while self._flushed < seq:
+                if not self._running:
+                    return False
+                self._flush_requested = True
+                self._cond.notify_all()
+                # wake up now and then in case the buffer is stopped
+                remaining = self.retry_interval
+                if deadline is not None:
+                    remaining = min(remaining, deadline - time.time())
+                    if remaining <= 0:
+                        return False
+                self._cond.wait(remaining)
+            return True
+
+    def _run(self):
+        '''
+        The main loop of the background thread. Pending updates are taken once the interval has 
+        passed, a full batch is pending, or a flush was requested. Updates from a failed write are
+        merged back into the pending updates and retried until they run out of attempts.
+        '''
+        while True:
+            with self._cond:
+                deadline = time.time() + self.interval
+                while (self._running and not self._flush_requested 
+                       and len(self._pending) < self.batch_size):
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if not self._running and len(self._pending) is 0:
+                    return
+                batch = self._pending.items()
+                self._pending = collections.OrderedDict()
+                seq = self._seq
+                self._flush_requested = False
+                # there is room again
+                self._cond.notify_all()
+            failed = self._write_batch(batch)
+            with self._cond:
+                if len(failed) is 0:
+                    self._flushed = seq
+                else:
+                    self._requeue(failed)
+                self._cond.notify_all()
+            if len(failed) > 0:
+                if not self._running:
+                    # give up on the updates that cannot be written
+                    with self._cond:
+                        self._reject([(key, pending[1]) for key, pending in self._pending.items()])
+                        self._pending = collections.OrderedDict()
+                        self._flushed = self._seq
+                        self._cond.notify_all()
+                    return
+                time.sleep(self.retry_interval)
+
+    def _write_batch(self, batch):
+        '''
+        Write the given updates, at most batch_size in each transaction. If a transaction fails, 
+        its updates are written one at a time to find the ones that fail. Updates which failed
+        max_attempts times are rejected.
+        
+        @param batch: the (key, [entity, sequence number, attempts]) pairs to write
+        @type  batch: list
+        @return: the pairs that could not be written because of an error and should be retried
+        @rtype:  list
+        '''
+        failed = []
+        for i in range(0, len(batch), self.batch_size):
+            chunk = batch[i:i + self.batch_size]
+            written = self._try_write(chunk)
+            if written is None and len(chunk) > 1:
+                # find the updates which fail on their own
+                written = []
+                for pair in chunk:
+                    single = self._try_write([pair])
+                    written.append(single[0] if single is not None else None)
+            elif written is None:
+                written = [None]
+            with self._cond:
+                for (key, pending), success in zip(chunk, written):
+                    if success is None:
+                        pending[2] += 1
+                        if pending[2] < self.max_attempts:
+                            failed.append((key, pending))
+                        else:
+                            self._error('Giving up on the update of ' + str(key) + ' after ' + 
+                                        str(pending[2]) + ' attempts.')
+                            self._reject([(key, pending[1])])
+                    elif success:
+                        self.written += 1
+                        self._rejected.pop(key, None)
+                    else:
+                        self._reject([(key, pending[1])])
+        return failed
+
+    def _try_write(self, chunk):
+        '''
+        Write the given updates in a single transaction.
+        
+        @param chunk: the (key, [entity, sequence number, attempts]) pairs to write
+        @type  chunk: list
+        @return: if each update was written, or None if the write failed
+        @rtype:  list
+        '''
+        try:
+            # the write function may change the entities it is given
+            written = self._write([(key, dict(pending[0])) for key, pending in chunk])
+        except Exception as e:
+            self._error('Could not write ' + str(len(chunk)) + ' buffered updates: ' + str(e))
+            with self._cond:
+                self.errors += 1
+            return None
+        with self._cond:
+            self.batches += 1
+        return written
+
+    def _reject(self, rejections):
+        '''
+        Record the given rejected updates. Only the most recent rejections are remembered. The
+        condition must be held.
+        
+        @param rejections: the (key, sequence number) pairs of the rejected updates
+        @type  rejections: list
+        '''
+        for key, seq in rejections:
+            self.rejected += 1
+            self._rejected[key] = max(seq, self._rejected.get(key, 0))
+        if len(self._rejected) > self.max_pending:
+            # forget the oldest half of the rejections
+            oldest = sorted(self._rejected.items(), key=lambda r: r[1])
+            for key, seq in oldest[:len(oldest) - (self.max_pending / 2)]:
+                del self._rejected[key]
+                self._rejected_floor = max(self._rejected_floor, seq)
+
+    def _error(self, message):
+        '''
+        Report the given error message to the error function, if any.
+        
+        @param message: the message
+        @type  message: string
+        '''
+        if self._on_error is not None:
+            self._on_error(message)
+
+    def _requeue(self, failed):
+        '''
+        Merge the updates of a failed write back into the pending updates. Fields set by newer 
+        pending updates win, and the attempts of the failed update are kept.
+        
+        @param failed: the (key, [entity, sequence number, attempts]) pairs that could not be 
+                       written
+        @type  failed: list
+        '''
+        for key, pending in failed:
+            newer = self._pending.get(key)
+            if newer is not None:
+                pending[0].update(newer[0])
+                pending[1] = newer[1]
+            self._pending[key] = pending
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2013, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+# * Neither the name of Willow Garage, Inc. nor the names of its
+# contributors may be used to endorse or promote products derived
+# from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+
+'''
+Round-trip tests for the embedded storage backend. Everything written is read back, both from the 
+store that wrote it and from a store loaded from the same SQLite file.
+
+@author:  Russell Toris
+@version: May 16, 2013
+'''
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from worldlib.embedded_store import *
+
+class TestEmbeddedStore(unittest.TestCase):
+    '''
+    Tests for the EmbeddedStore and its connections.
+    '''
+
+    def setUp(self):
+        '''
+        Create a store persisted to a temporary SQLite file.
+        '''
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, 'world_model.db')
+        self._open()
+
+    def tearDown(self):
+        '''
+        Close the store and delete its file.
+        '''
+        self._store.close()
+        shutil.rmtree(self._dir)
+
+    def _open(self):
+        '''
+        Open (or reopen) the store and its connections.
+        '''
+        self._store = EmbeddedStore(self._path)
+        self._woic = EmbeddedWorldObjectInstanceConnection(self._store)
+        self._wodc = EmbeddedWorldObjectDescriptionConnection(self._store)
+        self._dc = EmbeddedDescriptorConnection(self._store)
+
+    def _reopen(self):
+        '''
+        Close the store and load it again from its file.
+        '''
+        self._store.close()
+        self._open()
+
+    def _instance(self, tags, ttl=60, age=0.0):
+        '''
+        Create an instance entity.
+        
+        @param tags: the tags of the instance
+        @type  tags: list
+        @param ttl: the expected_ttl in seconds
+        @type  ttl: int
+        @param age: the number of seconds since the instance was updated
+        @type  age: float
+        @return: the entity
+        @rtype:  dict
+        '''
+        t = time.time() - age
+        return {'name' : 'instance', 'creation' : t, 'update' : t, 'expected_ttl' : ttl, 
+                'pose_frame_id' : '/map', 'pose_position' : [1.0, 2.0, 3.0], 
+                'pose_orientation' : [0.0, 0.0, 0.0, 1.0], 'tags' : tags}
+
+    def test_create_and_update(self):
+        '''
+        Created and updated instances are read back, also after the store is reloaded.
+        '''
+        instance_id = self._woic.insert(self._instance(['robot', 'pr2']))
+        self.assertTrue(self._woic.update_entity_by_instance_id(instance_id, {'name' : 'pr2'}))
+        self.assertFalse(self._woic.update_entity_by_instance_id(instance_id + 1, {'name' : 'x'}))
+        for reopen in [False, True]:
+            if reopen:
+                self._reopen()
+            entity = self._woic.search_instance_ids([instance_id])[instance_id]
+            self.assertEqual(entity['name'], 'pr2')
+            self.assertEqual(entity['expected_ttl'], 60)
+            self.assertEqual(list(entity['pose_position']), [1.0, 2.0, 3.0])
+            self.assertEqual(sorted(entity['tags']), ['pr2', 'robot'])
+        # new instance_ids continue after the loaded ones
+        self.assertTrue(self._woic.insert(self._instance(['robot'])) > instance_id)
+
+    def test_tag_search(self):
+        '''
+        Tag searches match all, any, or none of the tags and upserts are keyed by the set of tags.
+        '''
+        a = self._woic.insert(self._instance(['robot', 'pr2']))
+        b = self._woic.insert(self._instance(['robot', 'turtlebot']))
+        c = self._woic.insert(self._instance(['map']))
+        ids = lambda found: sorted(e['instance_id'] for e in found)
+        self.assertEqual(ids(self._woic.search_tags(['robot'])), [a, b])
+        self.assertEqual(ids(self._woic.search_tags(['robot', 'pr2'])), [a])
+        self.assertEqual(ids(self._woic.search_tags(['pr2', 'map'], MATCH_ANY)), [a, c])
+        self.assertEqual(ids(self._woic.search_tags(['robot'], MATCH_NONE)), [c])
+        instance_id, created = self._woic.upsert_by_tags(self._instance(['kitchen', 'table']))
+        self.assertTrue(created)
+        self._reopen()
+        self.assertEqual(self._woic.upsert_by_tags(self._instance(['table', 'kitchen'])), 
+                         (instance_id, False))
+        self.assertEqual(ids(self._woic.search_tags(['robot'])), [a, b])
+
+    def test_expiry(self):
+        '''
+        Instances expire once their expected_ttl has passed, are archived later, and can still be 
+        found in the history.
+        '''
+        old = self._woic.insert(self._instance(['robot'], 1, 10.0))
+        live = self._woic.insert(self._instance(['robot'], 60))
+        forever = self._woic.insert(self._instance(['robot'], 0, 10.0))
+        self.assertEqual(self._woic.expire_entities(), [old])
+        self.assertEqual(self._woic.expire_entities(), [])
+        ids = lambda found: sorted(e['instance_id'] for e in found)
+        self.assertEqual(ids(self._woic.search_tags(['robot'])), [live, forever])
+        self.assertEqual(ids(self._woic.search_tags(['robot'], history=True)), 
+                         [old, live, forever])
+        self.assertTrue(self._woic.search_instance_ids([old])[old]['perceived_end'] is not None)
+        self.assertEqual(self._woic.archive_entities(3600.0), 0)
+        self.assertEqual(self._woic.archive_entities(0.0), 1)
+        self._reopen()
+        self.assertEqual(self._woic.search_instance_ids([old]), {})
+        self.assertEqual(self._woic.search_instance_ids([old], history=True).keys(), [old])
+        self.assertEqual(ids(self._woic.search_tags(['robot'], history=True)), 
+                         [old, live, forever])
+
+    def test_descriptors(self):
+        '''
+        Descriptions and the data of their descriptors are read back.
+        '''
+        description_id = self._wodc.insert({'name' : 'map', 'tags' : ['map']})
+        descriptor_id = self._dc.insert({'description_id' : description_id, 'type' : 'test', 
+                                         'data' : 'some data', 'tags' : []})
+        self._reopen()
+        found = self._dc.search_by_description_id(description_id, True)
+        self.assertEqual([d['descriptor_id'] for d in found], [descriptor_id])
+        self.assertEqual(found[0]['data'], 'some data')
+        self.assertEqual(self._dc.read_data(descriptor_id, 5), ('data', 9))
+        self.assertEqual(self._wodc.search_description_ids([description_id]).keys(), 
+                         [description_id])
+
+if __name__ == '__main__':
+    unittest.main()
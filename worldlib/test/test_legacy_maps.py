@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2013, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+# * Neither the name of Willow Garage, Inc. nor the names of its
+# contributors may be used to endorse or promote products derived
+# from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+
+'''
+Tests for the legacy_maps module. A map stored by the old map listener (the JSON of the whole 
+OccupancyGrid with an empty encoding) must match the same map published again, whatever its header.
+
+@author:  Russell Toris
+@version: May 16, 2013
+'''
+
+import json
+import unittest
+from worldlib.descriptor_hash import descriptor_hash
+from worldlib.legacy_maps import is_legacy_map, matches_legacy_map
+
+class Message(object):
+    '''
+    A stand-in for ROS messages with the given fields.
+    '''
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+def _grid(stamp, width=3, height=2, resolution=0.05, data=(0, 100, -1, 0, 0, 100)):
+    '''
+    Create an OccupancyGrid message.
+    '''
+    header = Message(seq=0, stamp=Message(secs=stamp, nsecs=0), frame_id='/map')
+    info = Message(map_load_time=header.stamp, resolution=resolution, width=width, height=height)
+    return Message(header=header, info=info, data=data)
+
+def _legacy_data(msg):
+    '''
+    Get the descriptor data the old map listener stored for the given map.
+    '''
+    return json.dumps({'header' : {'seq' : msg.header.seq, 
+                                   'stamp' : {'secs' : msg.header.stamp.secs, 'nsecs' : 0}, 
+                                   'frame_id' : msg.header.frame_id},
+                       'info' : {'map_load_time' : {'secs' : msg.header.stamp.secs, 'nsecs' : 0},
+                                 'resolution' : msg.info.resolution, 'width' : msg.info.width,
+                                 'height' : msg.info.height, 
+                                 'origin' : {'position' : {'x' : 0.0, 'y' : 0.0, 'z' : 0.0},
+                                             'orientation' : {'x' : 0.0, 'y' : 0.0, 'z' : 0.0, 
+                                                              'w' : 1.0}}},
+                       'data' : list(msg.data)})
+
+class TestLegacyMaps(unittest.TestCase):
+    '''
+    Tests for matching legacy maps.
+    '''
+
+    def test_legacy_descriptor(self):
+        '''
+        Only maps without an encoding are legacy maps.
+        '''
+        legacy = Message(type='nav_msgs/OccupancyGrid', encoding='')
+        self.assertTrue(is_legacy_map(legacy))
+        self.assertFalse(is_legacy_map(Message(type='nav_msgs/OccupancyGrid', encoding='json')))
+        self.assertFalse(is_legacy_map(Message(type='world_model/MapTiles', encoding='')))
+
+    def test_match(self):
+        '''
+        A legacy map matches the same map published later, although their hashes differ.
+        '''
+        data = _legacy_data(_grid(1000))
+        msg = _grid(2000)
+        self.assertNotEqual(descriptor_hash('nav_msgs/OccupancyGrid', data, ''),
+                            descriptor_hash('nav_msgs/OccupancyGrid', _legacy_data(msg), ''))
+        self.assertTrue(matches_legacy_map(data, msg))
+        self.assertTrue(matches_legacy_map(data, _grid(1000, data=list(msg.data))))
+
+    def test_no_match(self):
+        '''
+        Maps with different cells, sizes, or resolutions do not match.
+        '''
+        data = _legacy_data(_grid(1000))
+        self.assertFalse(matches_legacy_map(data, _grid(1000, data=(0, 0, -1, 0, 0, 100))))
+        self.assertFalse(matches_legacy_map(data, _grid(1000, width=2, height=3)))
+        self.assertFalse(matches_legacy_map(data, _grid(1000, resolution=0.1)))
+
+    def test_invalid_data(self):
+        '''
+        Data that is not the JSON of an OccupancyGrid never matches.
+        '''
+        msg = _grid(1000)
+        self.assertFalse(matches_legacy_map('', msg))
+        self.assertFalse(matches_legacy_map('{"data":[]}', msg))
+        self.assertFalse(matches_legacy_map('[1, 2]', msg))
+
+if __name__ == '__main__':
+    unittest.main()
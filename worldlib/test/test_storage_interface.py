@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2013, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+# * Neither the name of Willow Garage, Inc. nor the names of its
+# contributors may be used to endorse or promote products derived
+# from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+
+
+'''
+Behavioral tests shared by the storage backends (see storage_interface). The tests always run 
+against the embedded store, and against PostgreSQL when WORLD_MODEL_TEST_HOST is set (along with 
+WORLD_MODEL_TEST_USER, WORLD_MODEL_TEST_PASSWORD, and WORLD_MODEL_TEST_DATABASE, which defaults to
+world_model_test). That database must be set up with setup_world_model first. Each test only uses
+tags of its own, so the database does not need to be empty.
+
+@author:  Russell Toris
+@version: May 16, 2013
+'''
+
+import inspect
+import os
+import time
+import unittest
+import uuid
+from worldlib.descriptor_hash import descriptor_hash
+from worldlib.embedded_store import *
+from worldlib.storage_interface import *
+from worldlib.tag_search import MATCH_ALL, MATCH_ANY
+
+# the host of the PostgreSQL test database, if any
+_HOST = os.environ.get('WORLD_MODEL_TEST_HOST')
+
+class StorageBehavior(object):
+    '''
+    The tests every storage backend must pass. Subclasses open the connections of their backend as
+    _woic, _wodc, _dc, and _mtc in setUp.
+    '''
+
+    def _tags(self, *tags):
+        '''
+        Make the given tags unique to this test.
+        
+        @param tags: the tags
+        @type  tags: list
+        @return: the tags unique to this test
+        @rtype:  list
+        '''
+        if not hasattr(self, '_suffix'):
+            self._suffix = '@' + uuid.uuid4().hex
+        return [t + self._suffix for t in tags]
+
+    def _instance(self, tags, ttl=60, age=0.0):
+        '''
+        Create an instance entity.
+        
+        @param tags: the tags of the instance
+        @type  tags: list
+        @param ttl: the expected_ttl in seconds
+        @type  ttl: int
+        @param age: the number of seconds since the instance was updated
+        @type  age: float
+        @return: the entity
+        @rtype:  dict
+        '''
+        t = time.time() - age
+        return {'name' : 'instance', 'creation' : t, 'update' : t, 'expected_ttl' : ttl, 
+                'pose_frame_id' : '/map', 'pose_position' : [1.0, 2.0, 3.0], 
+                'pose_orientation' : [0.0, 0.0, 0.0, 1.0], 'tags' : tags}
+
+    def _ids(self, found):
+        '''
+        Get the sorted instance_ids of the given entities.
+        
+        @param found: the entities
+        @type  found: list
+        @return: the instance_ids
+        @rtype:  list
+        '''
+        return sorted(e['instance_id'] for e in found)
+
+    def test_interface(self):
+        '''
+        The connections implement the interface with the same arguments for each method.
+        '''
+        pairs = [(self._woic, WorldObjectInstanceStorage), 
+                 (self._wodc, WorldObjectDescriptionStorage), (self._dc, DescriptorStorage), 
+                 (self._mtc, MapTileStorage)]
+        for connection, interface in pairs:
+            self.assertTrue(isinstance(connection, interface))
+            for m in interface.__abstractmethods__:
+                self.assertEqual(inspect.getargspec(getattr(connection, m)), 
+                                 inspect.getargspec(getattr(interface, m)), 
+                                 type(connection).__name__ + '.' + m + ' has different arguments')
+
+    def test_single_column_update(self):
+        '''
+        Updates of a single column only change that column.
+        '''
+        instance_id = self._woic.insert(self._instance(self._tags('robot')))
+        self.assertTrue(self._woic.update_entity_by_instance_id(instance_id, {'name' : 'pr2'}))
+        entity = self._woic.search_instance_ids([instance_id])[instance_id]
+        self.assertEqual(entity['name'], 'pr2')
+        self.assertEqual(list(entity['pose_position']), [1.0, 2.0, 3.0])
+        moved = {'pose_position' : [4.0, 5.0, 6.0]}
+        self.assertTrue(self._woic.update_entity_by_instance_id(instance_id, moved))
+        entity = self._woic.search_instance_ids([instance_id])[instance_id]
+        self.assertEqual(list(entity['pose_position']), [4.0, 5.0, 6.0])
+        self.assertEqual(entity['name'], 'pr2')
+
+    def test_multi_column_update(self):
+        '''
+        Updates of several instances at once report which instances exist.
+        '''
+        a, b = self._woic.insert_many([self._instance(self._tags('a')), 
+                                       self._instance(self._tags('b'))])
+        missing = max(a, b) + 1000000
+        self.assertEqual(self._woic.update_entities_by_instance_id(
+                             [(a, {'name' : 'a', 'expected_ttl' : 5}), (missing, {'name' : 'x'}),
+                              (b, {'name' : 'b'})]), [True, False, True])
+        found = self._woic.search_instance_ids([a, b])
+        self.assertEqual((found[a]['name'], found[a]['expected_ttl']), ('a', 5))
+        self.assertEqual(found[b]['name'], 'b')
+
+    def test_tag_search(self):
+        '''
+        Tag searches match all or any of the tags.
+        '''
+        a = self._woic.insert(self._instance(self._tags('robot', 'pr2')))
+        b = self._woic.insert(self._instance(self._tags('robot', 'turtlebot')))
+        c = self._woic.insert(self._instance(self._tags('map')))
+        self.assertEqual(self._ids(self._woic.search_tags(self._tags('robot'))), [a, b])
+        self.assertEqual(self._ids(self._woic.search_tags(self._tags('robot', 'pr2'))), [a])
+        self.assertEqual(self._ids(self._woic.search_tags(self._tags('pr2', 'map'), MATCH_ANY)), 
+                         [a, c])
+        found = self._woic.search_tags(self._tags('robot'), limit=1, columns=['name'])
+        self.assertEqual([e['instance_id'] for e in found], [a])
+        self.assertEqual(found[0]['name'], 'instance')
+
+    def test_create_then_upsert(self):
+        '''
+        An instance created with a set of tags is updated by an upsert with the same tags. Only the
+        first instance with the tags is.
+        '''
+        a = self._woic.insert(self._instance(self._tags('robot', 'pr2')))
+        b, c = self._woic.insert_many([self._instance(self._tags('pr2', 'robot')), 
+                                       self._instance(self._tags('robot', 'turtlebot'))])
+        self.assertEqual(self._woic.upsert_by_tags(self._instance(self._tags('pr2', 'robot'))), 
+                         (a, False))
+        turtlebot = self._instance(self._tags('turtlebot', 'robot'))
+        self.assertEqual(self._woic.upsert_by_tags(turtlebot), (c, False))
+        self.assertEqual(self._ids(self._woic.search_tags(self._tags('robot'))), [a, b, c])
+
+    def test_retag_then_upsert(self):
+        '''
+        An instance whose tags are updated is upserted by its new tags and no longer by its old 
+        tags.
+        '''
+        kitchen = self._tags('cup', 'kitchen')
+        office = self._tags('cup', 'office')
+        instance_id, created = self._woic.upsert_by_tags(self._instance(kitchen))
+        self.assertTrue(created)
+        self.assertTrue(self._woic.update_entity_by_instance_id(instance_id, {'tags' : office}))
+        self.assertEqual(self._woic.upsert_by_tags(self._instance(office[::-1])), 
+                         (instance_id, False))
+        other, created = self._woic.upsert_by_tags(self._instance(kitchen[::-1]))
+        self.assertTrue(created)
+        self.assertEqual(sorted(self._woic.search_instance_ids([instance_id])[instance_id]['tags']),
+                         sorted(office))
+        # the key of an instance's new tags may already be held by another instance
+        self.assertTrue(self._woic.update_entity_by_instance_id(other, {'tags' : office}))
+        self.assertEqual(self._woic.upsert_by_tags(self._instance(office)), (instance_id, False))
+        self.assertTrue(self._woic.upsert_by_tags(self._instance(kitchen))[1])
+
+    def test_spatial_search(self):
+        '''
+        Instances are found by their position, also after it was updated.
+        '''
+        tags = self._tags('robot')
+        a = self._woic.insert(self._instance(tags))
+        b = self._woic.insert(self._instance(tags))
+        self.assertEqual(self._ids(self._woic.search_radius('/map', [1.0, 2.0, 3.0], 0.5, tags)),
+                         [a, b])
+        self._woic.update_entity_by_instance_id(b, {'pose_position' : [11.0, 2.0, 3.0]})
+        self.assertEqual(self._ids(self._woic.search_radius('/map', [1.0, 2.0, 3.0], 0.5, tags)),
+                         [a])
+        self.assertEqual(self._ids(self._woic.search_box('/map', [10.0, 0.0, 0.0], 
+                                                         [12.0, 4.0, 4.0], tags)), [b])
+        found = self._woic.search_nearest('/map', [10.0, 2.0, 3.0], 1, tags)
+        self.assertEqual([e['instance_id'] for e in found], [b])
+        self.assertEqual(self._woic.search_radius('/odom', [1.0, 2.0, 3.0], 0.5, tags), [])
+
+    def test_expiry(self):
+        '''
+        Instances expire once their expected_ttl has passed and can still be found in the history.
+        '''
+        tags = self._tags('robot')
+        old = self._woic.insert(self._instance(tags, 1, 10.0))
+        live = self._woic.insert(self._instance(tags, 60))
+        expired = self._woic.expire_entities()
+        self.assertTrue(old in expired)
+        self.assertFalse(live in expired)
+        self.assertEqual(self._ids(self._woic.search_tags(tags)), [live])
+        self.assertEqual(self._ids(self._woic.search_tags(tags, history=True)), [old, live])
+        self.assertTrue(self._woic.search_instance_ids([old])[old]['perceived_end'] is not None)
+
+    def test_descriptors(self):
+        '''
+        Descriptions and the data of their descriptors are read back and found by their hash.
+        '''
+        tags = self._tags('map')
+        description_id = self._wodc.insert({'name' : 'map', 'tags' : tags})
+        data = 'some data ' + tags[0]
+        descriptor_id = self._dc.insert({'description_id' : description_id, 'type' : 'test', 
+                                         'data' : data, 'encoding' : 'json', 'tags' : []})
+        found = self._dc.search_by_description_id(description_id, True)
+        self.assertEqual([d['descriptor_id'] for d in found], [descriptor_id])
+        self.assertEqual(found[0]['data'], data)
+        self.assertEqual(self._dc.read_data(descriptor_id, 5), (data[5:], len(data)))
+        found = self._dc.search_hash(descriptor_hash('test', data, 'json'))
+        self.assertEqual([d['descriptor_id'] for d in found], [descriptor_id])
+        self.assertEqual(self._wodc.search_description_ids([description_id]).keys(), 
+                         [description_id])
+        self.assertEqual([e['description_id'] for e in self._wodc.search_tags(tags)], 
+                         [description_id])
+
+class TestEmbeddedStorage(StorageBehavior, unittest.TestCase):
+    '''
+    The shared tests run against the embedded store (in memory).
+    '''
+
+    def setUp(self):
+        '''
+        Create an in-memory store and its connections.
+        '''
+        self._store = EmbeddedStore()
+        self._woic = EmbeddedWorldObjectInstanceConnection(self._store)
+        self._wodc = EmbeddedWorldObjectDescriptionConnection(self._store)
+        self._dc = EmbeddedDescriptorConnection(self._store)
+        self._mtc = EmbeddedMapTileConnection(self._store)
+
+    def tearDown(self):
+        '''
+        Close the store.
+        '''
+        self._store.close()
+
+@unittest.skipUnless(_HOST, 'WORLD_MODEL_TEST_HOST is not set')
+class TestPostgresStorage(StorageBehavior, unittest.TestCase):
+    '''
+    The shared tests run against the PostgreSQL test database.
+    '''
+
+    def setUp(self):
+        '''
+        Connect to the test database.
+        '''
+        from worldlib.connection_pool import ConnectionPool
+        from worldlib.world_object_instance_connection import WorldObjectInstanceConnection
+        from worldlib.world_object_description_connection import WorldObjectDescriptionConnection
+        from worldlib.descriptor_connection import DescriptorConnection
+        from worldlib.map_tile_connection import MapTileConnection
+        self._pool = ConnectionPool(os.environ.get('WORLD_MODEL_TEST_USER'), 
+                                    os.environ.get('WORLD_MODEL_TEST_PASSWORD'), _HOST, 
+                                    database=os.environ.get('WORLD_MODEL_TEST_DATABASE', 
+                                                            'world_model_test'))
+        self._woic = WorldObjectInstanceConnection(pool=self._pool)
+        self._wodc = WorldObjectDescriptionConnection(pool=self._pool)
+        self._dc = DescriptorConnection(pool=self._pool)
+        self._mtc = MapTileConnection(pool=self._pool)
+
+    def tearDown(self):
+        '''
+        Close the connections to the test database.
+        '''
+        self._pool.reset()
+
+if __name__ == '__main__':
+    unittest.main()
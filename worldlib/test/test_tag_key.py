@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2013, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+# * Neither the name of Willow Garage, Inc. nor the names of its
+# contributors may be used to endorse or promote products derived
+# from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+
+'''
+Tests for the tag_key module. The keys of existing instances (set by setup_world_model) and of new
+instances (set by the connections) must be the same for the same set of tags.
+
+@author:  Russell Toris
+@version: May 16, 2013
+'''
+
+import unittest
+from worldlib.tag_key import tag_key
+from worldlib.embedded_store import EmbeddedStore, EmbeddedWorldObjectInstanceConnection
+
+class TestTagKey(unittest.TestCase):
+    '''
+    Tests for the tag_key function.
+    '''
+
+    def test_order_and_duplicates(self):
+        '''
+        The order of the tags and any duplicates are ignored.
+        '''
+        self.assertEqual(tag_key(['robot', 'pr2']), '["pr2","robot"]')
+        self.assertEqual(tag_key(['pr2', 'robot', 'pr2']), tag_key(['robot', 'pr2']))
+        self.assertEqual(tag_key([]), '[]')
+
+    def test_escaping(self):
+        '''
+        Quotes, backslashes, and non-ASCII characters are escaped as JSON.
+        '''
+        self.assertEqual(tag_key(['a"b', 'c\\d']), '["a\\"b","c\\\\d"]')
+        self.assertEqual(tag_key([u'café']), '["caf\\u00e9"]')
+
+    def test_unicode(self):
+        '''
+        UTF-8 and unicode strings give the same key and are sorted by code point.
+        '''
+        tags = [u'été', u'zebra', u'世界', u'Zoo']
+        self.assertEqual(tag_key([t.encode('utf-8') for t in tags]), tag_key(tags))
+        self.assertEqual(tag_key([tags[0].encode('utf-8'), tags[1]]), tag_key(tags[:2]))
+        self.assertEqual(tag_key(tags), '["Zoo","zebra","\\u00e9t\\u00e9","\\u4e16\\u754c"]')
+
+    def test_connection(self):
+        '''
+        The connections use the same key.
+        '''
+        woic = EmbeddedWorldObjectInstanceConnection(EmbeddedStore())
+        self.assertEqual(woic.tag_key(['robot', 'pr2', 'robot']), tag_key(['pr2', 'robot']))
+
+if __name__ == '__main__':
+    unittest.main()
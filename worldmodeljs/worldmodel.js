@@ -34,6 +34,16 @@ var WorldModel = function(options) {
     serverName : '/world_model/update_world_object_instance',
     actionName : 'worldlib/UpdateWorldObjectInstanceAction'
   });
+  var gwois = new ActionClient({
+    ros : worldModel.ros,
+    serverName : '/world_model/get_world_object_instances',
+    actionName : 'worldlib/GetWorldObjectInstancesAction'
+  });
+  var swmc = new ActionClient({
+    ros : worldModel.ros,
+    serverName : '/world_model/subscribe_world_model_changes',
+    actionName : 'worldlib/SubscribeWorldModelChangesAction'
+  });
   var woits = new ActionClient({
     ros : worldModel.ros,
     serverName : '/world_model/world_object_instance_tag_search',
@@ -49,6 +59,11 @@ var WorldModel = function(options) {
     serverName : '/world_model/get_world_object_description',
     actionName : 'worldlib/GetWorldObjectDescriptionAction'
   });
+  var gmr = new ActionClient({
+    ros : worldModel.ros,
+    serverName : '/world_model/get_map_region',
+    actionName : 'worldlib/GetMapRegionAction'
+  });
 
   // insert a new instance into the world model
   worldModel.createWorldObjectInstance = function(instance, callback) {
@@ -65,10 +80,11 @@ var WorldModel = function(options) {
   };
 
   // search for all instances with the given array of tags
-  worldModel.worldObjectInstanceTagSearch = function(tags, callback) {
-    // create the search goal
+  worldModel.worldObjectInstanceTagSearch = function(tags, callback, fields) {
+    // create the search goal (only the given fields of each instance are returned, if any)
     var goal = new woits.Goal({
-      tags : tags
+      tags : tags,
+      fields : fields || []
     });
     // define the callback
     goal.on('result', function(result) {
@@ -78,11 +94,51 @@ var WorldModel = function(options) {
     goal.send();
   };
 
+  // get the instances with the given array of IDs (missing instances are not returned)
+  worldModel.getWorldObjectInstances = function(instanceIds, callback) {
+    // create the search goal
+    var goal = new gwois.Goal({
+      instance_ids : instanceIds
+    });
+    // define the callback
+    goal.on('result', function(result) {
+      var instances = [];
+      for ( var i = 0; i < result.instances.length; i++) {
+        if (result.exists[i]) {
+          instances.push(result.instances[i]);
+        }
+      }
+      callback(instances);
+    });
+    // send the search
+    goal.send();
+  };
+
+  // call the callback with each change to the instances with the given array of tags
+  worldModel.subscribeWorldObjectInstanceChanges = function(tags, callback) {
+    // request a filtered change topic
+    var goal = new swmc.Goal({
+      tags : tags,
+      tables : [ 'world_object_instances' ]
+    });
+    // define the callback
+    goal.on('result', function(result) {
+      var topic = new worldModel.ros.Topic({
+        name : result.topic,
+        messageType : 'world_msgs/WorldModelChange'
+      });
+      topic.subscribe(callback);
+    });
+    // send the request
+    goal.send();
+  };
+
   // get the WorldObjectDescription associated with the given ID
   worldModel.getWorldObjectDescription = function(descriptionId, callback) {
     // create the search goal
     var goal = new gwod.Goal({
-      description_id : descriptionId
+      description_id : descriptionId,
+      load_data : true
     });
     // define the callback
     goal.on('result', function(result) {
@@ -92,6 +148,32 @@ var WorldModel = function(options) {
     goal.send();
   };
   
+  // get the given region ({minX, minY, maxX, maxY} in meters, or null for the whole map) of the
+  // tiled map with the given description ID as an OccupancyGrid at the given pyramid level
+  worldModel.getMapRegion = function(descriptionId, region, level, callback) {
+    region = region || {
+      minX : 0,
+      minY : 0,
+      maxX : 0,
+      maxY : 0
+    };
+    // create the request goal
+    var goal = new gmr.Goal({
+      description_id : descriptionId,
+      min_x : region.minX,
+      min_y : region.minY,
+      max_x : region.maxX,
+      max_y : region.maxY,
+      level : level
+    });
+    // define the callback
+    goal.on('result', function(result) {
+      callback(result.exists ? result.map : null, result.levels);
+    });
+    // send the request
+    goal.send();
+  };
+
   //insert a new description into the world model
   worldModel.createWorldObjectDescription = function(description, callback) {
     // create the insertion goal
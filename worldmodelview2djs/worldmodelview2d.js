@@ -320,6 +320,13 @@ var WorldModelView2D = function(options) {
   // set an initial loading message
   initCanvas();
 
+  // the pyramid level of tiled maps to draw (each level halves the resolution)
+  var mapLevel = options.mapLevel || 0;
+
+  // the fields of the instances that are drawn
+  var poseFields = [ 'name', 'pose.pose.pose' ];
+  var polygonFields = [ 'description_id' ];
+
   // attempt to get the map
   document.body.style.cursor = 'wait';
   view2D.worldModel
@@ -339,10 +346,19 @@ var WorldModelView2D = function(options) {
               // get the description
               view2D.worldModel.getWorldObjectDescription(
                   instances[0].description_id, function(description) {
-                    // search for the OccupancyGrid
+                    // search for the OccupancyGrid or the tiled map
                     for ( var i = 0; i < description.descriptors.length; i++) {
                       var d = description.descriptors[i];
-                      if (d.type === 'nav_msgs/OccupancyGrid') {
+                      if (d.type === 'world_model/MapTiles') {
+                        // get the whole map at the configured pyramid level
+                        view2D.worldModel.getMapRegion(description.description_id, null,
+                            mapLevel, function(message) {
+                              if (message) {
+                                setMapFromMessage(message);
+                              }
+                              document.body.style.cursor = 'default';
+                            });
+                      } else if (d.type === 'nav_msgs/OccupancyGrid') {
                         // parse out the data and extract the data
                         var message = JSON.parse(d.data.replace(/'/g, '"'));
                         setMapFromMessage(message);
@@ -351,109 +367,104 @@ var WorldModelView2D = function(options) {
                     }
                   });
             }
-          });
-
-  // get the world model every second
-  setInterval(
-      function() {
-        // search for all 'robot' tags
-        view2D.worldModel
-            .worldObjectInstanceTagSearch(
-                [ 'robot' ],
-                function(instances) {
-                  // search all the instances
-                  for ( var i = 0; i < instances.length; i++) {
-                    // check if we are updating or adding a new robot location
-                    var found = false;
-                    for ( var j = 0; j < robots.length; j++) {
-                      if (robots[j].instance_id === instances[i].instance_id) {
-                        // update the old one
-                        found = true;
-                        robots[j] = instances[i];
-                        j = robots.length;
-                      }
-                    }
-                    // add the new one
-                    if (!found) {
-                      robots.push(instances[i]);
-                    }
-                  }
-
-                  // search for all 'poi' tags
-                  view2D.worldModel
-                      .worldObjectInstanceTagSearch(
-                          [ 'poi' ],
-                          function(instances) {
-                            // search all the instances
-                            for ( var i = 0; i < instances.length; i++) {
-                              // check if we are updating or adding a new poi
-                              // location
-                              var found = false;
-                              for ( var j = 0; j < poi.length; j++) {
-                                if (poi[j].instance_id === instances[i].instance_id) {
-                                  // update the old one
-                                  found = true;
-                                  poi[j] = instances[i];
-                                  j = poi.length;
-                                }
-                              }
-                              // add the new one
-                              if (!found) {
-                                poi.push(instances[i]);
-                              }
-                              // emit the new points
-                              view2D.emit('poi', poi);
-                            }
-                          });
-
-                  // search for all 'polygon' tags
-                  view2D.worldModel
-                      .worldObjectInstanceTagSearch(
-                          [ 'polygon' ],
-                          function(instances) {
-                            // search all the instances
-                            for ( var i = 0; i < instances.length; i++) {
-                              // get the description
-                              view2D.worldModel
-                                  .getWorldObjectDescription(
-                                      instances[i].description_id,
-                                      function(description) {
-                                        // search for the Polygon
-                                        for ( var i = 0; i < description.descriptors.length; i++) {
-                                          var d = description.descriptors[i];
-                                          if (d.type === 'geometry_msgs/Polygon') {
-                                            // check if we are updating or
-                                            // adding a new polygon
-                                            var found = false;
-                                            for ( var j = 0; j < polygon.length; j++) {
-                                              if (polygon[j].description_id === description.description_id) {
-                                                // update the old one
-                                                found = true;
-                                                var data = JSON.parse(d.data
-                                                    .replace(/'/g, '"'));
-                                                data.description_id = description.description_id;
-                                                data.name = description.name;
-                                                polygon[j] = data;
-                                                j = polygon.length;
-                                              }
-                                            }
-                                            // add the new one
-                                            if (!found) {
-                                              var data = JSON.parse(d.data
-                                                  .replace(/'/g, '"'));
-                                              data.description_id = description.description_id;
-                                              data.name = description.name;
-                                              polygon.push(data);
-                                            }
-                                          }
-                                        }
-                                      });
-                            }
-                            // emit the new polygons
-                            view2D.emit('polygon', polygon);
-                          });
-                });
-      }, 500);
+          }, [ 'description_id' ]);
+
+  // add or replace the instance in the given list (matched by instance_id)
+  var updateInstance = function(list, instance) {
+    for ( var i = 0; i < list.length; i++) {
+      if (list[i].instance_id === instance.instance_id) {
+        list[i] = instance;
+        return;
+      }
+    }
+    list.push(instance);
+  };
+
+  // remove the instance with the given instance_id from the given list
+  var removeInstance = function(list, instanceId) {
+    for ( var i = 0; i < list.length; i++) {
+      if (list[i].instance_id === instanceId) {
+        list.splice(i, 1);
+        return;
+      }
+    }
+  };
+
+  // check if the given change removes the instance from the world model
+  var isRemoval = function(change) {
+    return change.operation === 'expire' || change.operation === 'delete';
+  };
+
+  // add or replace the polygon described by the given instance
+  var updatePolygon = function(instance) {
+    // get the description
+    view2D.worldModel.getWorldObjectDescription(instance.description_id,
+        function(description) {
+          // search for the Polygon
+          for ( var i = 0; i < description.descriptors.length; i++) {
+            var d = description.descriptors[i];
+            if (d.type === 'geometry_msgs/Polygon') {
+              var data = JSON.parse(d.data.replace(/'/g, '"'));
+              data.instance_id = instance.instance_id;
+              data.description_id = description.description_id;
+              data.name = description.name;
+              updateInstance(polygon, data);
+            }
+          }
+          // emit the new polygons
+          view2D.emit('polygon', polygon);
+        });
+  };
+
+  // listen for changes to the robots
+  view2D.worldModel.subscribeWorldObjectInstanceChanges([ 'robot' ], function(change) {
+    if (isRemoval(change)) {
+      removeInstance(robots, change.id);
+    } else {
+      updateInstance(robots, change.instance);
+    }
+  });
+
+  // listen for changes to the pois
+  view2D.worldModel.subscribeWorldObjectInstanceChanges([ 'poi' ], function(change) {
+    if (isRemoval(change)) {
+      removeInstance(poi, change.id);
+    } else {
+      updateInstance(poi, change.instance);
+    }
+    // emit the new points
+    view2D.emit('poi', poi);
+  });
+
+  // listen for changes to the polygons
+  view2D.worldModel.subscribeWorldObjectInstanceChanges([ 'polygon' ], function(change) {
+    if (isRemoval(change)) {
+      removeInstance(polygon, change.id);
+      // emit the new polygons
+      view2D.emit('polygon', polygon);
+    } else {
+      updatePolygon(change.instance);
+    }
+  });
+
+  // get the existing robots, pois, and polygons once (changes are received afterwards)
+  view2D.worldModel.worldObjectInstanceTagSearch([ 'robot' ], function(instances) {
+    for ( var i = 0; i < instances.length; i++) {
+      updateInstance(robots, instances[i]);
+    }
+  }, poseFields);
+  view2D.worldModel.worldObjectInstanceTagSearch([ 'poi' ], function(instances) {
+    for ( var i = 0; i < instances.length; i++) {
+      updateInstance(poi, instances[i]);
+    }
+    // emit the new points
+    view2D.emit('poi', poi);
+  }, poseFields);
+  view2D.worldModel.worldObjectInstanceTagSearch([ 'polygon' ], function(instances) {
+    for ( var i = 0; i < instances.length; i++) {
+      updatePolygon(instances[i]);
+    }
+  }, polygonFields);
 
   // set the interval for the draw function
   setInterval(draw, 30);